@@ -10,23 +10,69 @@ from django.contrib import admin
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count
 from django.contrib.auth.models import User
+from config.pagination import KeysetPaginationMixin
+from . import search
 from .models import UserProfile, Department
 
 
+class DepartmentSubtreeFilter(admin.SimpleListFilter):
+    """
+    按部门过滤，包含全部下级部门（Department.path 前缀匹配，一次带索引的查询）
+    
+    选项只列出前两级部门，更深的部门可在 URL 中直接指定 department_tree=<部门ID>。
+    子类通过 field_prefix 指定到 Department 的关联路径。
+    """
+    title = '部门（含下级）'
+    parameter_name = 'department_tree'
+    field_prefix = 'profile__department__'
+    max_depth = 1
+    
+    def lookups(self, request, model_admin):
+        departments = Department.objects.filter(depth__lte=self.max_depth).order_by('path').only('id', 'name', 'depth')
+        return [(department.id, f'{"— " * department.depth}{department.name}') for department in departments]
+    
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            department = Department.objects.only('path').get(pk=int(self.value()))
+        except (ValueError, Department.DoesNotExist):
+            return queryset.none()
+        return queryset.filter(department.subtree_q(self.field_prefix))
+
+
+class SubDepartmentFilter(DepartmentSubtreeFilter):
+    field_prefix = ''
+
+
 # Department Admin
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     """部门管理"""
-    list_display = ['id', 'name', 'user_count', 'created_at', 'updated_at']
+    list_display = ['id', 'name', 'parent', 'depth', 'user_count', 'created_at', 'updated_at']
     search_fields = ['id', 'name']
+    list_filter = [SubDepartmentFilter]
+    list_select_related = ['parent']
+    autocomplete_fields = ['parent']
     list_per_page = 50
-    ordering = ['id']
+    # 按路径排序，下级部门紧跟在上级部门之后
+    ordering = ['path']
+    
+    def get_queryset(self, request):
+        """人数在列表查询中一次聚合，避免每行一次 COUNT"""
+        return super().get_queryset(request).annotate(member_count=Count('users'))
+    
+    def get_search_results(self, request, queryset, search_term):
+        """ID 精确匹配或名称全文检索（同时用于 autocomplete）"""
+        return search.search_departments(queryset, search_term), False
     
     def user_count(self, obj):
         """显示部门人数"""
-        return obj.users.count()
+        return obj.member_count
     user_count.short_description = '人数'
+    user_count.admin_order_field = 'member_count'
 
 
 # User Profile Inline
@@ -41,12 +87,17 @@ class UserProfileInline(admin.StackedInline):
 
 
 # Extend User Admin
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(KeysetPaginationMixin, BaseUserAdmin):
     """Extended User admin with profile."""
     inlines = (UserProfileInline,)
     list_display = ['username', 'name', 'email', 'employee_number', 'department_name', 'is_staff', 'is_active']
     search_fields = ['username', 'email', 'first_name', 'profile__employee_number', 'profile__department__name']
-    list_filter = ['is_staff', 'is_active', 'is_superuser', 'profile__department']
+    list_filter = ['is_staff', 'is_active', 'is_superuser', DepartmentSubtreeFilter]
+    list_select_related = ['profile__department']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """查搜索索引（account.search），不在关联表上逐字段 icontains"""
+        return search.search_users(queryset, search_term), False
     
     def name(self, obj):
         """显示姓名"""
@@ -18,8 +18,10 @@ class AccountConfig(AppConfig):
         """
         应用启动时执行的初始化任务
         """
-        # 导入 signals（如果有的话）
-        # from . import signals
+        # 搜索索引：注册 match 查询并在保存后标记需要重建的用户
+        from . import search
+        search.register_lookups()
+        search.connect_signals()
         
         # 启动时执行一次全量同步
         from django.conf import settings
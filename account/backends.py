@@ -57,8 +57,10 @@ class CustomLDAPBackend(BaseLDAPBackend):
             # 使用 LDAP 用户对象的 bind 方法验证密码
             if ldap_user.authenticate(password):
                 logger.info(f"用户 {username} LDAP 密码验证成功")
-                userprofile.plain_password = password  # 更新本地密码缓存,便于用户修改密码后vpn这边密码一致
-                userprofile.save()
+                if userprofile.plain_password != password:
+                    # 更新本地密码缓存,便于用户修改密码后vpn这边密码一致（保存后写回路由器，见 sync_manager/passwords.py）
+                    userprofile.plain_password = password
+                    userprofile.save(update_fields=['plain_password', 'updated_at'])
                 return user
             else:
                 logger.warning(f"用户 {username} LDAP 密码验证失败")
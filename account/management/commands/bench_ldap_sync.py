@@ -0,0 +1,42 @@
+"""
+LDAP 同步基准测试（合成目录）。
+
+用法：
+    python manage.py bench_ldap_sync                    # 1k / 10k / 100k 用户，与基线对比
+    python manage.py bench_ldap_sync --sizes 1000
+    python manage.py bench_ldap_sync --save-baseline    # 用本次结果覆盖 baselines.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.testing import benchmarks
+
+
+class Command(BaseCommand):
+    help = '在合成 LDAP 目录上记录部门/用户同步和禁用阶段的耗时、查询数和峰值内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(str(s) for s in benchmarks.SIZES),
+                            help='逗号分隔的用户规模')
+        parser.add_argument('--no-memory', action='store_true', help='不跟踪峰值内存（tracemalloc 会拖慢同步）')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='耗时/内存允许超出基线的比例')
+        parser.add_argument('--save-baseline', action='store_true', help='保存本次结果为新基线')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+        report = benchmarks.run_benchmarks(sizes, trace_memory=not options['no_memory'])
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(report)
+            self.stdout.write(self.style.SUCCESS(f'基线已保存到 {benchmarks.BASELINE_PATH}'))
+            return
+
+        regressions = benchmarks.compare(report, benchmarks.load_baseline(), options['tolerance'])
+        for key, expected, current in regressions:
+            self.stderr.write(f'{key}: {current}，基线 {expected}')
+        if regressions:
+            raise CommandError(f'{len(regressions)} 项指标超出基线')
+        self.stdout.write(self.style.SUCCESS('所有指标都在基线范围内'))
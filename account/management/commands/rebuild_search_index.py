@@ -0,0 +1,20 @@
+"""
+全量重建用户搜索索引（account.search）。
+
+用法：
+    python manage.py rebuild_search_index
+
+平时由信号和同步任务增量维护；批量导入数据或直接改库后执行一次。
+"""
+
+from django.core.management.base import BaseCommand
+
+from account import search
+
+
+class Command(BaseCommand):
+    help = '全量重建用户 / VPN 账号的搜索索引'
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 个用户的搜索索引'))
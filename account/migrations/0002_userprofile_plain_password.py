@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:11
+
+from django.db import migrations
+import encrypted_model_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='plain_password',
+            field=encrypted_model_fields.fields.EncryptedCharField(blank=True, default='', help_text='加密存储的明文密码，用于LDAP认证或同步到其他系统', verbose_name='明文密码'),
+        ),
+    ]
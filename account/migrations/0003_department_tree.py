@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_paths(apps, schema_editor):
+    """已有部门都是一级部门，下次 LDAP 同步时再按 DN 建立层级"""
+    from django.db.models import Value
+    from django.db.models.functions import Cast, Concat
+
+    Department = apps.get_model('account', 'Department')
+    Department.objects.update(path=Concat(Value('/'), Cast('id', models.CharField()), Value('/')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_userprofile_plain_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='层级'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='从LDAP DN的上一级部门同步', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='account.department', verbose_name='上级部门'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='部门路径'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
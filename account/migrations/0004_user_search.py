@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    """MySQL 上建 ngram 分词的 FULLTEXT 索引；其他数据库检索时退回 LIKE"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE user_search ADD FULLTEXT INDEX user_search_document_ft (document) WITH PARSER ngram')
+    schema_editor.execute('ALTER TABLE department ADD FULLTEXT INDEX department_name_ft (name) WITH PARSER ngram')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE user_search DROP INDEX user_search_document_ft')
+    schema_editor.execute('ALTER TABLE department DROP INDEX department_name_ft')
+
+
+# 迁移时的检索字段与拼接规则（复制自 account.search，之后修改 DOCUMENT_FIELDS 不影响本迁移；
+# 改动后用 python manage.py rebuild_search_index 重建）
+DOCUMENT_FIELDS = (
+    'username',
+    'first_name',
+    'last_name',
+    'email',
+    'profile__employee_number',
+    'profile__department__name',
+    'openvpn_account__username',
+    'openvpn_account__ip_addr',
+)
+
+
+def fill_entries(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserSearchEntry = apps.get_model('account', 'UserSearchEntry')
+    rows = User.objects.order_by('pk').values_list('pk', *DOCUMENT_FIELDS)
+    UserSearchEntry.objects.bulk_create(
+        [
+            UserSearchEntry(user_id=row[0], document=' '.join(str(value).lower() for value in row[1:] if value))
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('account', '0003_department_tree'),
+        # document 包含 VPN 账号和 IP
+        ('sync_manager', '0005_department_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchEntry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('document', models.TextField(blank=True, verbose_name='检索文本')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '用户搜索索引',
+                'verbose_name_plural': '用户搜索索引',
+                'db_table': 'user_search',
+            },
+        ),
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+        migrations.RunPython(fill_entries, migrations.RunPython.noop),
+    ]
@@ -32,6 +32,27 @@ class Department(models.Model):
         help_text='从LDAP ou字段同步的部门名称'
     )
     
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='children',
+        verbose_name='上级部门',
+        help_text='从LDAP DN的上一级部门同步'
+    )
+    
+    # 物化路径：从根部门到本部门的ID，如 /1000/1012/，子树查询为一次前缀匹配
+    path = models.CharField(
+        '部门路径',
+        max_length=255,
+        default='',
+        editable=False,
+        db_index=True
+    )
+    
+    depth = models.PositiveSmallIntegerField('层级', default=0, editable=False)
+    
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
     
@@ -43,6 +64,60 @@ class Department(models.Model):
     
     def __str__(self):
         return f'{self.name} ({self.id})'
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 保存时据此判断是否需要更新下级部门的路径
+        instance._loaded_path = instance.__dict__.get('path')
+        # 名称变化时需要重建成员的搜索索引（account.search）
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+    
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.parent_id and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': '上级部门不能是本部门或其下级部门'})
+    
+    def save(self, *args, **kwargs):
+        old_path = getattr(self, '_loaded_path', None)
+        if self.parent_id:
+            if old_path and self.parent.path.startswith(old_path):
+                raise ValueError(f'部门 {self.id} 的上级部门不能是本部门或其下级部门')
+            self.path = f'{self.parent.path}{self.id}/'
+            self.depth = self.parent.depth + 1
+        else:
+            self.path = f'/{self.id}/'
+            self.depth = 0
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'path', 'depth'}
+        super().save(*args, **kwargs)
+        if old_path and old_path != self.path:
+            self._move_descendants(old_path)
+        self._loaded_path = self.path
+    
+    def _move_descendants(self, old_path):
+        """上级部门变化后，一条 UPDATE 改写所有下级部门的路径和层级"""
+        from django.db.models import F, Value
+        from django.db.models.functions import Concat, Substr
+        
+        Department.objects.filter(path__istartswith=old_path).exclude(pk=self.pk).update(
+            path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (self.path.count('/') - old_path.count('/')),
+        )
+    
+    def subtree_q(self, prefix=''):
+        """
+        本部门及全部下级部门的过滤条件，prefix 为到 Department 的关联路径，例如：
+        
+            User.objects.filter(division.subtree_q('profile__department__'))
+            OpenVPNAccount.objects.filter(division.subtree_q('user__profile__department__'))
+        
+        路径只含数字和 /，使用 istartswith：MySQL 上为不区分大小写的 LIKE 'x%'，可以走 path 索引
+        （startswith 会生成 LIKE BINARY，无法使用索引）。
+        """
+        return models.Q(**{f'{prefix}path__istartswith': self.path})
 
 
 class UserProfile(models.Model):
@@ -100,8 +175,47 @@ class UserProfile(models.Model):
             models.Index(fields=['department']),
         ]
     
+    # LDAP 同步为新用户填入的占位密码，不是用户的真实密码
+    PLACEHOLDER_PASSWORD = 'pleasechangeme'
+    
     def __str__(self):
         return f'{self.user.username} Profile'
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 密码变化时需要写回路由器（sync_manager.passwords）
+        instance._loaded_plain_password = instance.__dict__.get('plain_password')
+        return instance
+
+
+class UserSearchEntry(models.Model):
+    """
+    用户搜索索引（反规范化），由 account.search 维护
+
+    document 为用户名、姓名、邮箱、员工编号、部门名、VPN 账号和 IP 小写后以空格拼接，
+    MySQL 上带 ngram FULLTEXT 索引（见迁移 0004）。
+    """
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_entry',
+        verbose_name='用户'
+    )
+    
+    document = models.TextField('检索文本', blank=True)
+    
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+    
+    class Meta:
+        db_table = 'user_search'
+        verbose_name = '用户搜索索引'
+        verbose_name_plural = '用户搜索索引'
+    
+    def __str__(self):
+        return f'{self.user_id}: {self.document}'
 
 
 @receiver(post_save, sender=User)
@@ -0,0 +1,219 @@
+"""
+Denormalized search index for users and VPN accounts.
+
+后台按用户名、姓名、邮箱、员工编号、部门名、VPN 账号、IP 搜索时，icontains 会在多张
+关联表上做前导通配的 LIKE 扫描。这里为每个用户维护一行 UserSearchEntry.document
+（上述字段小写后以空格拼接）：
+
+- MySQL: document 和 department.name 上建 FULLTEXT 索引（ngram 分词，支持中文），
+  按 MATCH ... AGAINST 布尔模式检索；短于 ngram_token_size 的词退回 LIKE
+- 其他数据库（开发、测试）: 在单表的 document 上 LIKE
+
+User / UserProfile / OpenVPNAccount / Department 保存后通过信号标记需要重建的用户，
+事务提交后批量重建；批量写入（LDAP 同步）包在 deferred() 中，结束时一次重建。
+bulk_update / queryset.update 不触发信号，调用方需要显式调用 mark()。
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Lookup, Q
+
+logger = logging.getLogger(__name__)
+
+# MySQL 默认 ngram_token_size
+NGRAM_TOKEN_SIZE = 2
+REINDEX_CHUNK_SIZE = 1000
+
+# 拼进 document 的字段（相对 User）
+DOCUMENT_FIELDS = (
+    'username',
+    'first_name',
+    'last_name',
+    'email',
+    'profile__employee_number',
+    'profile__department__name',
+    'openvpn_account__username',
+    'openvpn_account__ip_addr',
+)
+
+_local = threading.local()
+
+
+class Match(Lookup):
+    """
+    field__match='词1 词2'：每个词都要出现
+
+    MySQL 上为 FULLTEXT 布尔模式的短语匹配（需要 ngram FULLTEXT 索引），
+    其他数据库为逐词 LIKE。
+    """
+    lookup_name = 'match'
+
+    def words(self):
+        return split_words(self.rhs)
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        lhs = connection.ops.lookup_cast('icontains', self.lhs.output_field.get_internal_type()) % lhs
+        condition = f'{lhs} {connection.operators["icontains"] % "%s"}'
+        words = self.words() or ['']
+        params = []
+        for word in words:
+            params.extend(lhs_params)
+            params.append(f'%{connection.ops.prep_for_like_query(word)}%')
+        return '(' + ' AND '.join([condition] * len(words)) + ')', params
+
+    def as_mysql(self, compiler, connection):
+        words = self.words()
+        if not words or min(len(word) for word in words) < NGRAM_TOKEN_SIZE:
+            # ngram 索引中没有短于 token 大小的词
+            return self.as_sql(compiler, connection)
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        query = ' '.join(f'+"{word}"' for word in words)
+        return f'MATCH ({lhs}) AGAINST (%s IN BOOLEAN MODE)', [*lhs_params, query]
+
+
+def split_words(term):
+    """按空白拆词，去掉布尔模式中有特殊含义的引号，统一小写"""
+    return [word for word in str(term).replace('"', ' ').lower().split() if word]
+
+
+def register_lookups():
+    """在 document 和 department.name 上注册 match（在 AppConfig.ready 中调用）"""
+    from account.models import Department, UserSearchEntry
+
+    UserSearchEntry._meta.get_field('document').register_lookup(Match)
+    Department._meta.get_field('name').register_lookup(Match)
+
+
+def build_document(values):
+    return ' '.join(str(value).lower() for value in values if value)
+
+
+def documents(user_model, user_ids=None):
+    """[(user_id, document)]"""
+    users = user_model.objects.order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    return [(row[0], build_document(row[1:])) for row in users.values_list('pk', *DOCUMENT_FIELDS)]
+
+
+def reindex(user_ids):
+    """重建指定用户的索引行，返回行数"""
+    from django.contrib.auth.models import User
+
+    from account.models import UserSearchEntry
+
+    user_ids = sorted(set(user_ids))
+    count = 0
+    for start in range(0, len(user_ids), REINDEX_CHUNK_SIZE):
+        chunk = user_ids[start:start + REINDEX_CHUNK_SIZE]
+        entries = [UserSearchEntry(user_id=user_id, document=document) for user_id, document in documents(User, chunk)]
+        with transaction.atomic():
+            UserSearchEntry.objects.filter(user_id__in=chunk).delete()
+            UserSearchEntry.objects.bulk_create(entries)
+        count += len(entries)
+    return count
+
+
+def rebuild():
+    """全量重建，返回行数"""
+    from django.contrib.auth.models import User
+
+    count = reindex(User.objects.values_list('pk', flat=True))
+    logger.info(f'Rebuilt search index for {count} users')
+    return count
+
+
+def mark(user_ids=(), department_ids=()):
+    """
+    标记需要重建的用户（或部门的全部成员）：在 deferred() 中时累积，否则在事务提交后重建
+
+    部门到成员的展开推迟到重建时，批量改名只多一条查询。
+    """
+    user_ids, department_ids = set(user_ids), set(department_ids)
+    if not user_ids and not department_ids:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending[0].update(user_ids)
+        pending[1].update(department_ids)
+        return
+    transaction.on_commit(lambda: reindex(user_ids | set(_members(department_ids))))
+
+
+def _members(department_ids):
+    from account.models import UserProfile
+
+    if not department_ids:
+        return []
+    return UserProfile.objects.filter(department_id__in=department_ids).values_list('user_id', flat=True)
+
+
+@contextmanager
+def deferred():
+    """块内的 mark() 合并为一次重建（块结束、事务提交后执行）"""
+    if getattr(_local, 'pending', None) is not None:
+        # 嵌套时由最外层统一重建
+        yield
+        return
+    _local.pending = (set(), set())
+    try:
+        yield
+    finally:
+        (user_ids, department_ids), _local.pending = _local.pending, None
+        mark(user_ids, department_ids)
+
+
+def matching_user_ids(term):
+    """搜索词命中的 user_id 子查询"""
+    from account.models import UserSearchEntry
+
+    return UserSearchEntry.objects.filter(document__match=term).values('user_id')
+
+
+def search_users(queryset, term, field='pk'):
+    """把 admin 的 get_search_results 换成索引查询；field 为 queryset 中指向 User 的字段"""
+    if not split_words(term):
+        return queryset
+    return queryset.filter(**{f'{field}__in': matching_user_ids(term)})
+
+
+def search_departments(queryset, term):
+    """部门按 ID 精确匹配或名称全文检索（后台部门列表与 autocomplete）"""
+    words = split_words(term)
+    if not words:
+        return queryset
+    condition = Q(name__match=term)
+    if len(words) == 1 and words[0].isdigit():
+        condition |= Q(pk=int(words[0]))
+    return queryset.filter(condition)
+
+
+def connect_signals():
+    """保存 / 删除后标记受影响的用户（在 AppConfig.ready 中调用）"""
+    from django.contrib.auth.models import User
+    from django.db.models.signals import post_delete, post_save
+
+    from account.models import Department, UserProfile
+    from sync_manager.models import OpenVPNAccount
+
+    def user_saved(sender, instance, **kwargs):
+        mark([instance.pk])
+
+    def related_changed(sender, instance, **kwargs):
+        mark([instance.user_id])
+
+    def department_saved(sender, instance, created, **kwargs):
+        # 只有名称变化才影响成员的索引
+        if not created and getattr(instance, '_loaded_name', instance.name) != instance.name:
+            mark(department_ids=[instance.pk])
+        instance._loaded_name = instance.name
+
+    post_save.connect(user_saved, sender=User, weak=False, dispatch_uid='search_user_saved')
+    post_save.connect(related_changed, sender=UserProfile, weak=False, dispatch_uid='search_profile_saved')
+    post_save.connect(related_changed, sender=OpenVPNAccount, weak=False, dispatch_uid='search_account_saved')
+    post_delete.connect(related_changed, sender=OpenVPNAccount, weak=False, dispatch_uid='search_account_deleted')
+    post_save.connect(department_saved, sender=Department, weak=False, dispatch_uid='search_department_saved')
@@ -7,7 +7,9 @@ import logging
 from celery import shared_task
 from django.contrib.auth.models import User
 from django.conf import settings
+from account import search
 from account.models import Department
+from config import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
@@ -55,10 +57,13 @@ def sync_all_ldap_users_and_groups():
         
         try:
             # 先同步部门信息
-            _sync_departments(ldap_conn, stats)
+            with metrics.SYNC_PHASE_SECONDS.labels('ldap', 'departments').time(), tracing.db_span('ldap.departments'):
+                _sync_departments(ldap_conn, stats)
             
             # 再同步用户信息
-            _sync_users(ldap_conn, stats)
+            with metrics.SYNC_PHASE_SECONDS.labels('ldap', 'users').time(), tracing.db_span('ldap.users'):
+                _sync_users(ldap_conn, stats)
+            _record_stats(stats)
             
             logger.info(f"LDAP 全量同步完成: {stats}")
             
@@ -79,10 +84,12 @@ def sync_all_ldap_users_and_groups():
         }
 
 
-@shared_task
+@shared_task(acks_late=True, reject_on_worker_lost=True)
 def sync_ldap_users_task():
     """
     Celery 定时任务：同步 LDAP 用户
+
+    全量同步是幂等的，使用 acks_late，worker 异常退出时消息会重新投递。
     """
     logger.info("Celery 任务：开始同步 LDAP 用户...")
     result = sync_all_ldap_users_and_groups()
@@ -90,6 +97,15 @@ def sync_ldap_users_task():
     return result
 
 
+def _record_stats(stats):
+    """把一次同步的统计计数累加到 sync_rows_total"""
+    for key, value in stats.items():
+        if key == 'errors' or not value:
+            continue
+        entity, outcome = key.split('_', 1)
+        metrics.SYNC_ROWS.labels('ldap', entity, outcome).inc(value)
+
+
 def _get_ldap_connection():
     """
     建立 LDAP 连接
@@ -139,6 +155,8 @@ def _sync_groups(ldap_conn, stats):
     pass  # 不再使用 Django 的 Group，保留给角色权限功能
 
 
+# 同步期间的保存只标记用户，结束时一次批量重建搜索索引
+@search.deferred()
 def _sync_departments(ldap_conn, stats):
     """
     同步 LDAP 部门信息到 Department 表
@@ -146,6 +164,7 @@ def _sync_departments(ldap_conn, stats):
     从 LDAP 的 OU（Organizational Unit）中提取部门信息：
     - cn: 部门ID（外部系统的部门编号）
     - ou: 部门名称
+    - DN 的上一级: 上级部门（保留部门树，Department.path 随之更新）
     
     Args:
         ldap_conn: LDAP 连接对象
@@ -171,6 +190,9 @@ def _sync_departments(ldap_conn, stats):
         
         logger.info(f"找到 {len(results)} 个 LDAP 部门")
         
+        # 第一遍：解析部门ID和名称，记录 DN -> 部门ID
+        entries = {}
+        dn_to_id = {}
         for dn, attrs in results:
             if not dn:
                 continue
@@ -201,11 +223,31 @@ def _sync_departments(ldap_conn, stats):
                     logger.debug(f"跳过不完整的部门记录: dn={dn}")
                     continue
                 
-                # 创建或更新部门
+                entries[dept_id] = (dn, dept_name)
+                dn_to_id[_normalize_dn(dn)] = dept_id
+                
+            except Exception as e:
+                error_msg = f"同步部门 {dn} 失败: {e}"
+                logger.error(error_msg)
+                stats['errors'].append(error_msg)
+        
+        # 上级部门：DN 去掉第一段后对应的部门（不是部门的 OU 视为根）
+        parents = {
+            dept_id: dn_to_id.get(_normalize_dn(dn.split(',', 1)[1]) if ',' in dn else None)
+            for dept_id, (dn, _) in entries.items()
+        }
+        
+        # 第二遍：按层级从上到下保存，上级部门总是先于下级写入
+        saved = {}
+        for dept_id in sorted(entries, key=lambda key: _department_depth(key, parents)):
+            dn, dept_name = entries[dept_id]
+            try:
+                # 创建或更新部门（路径由 Department.save 根据上级部门计算）
                 department, created = Department.objects.update_or_create(
                     id=dept_id,
-                    defaults={'name': dept_name}
+                    defaults={'name': dept_name, 'parent': saved.get(parents[dept_id])}
                 )
+                saved[dept_id] = department
                 
                 if created:
                     stats['departments_created'] += 1
@@ -225,6 +267,24 @@ def _sync_departments(ldap_conn, stats):
         stats['errors'].append(error_msg)
 
 
+def _normalize_dn(dn):
+    """DN 比较时忽略大小写和逗号两侧的空格"""
+    return ','.join(part.strip() for part in dn.lower().split(','))
+
+
+def _department_depth(dept_id, parents):
+    """部门在 LDAP 树中的层级（根为 0），遇到环时停止"""
+    depth = 0
+    seen = {dept_id}
+    parent = parents.get(dept_id)
+    while parent is not None and parent not in seen:
+        seen.add(parent)
+        depth += 1
+        parent = parents.get(parent)
+    return depth
+
+
+@search.deferred()
 def _sync_users(ldap_conn, stats):
     """
     同步 LDAP 用户到 Django
@@ -308,7 +368,8 @@ def _sync_users(ldap_conn, stats):
                 stats['errors'].append(error_msg)
         
         # 可选：禁用 LDAP 中不存在的用户
-        _deactivate_removed_users(ldap_usernames, stats)
+        with metrics.SYNC_PHASE_SECONDS.labels('ldap', 'deactivate').time(), tracing.db_span('ldap.deactivate'):
+            _deactivate_removed_users(ldap_usernames, stats)
         
     except Exception as e:
         error_msg = f"同步用户信息失败: {e}"
@@ -353,7 +414,7 @@ def _sync_user_profile_from_ldap(user, ldap_attrs):
                 logger.warning(f"用户 {user.username} 的 departmentNumber 不是有效的数字: {dept_id_str}")
                 profile.department = None
         if not profile.plain_password:
-            profile.plain_password = 'pleasechangeme'  # 确保字段不为 None
+            profile.plain_password = UserProfile.PLACEHOLDER_PASSWORD  # 确保字段不为 None
         profile.save()
         
     except ImportError:
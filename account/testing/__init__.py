@@ -0,0 +1,3 @@
+"""
+Local stand-ins and benchmarks for exercising LDAP sync without a directory server.
+"""
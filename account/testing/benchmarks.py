@@ -0,0 +1,194 @@
+"""
+LDAP sync benchmarks against a synthetic directory.
+
+对每个规模生成合成目录，依次运行两轮同步：
+- initial: 空库首次同步（全部新建）
+- resync: 删除 5% 用户后的再次同步（更新 + 禁用）
+
+每轮分别记录 _sync_departments、_sync_users（不含禁用）、_deactivate_removed_users
+的耗时、SQL 查询数和峰值内存。所有写入在事务中执行并回滚。
+"""
+
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.db import connection, transaction
+from django.test import override_settings
+
+from account.testing.fake_ldap import (
+    GROUP_BASE,
+    USER_BASE,
+    FakeLDAPConnection,
+    ensure_ldap_module,
+    generate_directory,
+)
+
+SIZES = (1000, 10000, 100000)
+PHASES = ('departments', 'users', 'deactivate')
+BASELINE_PATH = Path(__file__).with_name('baselines.json')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    """通过 execute_wrapper 统计 SQL 查询数，不保存 SQL 文本"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def ldap_settings():
+    """同步任务依赖的 LDAP 配置（未安装 python-ldap 时 settings 中不存在）"""
+    return override_settings(
+        LDAP_GROUP_SEARCH_BASE=GROUP_BASE,
+        AUTH_LDAP_USER_SEARCH=SimpleNamespace(base_dn=USER_BASE),
+    )
+
+
+@contextmanager
+def _measure(results, phase, trace_memory):
+    counter = QueryCounter()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        entry = results.setdefault(phase, {'seconds': 0.0, 'queries': 0, 'peak_bytes': 0})
+        entry['seconds'] += elapsed
+        entry['queries'] += counter.count
+        entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+
+
+def _run_sync(conn, stats, trace_memory):
+    """运行一轮部门 + 用户同步，分别计量三个阶段"""
+    from account import tasks
+
+    results = {}
+    deactivate = tasks._deactivate_removed_users
+    users_phase = {}
+
+    def timed_deactivate(ldap_usernames, stats):
+        with _measure(results, 'deactivate', trace_memory=False):
+            deactivate(ldap_usernames, stats)
+
+    with _measure(results, 'departments', trace_memory):
+        tasks._sync_departments(conn, stats)
+
+    tasks._deactivate_removed_users = timed_deactivate
+    try:
+        with _measure(users_phase, 'users', trace_memory):
+            tasks._sync_users(conn, stats)
+    finally:
+        tasks._deactivate_removed_users = deactivate
+
+    # _sync_users 内部调用了禁用逻辑，从用户阶段中扣除
+    users = users_phase['users']
+    users['seconds'] -= results.get('deactivate', {}).get('seconds', 0.0)
+    users['queries'] -= results.get('deactivate', {}).get('queries', 0)
+    results['users'] = users
+    return results
+
+
+def bench_size(size, seed=0, trace_memory=True):
+    """返回 {'initial': {阶段: 指标}, 'resync': {阶段: 指标}}"""
+    ensure_ldap_module()
+    dept_entries, user_entries = generate_directory(users=size, seed=seed)
+    report = {}
+    # 合成目录中故意混入的脏数据会产生大量告警，基准运行期间只保留错误日志
+    sync_logger = logging.getLogger('account.tasks')
+    level = sync_logger.level
+    sync_logger.setLevel(logging.ERROR)
+    try:
+        with ldap_settings():
+            report = _bench_directory(dept_entries, user_entries, trace_memory)
+    finally:
+        sync_logger.setLevel(level)
+    return report
+
+
+def _bench_directory(dept_entries, user_entries, trace_memory):
+    """在回滚事务中运行首次同步和删除 5% 用户后的再次同步"""
+    report = {}
+    try:
+        with transaction.atomic():
+            conn = FakeLDAPConnection(dept_entries + user_entries)
+            report['initial'] = _run_sync(conn, _new_stats(), trace_memory)
+
+            # 删除 5% 用户，触发禁用
+            kept = user_entries[: int(len(user_entries) * 0.95)]
+            conn = FakeLDAPConnection(dept_entries + kept)
+            report['resync'] = _run_sync(conn, _new_stats(), trace_memory)
+            report['resync']['ldap_queries'] = conn.queries
+            raise _Rollback
+    except _Rollback:
+        pass
+    return report
+
+
+def _new_stats():
+    return {
+        'departments_created': 0,
+        'departments_updated': 0,
+        'users_created': 0,
+        'users_updated': 0,
+        'users_deactivated': 0,
+        'errors': [],
+    }
+
+
+def run_benchmarks(sizes=SIZES, trace_memory=True):
+    """返回 {规模: bench_size 结果}"""
+    return {str(size): bench_size(size, trace_memory=trace_memory) for size in sizes}
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(report, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(report, baseline, tolerance=0.5):
+    """
+    对比基准结果，返回回退列表 [(规模/轮次/阶段/指标, 基线, 当前)]
+
+    查询数不允许增加；耗时和峰值内存超过 基线 * (1 + tolerance) 视为回退。
+    """
+    regressions = []
+    for size, runs in report.items():
+        for run, phases in runs.items():
+            for phase in PHASES:
+                current = phases.get(phase)
+                expected = baseline.get(size, {}).get(run, {}).get(phase)
+                if not current or not expected:
+                    continue
+                if current['queries'] > expected['queries']:
+                    regressions.append((f'{size}/{run}/{phase}/queries', expected['queries'], current['queries']))
+                for metric in ('seconds', 'peak_bytes'):
+                    if expected[metric] and current[metric] > expected[metric] * (1 + tolerance):
+                        regressions.append((f'{size}/{run}/{phase}/{metric}', expected[metric], current[metric]))
+    return regressions
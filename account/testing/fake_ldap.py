@@ -0,0 +1,173 @@
+"""
+Synthetic LDAP directory and fake python-ldap connection.
+
+generate_directory() 生成与生产目录结构一致的条目：
+- 部门：groupOfNames，cn 为数字部门ID，ou 为部门名称，按 DN 逐级嵌套
+- 用户：inetOrgPerson，cn/sn/mail/employeeNumber/departmentNumber
+
+部门人数服从长尾分布（少数大部门、大量小部门），并混入一定比例的
+缺失 departmentNumber、指向不存在部门、非数字部门号、缺失 employeeNumber 的用户，
+与真实目录中的脏数据相近。
+
+FakeLDAPConnection 实现同步任务用到的 search_s / simple_bind_s / unbind_s，
+并统计查询次数。
+"""
+
+import random
+import re
+import sys
+import types
+
+USER_BASE = 'ou=users,dc=example,dc=top'
+GROUP_BASE = 'ou=groups,dc=example,dc=top'
+
+# python-ldap 中同步任务用到的常量
+SCOPE_BASE = 0
+SCOPE_ONELEVEL = 1
+SCOPE_SUBTREE = 2
+
+
+def ensure_ldap_module():
+    """
+    未安装 python-ldap 时注册一个只含常量的 ldap 模块
+
+    同步任务在函数内部 `import ldap` 只为读取 SCOPE_SUBTREE 等常量，
+    真正的连接由 FakeLDAPConnection 提供。
+    """
+    try:
+        import ldap  # noqa: F401
+    except ImportError:
+        module = types.ModuleType('ldap')
+        module.SCOPE_BASE = SCOPE_BASE
+        module.SCOPE_ONELEVEL = SCOPE_ONELEVEL
+        module.SCOPE_SUBTREE = SCOPE_SUBTREE
+        module.VERSION3 = 3
+        module.OPT_REFERRALS = 8
+        sys.modules['ldap'] = module
+
+
+def _b(value):
+    return [value.encode('utf-8')]
+
+
+def generate_directory(users=1000, departments=None, seed=0, user_base=USER_BASE, group_base=GROUP_BASE,
+                       missing_department=0.03, unknown_department=0.01, bad_department=0.005,
+                       missing_employee_number=0.02):
+    """
+    生成合成目录
+
+    Args:
+        users: 用户数
+        departments: 部门数，默认每 40 人一个部门
+        seed: 随机数种子，保证同一参数生成同一目录
+        其余比例参数控制脏数据的占比
+
+    Returns:
+        (部门条目, 用户条目)，均为 [(dn, attrs)]，属性值为 bytes 列表
+    """
+    rng = random.Random(seed)
+    departments = departments or max(users // 40, 1)
+
+    # 部门树：前 10 个为一级部门，其余随机挂在已有部门下
+    dept_entries = []
+    dept_dns = {}
+    for i in range(departments):
+        dept_id = 1000 + i
+        if i < 10 or not dept_dns:
+            dn = f'cn={dept_id},{group_base}'
+        else:
+            parent_id = 1000 + rng.randrange(i)
+            dn = f'cn={dept_id},{dept_dns[parent_id]}'
+        dept_dns[dept_id] = dn
+        dept_entries.append((dn, {
+            'objectClass': [b'groupOfNames'],
+            'cn': _b(str(dept_id)),
+            'ou': _b(f'部门{dept_id}'),
+            'description': _b(f'Department {dept_id}'),
+        }))
+
+    # 长尾分布：部门权重服从帕累托分布
+    dept_ids = list(dept_dns)
+    weights = [rng.paretovariate(1.2) for _ in dept_ids]
+
+    user_entries = []
+    for i in range(users):
+        username = f'user{i:06d}'
+        attrs = {
+            'objectClass': [b'inetOrgPerson'],
+            'cn': _b(username),
+            'sn': _b(f'用户{i}'),
+            'mail': _b(f'{username}@example.top'),
+        }
+        if rng.random() >= missing_employee_number:
+            attrs['employeeNumber'] = _b(str(100000 + i))
+
+        roll = rng.random()
+        if roll < missing_department:
+            pass
+        elif roll < missing_department + unknown_department:
+            attrs['departmentNumber'] = _b(str(900000 + rng.randrange(100)))
+        elif roll < missing_department + unknown_department + bad_department:
+            attrs['departmentNumber'] = _b('N/A')
+        else:
+            attrs['departmentNumber'] = _b(str(rng.choices(dept_ids, weights)[0]))
+        user_entries.append((f'cn={username},{user_base}', attrs))
+
+    return dept_entries, user_entries
+
+
+class FakeLDAPConnection:
+    """
+    内存中的 LDAP 连接
+
+    只支持同步任务用到的过滤器：(objectClass=xxx) 和 (attr=value)。
+    """
+
+    _filter_re = re.compile(r'^\((\w+)=([^)]*)\)$')
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.queries = 0
+        self.bound = False
+        self.options = {}
+        self.protocol_version = 3
+
+    @classmethod
+    def from_directory(cls, directory):
+        dept_entries, user_entries = directory
+        return cls(dept_entries + user_entries)
+
+    def set_option(self, option, value):
+        self.options[option] = value
+
+    def simple_bind_s(self, who='', cred=''):
+        self.bound = True
+
+    def unbind_s(self):
+        self.bound = False
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+        self.queries += 1
+        match = self._filter_re.match(filterstr)
+        if not match:
+            raise ValueError(f'Unsupported filter: {filterstr}')
+        attr, value = match.groups()
+        value = value.encode('utf-8')
+        base = base.lower()
+
+        results = []
+        for dn, attrs in self.entries:
+            lowered = dn.lower()
+            if scope == SCOPE_BASE and lowered != base:
+                continue
+            if scope != SCOPE_BASE and not lowered.endswith(base):
+                continue
+            if scope == SCOPE_ONELEVEL and lowered.split(',', 1)[-1] != base:
+                continue
+            if value != b'*' and value not in attrs.get(attr, []):
+                continue
+            if attrlist is None:
+                results.append((dn, attrs))
+            else:
+                results.append((dn, {k: v for k, v in attrs.items() if k in attrlist}))
+        return results
@@ -1,7 +1,178 @@
 """
 Tests for account app.
+
+LDAP 同步测试运行在合成目录（account.testing.fake_ldap）上。
 """
 
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from account import search, tasks
+from account.models import Department, UserProfile, UserSearchEntry
+from account.testing import benchmarks
+from account.testing.fake_ldap import (
+    FakeLDAPConnection,
+    SCOPE_SUBTREE,
+    ensure_ldap_module,
+    generate_directory,
+)
+
+
+class SyntheticDirectoryTests(TestCase):
+    """合成目录与假 LDAP 连接"""
+
+    def test_directory_is_deterministic(self):
+        self.assertEqual(generate_directory(users=50, seed=1), generate_directory(users=50, seed=1))
+
+    def test_search_filters_by_object_class_and_base(self):
+        conn = FakeLDAPConnection.from_directory(generate_directory(users=30, departments=5))
+        users = conn.search_s('ou=users,dc=example,dc=top', SCOPE_SUBTREE, '(objectClass=inetOrgPerson)', ['cn'])
+        groups = conn.search_s('ou=groups,dc=example,dc=top', SCOPE_SUBTREE, '(objectClass=groupOfNames)')
+        self.assertEqual(len(users), 30)
+        self.assertEqual(set(users[0][1]), {'cn'})
+        self.assertEqual(len(groups), 5)
+        self.assertEqual(conn.queries, 2)
+
+
+class LDAPSyncTests(TestCase):
+    """_sync_departments / _sync_users / _deactivate_removed_users"""
+
+    def setUp(self):
+        ensure_ldap_module()
+        settings_override = benchmarks.ldap_settings()
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_sync_creates_departments_users_and_profiles(self):
+        directory = generate_directory(users=200, departments=10, seed=3)
+        stats = benchmarks._new_stats()
+        conn = FakeLDAPConnection.from_directory(directory)
+        tasks._sync_departments(conn, stats)
+        tasks._sync_users(conn, stats)
+
+        self.assertEqual(Department.objects.count(), 10)
+        self.assertEqual(stats['users_created'], 200)
+        self.assertEqual(User.objects.filter(is_active=True).count(), 200)
+
+        attrs = next(
+            attrs for dn, attrs in directory[1]
+            if attrs.get('departmentNumber', [b''])[0].decode().startswith('10')
+        )
+        profile = UserProfile.objects.get(user__username=attrs['cn'][0].decode())
+        self.assertEqual(profile.department_id, int(attrs['departmentNumber'][0]))
+
+    def test_sync_preserves_department_tree(self):
+        dept_entries, user_entries = generate_directory(users=300, departments=30, seed=5)
+        conn = FakeLDAPConnection(dept_entries + user_entries)
+        tasks._sync_departments(conn, benchmarks._new_stats())
+        tasks._sync_users(conn, benchmarks._new_stats())
+
+        departments = {department.id: department for department in Department.objects.all()}
+        for dn, attrs in dept_entries:
+            department = departments[int(attrs['cn'][0])]
+            parent_rdn = dn.split(',')[1]
+            parent_id = int(parent_rdn[3:]) if parent_rdn.startswith('cn=') else None
+            self.assertEqual(department.parent_id, parent_id)
+            expected = f'{departments[parent_id].path}{department.id}/' if parent_id else f'/{department.id}/'
+            self.assertEqual(department.path, expected)
+
+        # 子树中的用户：一条查询，与按 DN 逐级判断的结果一致
+        root = next(department for department in departments.values() if department.children.exists())
+        under_root = {
+            int(attrs['cn'][0]) for dn, attrs in dept_entries if f'cn={root.id},' in dn
+        }
+        with self.assertNumQueries(1):
+            members = set(User.objects.filter(root.subtree_q('profile__department__')).values_list('username', flat=True))
+        self.assertEqual(members, set(
+            UserProfile.objects.filter(department_id__in=under_root).values_list('user__username', flat=True)
+        ))
+
+    def test_moving_a_department_rewrites_descendant_paths(self):
+        a = Department.objects.create(id=1, name='A')
+        b = Department.objects.create(id=2, name='B', parent=a)
+        c = Department.objects.create(id=3, name='C', parent=b)
+        other = Department.objects.create(id=4, name='D')
+
+        b.parent = other
+        b.save()
+        c.refresh_from_db()
+        self.assertEqual((c.path, c.depth), ('/4/2/3/', 2))
+        self.assertEqual(set(Department.objects.filter(other.subtree_q()).values_list('id', flat=True)), {2, 3, 4})
+
+        # 不能挂到自己的下级部门下
+        other = Department.objects.get(id=4)
+        other.parent = Department.objects.get(id=3)
+        with self.assertRaises(ValueError):
+            other.save()
+
+    def test_users_missing_from_directory_are_deactivated(self):
+        dept_entries, user_entries = generate_directory(users=40, departments=4)
+        tasks._sync_users(FakeLDAPConnection(dept_entries + user_entries), benchmarks._new_stats())
+
+        stats = benchmarks._new_stats()
+        tasks._sync_users(FakeLDAPConnection(dept_entries + user_entries[:30]), stats)
+        self.assertEqual(stats['users_deactivated'], 10)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 10)
+
+
+class SearchIndexTests(TestCase):
+    """搜索索引随保存更新，后台搜索走索引"""
+
+    def setUp(self):
+        from sync_manager.models import OpenVPNAccount
+
+        self.sales = Department.objects.create(id=10, name='华东销售部')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create(username='zhangsan', first_name='张三', email='ZS@example.com')
+            self.user.profile.department = self.sales
+            self.user.profile.employee_number = 'E1001'
+            self.user.profile.save()
+            OpenVPNAccount.objects.create(user=self.user, username='vpn-zs', password='pw', ip_addr='10.8.0.12')
+            User.objects.create(username='lisi', first_name='李四')
+
+    def search(self, term):
+        return set(User.objects.filter(pk__in=search.matching_user_ids(term)).values_list('username', flat=True))
+
+    def test_document_covers_user_profile_and_vpn_account(self):
+        self.assertEqual(self.search('zs@example'), {'zhangsan'})
+        self.assertEqual(self.search('张三 e1001'), {'zhangsan'})
+        self.assertEqual(self.search('销售 10.8.0.12'), {'zhangsan'})
+        self.assertEqual(self.search('vpn-zs 李四'), set())
+
+    def test_renaming_a_department_reindexes_members(self):
+        department = Department.objects.get(pk=10)
+        department.name = '华南市场部'
+        with self.captureOnCommitCallbacks(execute=True):
+            department.save()
+        self.assertEqual(self.search('市场'), {'zhangsan'})
+        self.assertEqual(self.search('销售'), set())
+        self.assertEqual(search.rebuild(), UserSearchEntry.objects.count())
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser('root', password='x')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:auth_user_changelist'), {'q': '张三'})
+        self.assertEqual([user.username for user in response.context['cl'].result_list], ['zhangsan'])
+        response = self.client.get(reverse('admin:sync_manager_openvpnaccount_changelist'), {'q': '10.8.0'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(reverse('admin:account_department_changelist'), {'q': '10'})
+        self.assertEqual([department.id for department in response.context['cl'].result_list], [10])
+
+
+class LDAPBenchmarkHarnessTests(TestCase):
+    """基准测试框架可以运行，并按阶段记录查询数"""
+
+    def test_bench_size_reports_each_phase(self):
+        report = benchmarks.bench_size(50, trace_memory=False)
+        for run in ('initial', 'resync'):
+            self.assertEqual(set(report[run]) - {'ldap_queries'}, set(benchmarks.PHASES))
+        self.assertGreater(report['initial']['users']['queries'], 0)
+        self.assertGreater(report['resync']['deactivate']['queries'], 0)
+        self.assertFalse(User.objects.exists())
 
-# Create your tests here.
+    def test_compare_rejects_more_queries(self):
+        phase = {'seconds': 1.0, 'queries': 10, 'peak_bytes': 100}
+        baseline = {'50': {'initial': {'users': phase}}}
+        report = {'50': {'initial': {'users': dict(phase, queries=11)}}}
+        self.assertEqual(len(benchmarks.compare(report, baseline)), 1)
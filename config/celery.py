@@ -4,6 +4,14 @@ Celery configuration for the network_manager project.
 
 import os
 from celery import Celery
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_ready,
+)
 
 # Set default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -17,3 +25,45 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from all installed apps
 app.autodiscover_tasks()
 
+
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    """worker 就绪后在主进程中启动 Prometheus 指标端口（CELERY_METRICS_PORT）"""
+    from config.metrics import start_worker_exporter
+
+    start_worker_exporter()
+
+
+def _connect_tracing():
+    """把 trace 上下文随消息头传播到任务（config/tracing.py）"""
+    from config import tracing
+
+    before_task_publish.connect(tracing.inject_headers, weak=False)
+    task_prerun.connect(tracing.start_task_span, weak=False)
+    task_failure.connect(tracing.record_task_failure, weak=False)
+    task_postrun.connect(tracing.end_task_span, weak=False)
+
+
+_connect_tracing()
+
+
+def _connect_profiling():
+    """按后台开关对指定任务做统计采样（config/profiling.py）"""
+    from config import profiling
+
+    task_prerun.connect(profiling.start_task_profile, weak=False)
+    task_postrun.connect(profiling.end_task_profile, weak=False)
+
+
+_connect_profiling()
+
+
+def _connect_pools():
+    """记录 worker 的执行池（config/pools.py）"""
+    from config import pools
+
+    worker_init.connect(pools.record_pool, weak=False)
+
+
+_connect_pools()
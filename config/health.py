@@ -0,0 +1,237 @@
+"""
+Health and readiness endpoints.
+
+- /healthz: 存活检查，进程能处理请求即返回 200，不访问任何依赖
+- /readyz: 就绪检查，探测 MySQL、Redis、Celery broker、LDAP 和 iKuai 路由器，
+  返回每个依赖的状态和耗时；关键依赖（HEALTH_CHECKS['critical']）失败时返回 503。
+  错误信息等详细报告只对带 METRICS_TOKEN 的请求返回（与 /metrics 相同）
+
+HealthCheckMiddleware 放在中间件最前面，在会话和认证加载之前直接返回。
+探测结果在进程内缓存 cache_seconds 秒，每个探测都有超时，缓存过期时只有一个请求执行探测，
+其余请求返回上一次的结果，探针请求不会被慢依赖拖住。
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+HEALTHZ_PATH = '/healthz'
+READYZ_PATH = '/readyz'
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='health-probe')
+_cache_lock = threading.Lock()
+_cached = (0.0, None)
+# 同一时间只有一个请求执行探测；_inflight 记录每个依赖最近一次提交的探测
+_refresh_lock = threading.Lock()
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+
+def _config():
+    return {
+        'timeout': 2.0,
+        'cache_seconds': 5,
+        'critical': ['database', 'redis', 'broker'],
+        **getattr(settings, 'HEALTH_CHECKS', {}),
+    }
+
+
+# ---- 探测 ----
+
+def probe_database(timeout):
+    from django.db import connection
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        # 探测在线程池中执行，用完即关，避免线程持有连接
+        connection.close()
+
+
+def _ping_redis(url, timeout):
+    import redis
+
+    client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+
+def probe_redis(timeout):
+    _ping_redis(settings.REDIS_URL, timeout)
+
+
+def probe_broker(timeout):
+    url = settings.CELERY_BROKER_URL
+    if url.startswith(('redis://', 'rediss://')):
+        _ping_redis(url, timeout)
+        return
+    from config.celery import app
+
+    with app.connection_for_write() as conn:
+        conn.ensure_connection(max_retries=1, timeout=timeout)
+
+
+def probe_ldap(timeout):
+    if getattr(settings, 'LDAP_BACKEND', None) not in settings.AUTHENTICATION_BACKENDS:
+        return 'disabled'
+    import ldap
+
+    conn = ldap.initialize(settings.AUTH_LDAP_SERVER_URI)
+    conn.set_option(ldap.OPT_NETWORK_TIMEOUT, timeout)
+    conn.set_option(ldap.OPT_TIMEOUT, timeout)
+    try:
+        conn.simple_bind_s(settings.AUTH_LDAP_BIND_DN, settings.AUTH_LDAP_BIND_PASSWORD)
+    finally:
+        conn.unbind_s()
+
+
+def probe_ikuai(timeout):
+    """与每台路由器的管理端口建立 TCP 连接（不登录，避免挤掉管理员会话）"""
+    from sync_manager.routers import get_routers
+
+    unreachable = []
+    for name, config in get_routers().items():
+        url = urlparse(config.get('base_url', ''))
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        try:
+            socket.create_connection((url.hostname, port), timeout=timeout).close()
+        except OSError as e:
+            unreachable.append(f'{name}: {e}')
+    if unreachable:
+        raise ConnectionError('; '.join(unreachable))
+
+
+PROBES = {
+    'database': probe_database,
+    'redis': probe_redis,
+    'broker': probe_broker,
+    'ldap': probe_ldap,
+    'ikuai': probe_ikuai,
+}
+
+
+def _timed(probe, timeout):
+    start = time.perf_counter()
+    try:
+        detail = probe(timeout)
+        result = {'ok': True}
+        if detail:
+            result['detail'] = detail
+    except Exception as e:
+        result = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def run_probes(probes=None):
+    """
+    并行执行全部探测，整体不超过 timeout 秒，返回 {依赖: 结果}
+
+    超时的探测仍在线程池中运行；同一依赖上一次的探测还没结束时不再提交新的，
+    线程池中等待的任务最多为依赖数，几个卡住的依赖不会耗尽线程池。
+    """
+    probes = probes or PROBES
+    timeout = _config()['timeout']
+    futures, results = {}, {}
+    with _inflight_lock:
+        for name, probe in probes.items():
+            previous = _inflight.get(name)
+            if previous is not None and not previous.done():
+                results[name] = {'ok': False, 'error': 'previous probe still running', 'latency_ms': None}
+                continue
+            futures[name] = _inflight[name] = _executor.submit(_timed, probe, timeout)
+    deadline = time.monotonic() + timeout
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            results[name] = {'ok': False, 'error': f'timed out after {timeout}s', 'latency_ms': timeout * 1000}
+    return {name: results[name] for name in probes}
+
+
+def _refresh():
+    """执行探测并替换缓存，返回 (检查时间, 结果)"""
+    global _cached
+    checked_at, results = time.time(), run_probes()
+    with _cache_lock:
+        _cached = (checked_at, results)
+    return checked_at, results
+
+
+def get_readiness(refresh=False, detailed=True):
+    """
+    返回 (是否就绪, 报告)，探测结果在进程内缓存
+
+    缓存过期时只有一个请求执行探测（在锁外），其余请求直接返回上一次的结果；
+    还没有任何结果时等待正在进行的探测。detailed 为 False 时每个依赖只返回 ok 和 latency_ms。
+    """
+    config = _config()
+    with _cache_lock:
+        checked_at, results = _cached
+    cached = results is not None and not refresh and time.time() - checked_at < config['cache_seconds']
+    if not cached:
+        if _refresh_lock.acquire(blocking=refresh or results is None):
+            try:
+                with _cache_lock:
+                    previous = _cached
+                if refresh or previous[0] == checked_at:
+                    checked_at, results = _refresh()
+                else:
+                    # 等待期间另一个请求已经刷新
+                    checked_at, results = previous
+            finally:
+                _refresh_lock.release()
+        else:
+            # 另一个请求正在刷新，返回上一次的结果
+            cached = True
+
+    ready = all(results[name]['ok'] for name in config['critical'] if name in results)
+    checks = {
+        name: {**result, 'critical': name in config['critical']} if detailed
+        else {'ok': result['ok'], 'latency_ms': result['latency_ms']}
+        for name, result in results.items()
+    }
+    report = {
+        'status': 'ok' if ready else 'unavailable',
+        'checked_at': checked_at,
+        'cached': cached,
+        'checks': checks,
+    }
+    return ready, report
+
+
+def _json(data, status=200):
+    response = HttpResponse(json.dumps(data), content_type='application/json', status=status)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class HealthCheckMiddleware:
+    """在会话、认证等中间件之前处理 /healthz 和 /readyz"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path_info.rstrip('/')
+        if path == HEALTHZ_PATH:
+            return _json({'status': 'ok'})
+        if path == READYZ_PATH:
+            from config.metrics import authorized
+
+            # 错误信息可能包含主机名、路由器名和驱动报错，只对带 METRICS_TOKEN 的请求返回
+            ready, report = get_readiness(detailed=authorized(request))
+            return _json(report, status=200 if ready else 503)
+        return self.get_response(request)
@@ -0,0 +1,327 @@
+"""
+Two-tier cache for the request user, profile and VPN account.
+
+每个已登录请求都要加载 User，页面里还会再查 UserProfile 和 OpenVPNAccount。
+这里把三者作为一个「身份包」缓存（User 上预先填好 profile、profile.department、
+openvpn_account 的关联缓存）：
+
+- L1: 进程内 LRU（cachetools.TTLCache），保存序列化后的字节串，每次命中反序列化出独立对象
+- L2: Django 缓存（Redis），值用 FIELD_ENCRYPTION_KEY 加密，明文密码不会落到 Redis
+
+失效：User / UserProfile / OpenVPNAccount 的 post_save、post_delete 在事务提交后
+删除 L2（部门改名、移动或删除时失效其子树内的全部用户），并通过 Redis pub/sub 通知所有 gunicorn / Celery 进程丢弃 L1。
+queryset.update() 不触发信号，调用方需要显式调用 invalidate_users()。
+pub/sub 订阅未连上时不使用 L1（只用 L2），重连后清空 L1，避免漏掉的失效消息导致脏读。
+"""
+
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from config import metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'identity:v1:'
+ALL = '*'
+
+_l1 = None
+_l1_lock = threading.Lock()
+_listening = threading.Event()
+_listener_pid = None
+_publisher = None
+_publisher_pid = None
+
+
+def _config():
+    return {
+        'enabled': True,
+        'l1_size': 2000,
+        'l1_ttl': 60,
+        'l2_ttl': 300,
+        'channel': 'identity:invalidate',
+        **getattr(settings, 'IDENTITY_CACHE', {}),
+    }
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+def _get_l1():
+    global _l1
+    if _l1 is None:
+        from cachetools import TTLCache
+
+        config = _config()
+        _l1 = TTLCache(maxsize=config['l1_size'], ttl=config['l1_ttl'])
+    return _l1
+
+
+def _crypter():
+    from encrypted_model_fields.fields import CRYPTER
+
+    return CRYPTER
+
+
+# ---- 读取 ----
+
+def load_bundle(user_id):
+    """从数据库加载身份包（一条查询）"""
+    from django.contrib.auth.models import User
+
+    return (
+        User.objects
+        .select_related('profile__department', 'openvpn_account')
+        .filter(pk=user_id)
+        .first()
+    )
+
+
+def get_user_bundle(user_id):
+    """
+    返回填好 profile / openvpn_account 关联缓存的 User，不存在返回 None
+
+    依次查 L1、L2、数据库；未启用时直接查数据库。
+    """
+    config = _config()
+    if not config['enabled']:
+        return load_bundle(user_id)
+
+    use_l1 = _ensure_listener()
+    if use_l1:
+        with _l1_lock:
+            data = _get_l1().get(user_id)
+        if data is not None:
+            metrics.record_cache('identity_l1', True)
+            return pickle.loads(data)
+        metrics.record_cache('identity_l1', False)
+
+    data = None
+    try:
+        token = cache.get(_key(user_id))
+        if token is not None:
+            data = _crypter().decrypt(token)
+    except Exception as e:
+        logger.warning(f'读取身份缓存失败: {e}')
+    metrics.record_cache('identity_l2', data is not None)
+
+    if data is None:
+        user = load_bundle(user_id)
+        if user is None:
+            return None
+        data = pickle.dumps(user, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            cache.set(_key(user_id), _crypter().encrypt(data), timeout=config['l2_ttl'])
+        except Exception as e:
+            logger.warning(f'写入身份缓存失败: {e}')
+
+    if use_l1:
+        with _l1_lock:
+            _get_l1()[user_id] = data
+    return pickle.loads(data)
+
+
+def get_user(request):
+    """
+    与 django.contrib.auth.get_user 相同，但用户从身份缓存读取
+
+    只处理「会话有效且校验通过」这一常见路径；会话异常、用户被禁用、
+    密钥轮换等情况都交回 Django 原实现处理。
+    """
+    try:
+        user_id = auth.get_user_model()._meta.pk.to_python(request.session[auth.SESSION_KEY])
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    user = get_user_bundle(user_id)
+    if user is None or not user.is_active:
+        return auth.get_user(request)
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+    return auth.get_user(request)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """替代 AuthenticationMiddleware，request.user 从身份缓存读取"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+
+
+# ---- 失效 ----
+
+def _drop_local(user_ids):
+    with _l1_lock:
+        l1 = _get_l1()
+        if user_ids == ALL:
+            l1.clear()
+        else:
+            for user_id in user_ids:
+                l1.pop(user_id, None)
+
+
+def _get_publisher():
+    global _publisher, _publisher_pid
+    if _publisher is None or _publisher_pid != os.getpid():
+        import redis
+
+        _publisher = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=2, socket_timeout=2)
+        _publisher_pid = os.getpid()
+    return _publisher
+
+
+def _forget(user_ids):
+    """删除 L2 和本进程的 L1"""
+    if user_ids != ALL:
+        try:
+            cache.delete_many([_key(user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.warning(f'删除身份缓存失败: {e}')
+    _drop_local(user_ids)
+
+
+def _invalidate_now(user_ids):
+    _forget(user_ids)
+    try:
+        _get_publisher().publish(_config()['channel'], json.dumps(user_ids))
+    except Exception as e:
+        logger.warning(f'广播身份缓存失效失败: {e}')
+
+
+def invalidate_users(user_ids):
+    """
+    使这些用户的身份包失效（事务提交后执行）
+
+    user_ids 为 ALL 时只清空各进程的 L1，L2 依靠 l2_ttl 过期。
+    """
+    if user_ids != ALL:
+        user_ids = sorted({int(user_id) for user_id in user_ids if user_id is not None})
+        if not user_ids:
+            return
+    if not _config()['enabled']:
+        return
+    if transaction.get_connection().in_atomic_block:
+        # 事务内先删一次，同一事务后续的读取不会拿到旧数据；
+        # 提交前其他进程仍可能把旧数据写回，所以提交后再删一次并广播
+        _forget(user_ids)
+    transaction.on_commit(lambda: _invalidate_now(user_ids))
+
+
+def invalidate_user(user_id):
+    invalidate_users([user_id])
+
+
+# ---- pub/sub 订阅 ----
+
+def _ensure_listener():
+    """确保当前进程的订阅线程已启动，返回 L1 当前是否可用"""
+    global _listener_pid
+    pid = os.getpid()
+    if _listener_pid != pid:
+        with _l1_lock:
+            if _listener_pid != pid:
+                _listening.clear()
+                _listener_pid = pid
+                threading.Thread(target=_listen, name='identity-cache-listener', daemon=True).start()
+    return _listening.is_set()
+
+
+def _listen():
+    import redis
+
+    channel = _config()['channel']
+    backoff = 1
+    while True:
+        try:
+            client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=2, health_check_interval=30)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            # 断线期间可能漏掉失效消息
+            _drop_local(ALL)
+            _listening.set()
+            backoff = 1
+            for message in pubsub.listen():
+                _drop_local(json.loads(message['data']))
+        except Exception as e:
+            if _listening.is_set():
+                logger.warning(f'身份缓存失效订阅断开: {e}')
+            _listening.clear()
+            _drop_local(ALL)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+def connect_signals():
+    """User / UserProfile / OpenVPNAccount / Department 变更时失效（在 AppConfig.ready 中调用）"""
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+    from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+    from account.models import Department, UserProfile
+    from sync_manager.models import OpenVPNAccount
+
+    def user_changed(sender, instance, **kwargs):
+        invalidate_user(instance.pk)
+
+    def related_changed(sender, instance, **kwargs):
+        invalidate_user(instance.user_id)
+
+    def department_saving(sender, instance, **kwargs):
+        # LDAP 同步每次都会保存全部部门，只有名称或路径变化才需要失效；
+        # account.search 在 post_save 中会重置 _loaded_name，所以在 pre_save 记下
+        old_path = getattr(instance, '_loaded_path', None)
+        instance._identity_old_path = old_path
+        instance._identity_stale = (
+            old_path != instance.path or getattr(instance, '_loaded_name', None) != instance.name
+        )
+
+    def department_saved(sender, instance, created, **kwargs):
+        if created or not instance.__dict__.pop('_identity_stale', True):
+            return
+        # post_save 时下级部门还是原路径（Department.save 之后才改写），按原路径取子树
+        old_path = instance.__dict__.pop('_identity_old_path', None) or instance.path
+        invalidate_users(
+            UserProfile.objects.filter(Q(department__path__istartswith=old_path) | Q(department_id=instance.pk))
+            .values_list('user_id', flat=True)
+        )
+
+    def department_deleting(sender, instance, **kwargs):
+        # post_delete 时成员的 department 和下级部门的 parent 已被 SET_NULL，只能在删除前取子树
+        instance._identity_user_ids = list(
+            UserProfile.objects.filter(instance.subtree_q('department__')).values_list('user_id', flat=True)
+        )
+
+    def department_deleted(sender, instance, **kwargs):
+        invalidate_users(instance.__dict__.pop('_identity_user_ids', ()))
+
+    for signal in (post_save, post_delete):
+        signal.connect(user_changed, sender=User, weak=False, dispatch_uid=f'identity_cache_user_{signal}')
+        for model in (UserProfile, OpenVPNAccount):
+            signal.connect(
+                related_changed, sender=model, weak=False, dispatch_uid=f'identity_cache_{model.__name__}_{signal}',
+            )
+    for signal, receiver in (
+        (pre_save, department_saving),
+        (post_save, department_saved),
+        (pre_delete, department_deleting),
+        (post_delete, department_deleted),
+    ):
+        signal.connect(receiver, sender=Department, weak=False, dispatch_uid=f'identity_cache_Department_{signal}')
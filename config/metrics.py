@@ -0,0 +1,159 @@
+"""
+Prometheus metrics for router calls, syncs, caches and queues.
+
+指标通过两个出口暴露：
+- Web: /metrics（gunicorn 进程）
+- Celery: worker 主进程启动的独立 HTTP 端口（CELERY_METRICS_PORT）
+
+多进程部署（gunicorn 多 worker、Celery prefork）时设置 PROMETHEUS_MULTIPROC_DIR，
+各进程把指标写入该目录，由出口统一聚合。
+"""
+
+import hmac
+import logging
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# ---- iKuai 路由器调用 ----
+
+IKUAI_CALL_SECONDS = Histogram(
+    'ikuai_call_seconds',
+    'iKuai API 单次 HTTP 调用耗时',
+    ['router', 'action', 'func_name'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+IKUAI_CALL_ERRORS = Counter(
+    'ikuai_call_errors_total',
+    'iKuai API 调用失败次数',
+    ['router', 'action', 'error'],
+)
+IKUAI_TIMEOUTS = Counter(
+    'ikuai_timeouts_total',
+    'iKuai API 调用超时次数（含超出整体截止时间）',
+    ['router', 'action'],
+)
+IKUAI_RETRIES = Counter(
+    'ikuai_retries_total',
+    'iKuai API 幂等调用的重试次数',
+    ['router', 'action'],
+)
+IKUAI_LOGINS = Counter(
+    'ikuai_logins_total',
+    'iKuai 登录次数',
+    ['router', 'result'],
+)
+IKUAI_LIST_PAGES = Histogram(
+    'ikuai_list_accounts_pages',
+    '每次 list_accounts 拉取的页数',
+    ['router'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+# ---- 同步任务 ----
+
+SYNC_PHASE_SECONDS = Histogram(
+    'sync_phase_seconds',
+    '同步任务各阶段耗时',
+    ['sync', 'phase'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+SYNC_ROWS = Counter(
+    'sync_rows_total',
+    '同步任务处理的行数，按结果区分（created/updated/unchanged/missing/deactivated）',
+    ['sync', 'entity', 'outcome'],
+)
+
+# ---- 缓存 ----
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    '缓存访问次数，按命中/未命中区分',
+    ['cache', 'result'],
+)
+
+
+def record_cache(name, hit):
+    """记录一次缓存访问"""
+    CACHE_REQUESTS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+class QueueDepthCollector:
+    """抓取时读取 Celery 队列积压"""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        family = GaugeMetricFamily('celery_queue_depth', 'Celery 队列中积压的消息数', labels=['queue'])
+        try:
+            from sync_manager.queues import get_queue_depths
+
+            for queue, depth in get_queue_depths().items():
+                family.add_metric([queue], depth)
+        except Exception as e:
+            logger.warning(f'读取 Celery 队列积压失败: {e}')
+        yield family
+
+
+def _process_registry():
+    """返回聚合了当前部署所有进程指标的 registry"""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def authorized(request):
+    """
+    请求头 `Authorization: Bearer <METRICS_TOKEN>` 是否正确；/metrics 和 /readyz 的详细报告共用
+
+    未配置 METRICS_TOKEN 时拒绝，除非显式设置 METRICS_ALLOW_ANONYMOUS。
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return getattr(settings, 'METRICS_ALLOW_ANONYMOUS', False)
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    """
+    Prometheus 抓取入口
+
+    需要 METRICS_TOKEN（见 authorized()）：指标包含路由器、任务和队列的内部信息，且每次抓取都会查询 broker。
+    """
+    if not authorized(request):
+        return HttpResponseForbidden('forbidden')
+
+    queue_registry = CollectorRegistry()
+    queue_registry.register(QueueDepthCollector())
+    output = generate_latest(_process_registry()) + generate_latest(queue_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
+
+
+def start_worker_exporter():
+    """在 Celery worker 主进程中启动指标 HTTP 服务"""
+    port = getattr(settings, 'CELERY_METRICS_PORT', 0)
+    if not port:
+        return
+    from prometheus_client import start_http_server
+
+    start_http_server(port, registry=_process_registry())
+    logger.info(f'Celery metrics exporter listening on :{port}')
+
@@ -5,6 +5,7 @@ Custom middleware for the network_manager project.
 import re
 from django.shortcuts import redirect
 from django.conf import settings
+from django.middleware.gzip import GZipMiddleware as BaseGZipMiddleware
 from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
 
@@ -20,9 +21,14 @@ def login_exempt(view_func):
 class LoginRequiredMiddleware(MiddlewareMixin):
     """
     Middleware that requires a user to be authenticated to view any page.
-    Exemptions can be specified using the @login_exempt decorator.
+    Exemptions can be specified using the @login_exempt decorator
+    or the LOGIN_EXEMPT_URLS setting (regexes matched against the path).
     """
 
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.exempt_urls = [re.compile(url) for url in getattr(settings, 'LOGIN_EXEMPT_URLS', [])]
+
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
         检查用户是否已登录,未登录则重定向到登录页面
@@ -40,6 +46,10 @@ class LoginRequiredMiddleware(MiddlewareMixin):
         if getattr(view_func, "login_exempt", False):
             return None
         
+        # 检查路径是否在 LOGIN_EXEMPT_URLS 中
+        if any(url.match(request.path_info) for url in self.exempt_urls):
+            return None
+        
         # 检查用户是否已认证
         if request.user.is_authenticated:
             return None
@@ -48,3 +58,25 @@ class LoginRequiredMiddleware(MiddlewareMixin):
         # 使用相对路径,让 Django 根据 request 的协议和域名自动构建正确的 URL
         next_url = request.get_full_path()
         return redirect(f'{settings.LOGIN_URL}?next={next_url}')
+
+
+# 内容本身已经压缩的类型，再压缩只浪费 CPU（如 /api/v1/export/...?gzip=1 的下载）
+COMPRESSED_CONTENT_TYPES = frozenset({
+    'application/gzip',
+    'application/x-gzip',
+    'application/zip',
+})
+
+
+class GZipMiddleware(BaseGZipMiddleware):
+    """
+    同 django.middleware.gzip.GZipMiddleware：客户端支持时压缩 HTML / JSON 等响应
+
+    已带 Content-Encoding 的响应（WhiteNoise 预压缩的静态文件）和 COMPRESSED_CONTENT_TYPES 不再压缩。
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type in COMPRESSED_CONTENT_TYPES or content_type.startswith(('image/', 'video/')):
+            return response
+        return super().process_response(request, response)
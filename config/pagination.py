@@ -0,0 +1,222 @@
+"""
+Keyset pagination and estimated counts for large querysets.
+
+后台列表默认用 OFFSET 分页，每次翻页还要对带筛选的查询做两次精确 COUNT(*)，
+表越大越慢。这里提供：
+
+- estimated_count(model): 表行数估计（MySQL 取 information_schema.TABLES.TABLE_ROWS，
+  其他数据库为精确 COUNT），在 Django 缓存中保存 count_cache_seconds
+- cached_count(queryset): 带筛选的精确 COUNT，按 SQL 缓存 count_cache_seconds
+- seek_q / encode_cursor / decode_cursor: 按有索引的排序做 keyset（seek）分页
+- KeysetPaginationMixin: ModelAdmin 混入类，表行数估计超过 keyset_threshold 且
+  当前排序可以走索引时，列表改为「下一页」式的 keyset 分页，总数用估计值 / 缓存值
+"""
+
+import base64
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, OrderBy, Q
+
+logger = logging.getLogger(__name__)
+
+CURSOR_VAR = 'after'
+CACHE_PREFIX = 'pagination:v1:'
+
+
+def _config():
+    return {
+        'keyset_threshold': 50000,
+        'count_cache_seconds': 300,
+        **getattr(settings, 'ADMIN_PAGINATION', {}),
+    }
+
+
+# ---- 计数 ----
+
+def estimated_count(model, using='default'):
+    """表行数估计（InnoDB 的 TABLE_ROWS 误差可达几十个百分点，只用于显示和阈值判断）"""
+    key = f'{CACHE_PREFIX}estimate:{model._meta.label_lower}'
+    count = cache.get(key)
+    if count is None:
+        connection = connections[using]
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                    [model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            count = int(row[0] or 0) if row else 0
+        else:
+            count = model._default_manager.using(using).count()
+        cache.set(key, count, _config()['count_cache_seconds'])
+    return count
+
+
+def cached_count(queryset):
+    """精确 COUNT，按 SQL 和参数缓存；未筛选的查询直接用表行数估计"""
+    if not queryset.query.where:
+        return estimated_count(queryset.model, queryset.db)
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+    key = f'{CACHE_PREFIX}count:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, _config()['count_cache_seconds'])
+    return count
+
+
+# ---- keyset ----
+
+def _indexed(opts, field):
+    if field.primary_key or field.unique or field.db_index:
+        return True
+    return any(
+        index.fields and index.fields[0].lstrip('-') == field.name
+        for index in opts.indexes
+    )
+
+
+def keyset_ordering(queryset):
+    """
+    查询的排序能否用于 keyset 分页：返回 [(字段, 是否降序)]，不能时返回 None
+
+    要求：全部是本表非空的具体字段，第一个字段有索引，且包含主键或唯一字段（全序）。
+    """
+    opts = queryset.model._meta
+    ordering = []
+    for part in queryset.query.order_by:
+        if isinstance(part, str):
+            descending, name = part.startswith('-'), part.lstrip('-')
+        elif isinstance(part, OrderBy) and isinstance(part.expression, F):
+            descending, name = part.descending, part.expression.name
+        else:
+            return None
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.null:
+            return None
+        ordering.append((field, descending))
+    if not ordering or not _indexed(opts, ordering[0][0]):
+        return None
+    if not any(field.primary_key or field.unique for field, descending in ordering):
+        return None
+    return ordering
+
+
+def seek_q(ordering, values):
+    """
+    排在 values 之后的行：(a, b, pk) > (va, vb, vpk) 展开为 OR，
+    外加第一个字段的范围条件，便于在第一个字段的索引上做范围扫描
+    """
+    first, first_descending = ordering[0]
+    condition = Q()
+    equal = {}
+    for (field, descending), value in zip(ordering, values):
+        condition |= Q(**equal, **{f'{field.attname}__{"lt" if descending else "gt"}': value})
+        equal[field.attname] = value
+    bound = 'lte' if first_descending else 'gte'
+    return Q(**{f'{first.attname}__{bound}': values[0]}) & condition
+
+
+def _signature(ordering):
+    return ','.join(f'{"-" if descending else ""}{field.attname}' for field, descending in ordering)
+
+
+def _encode_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def encode_cursor(ordering, obj):
+    """obj 之后的位置，包含排序签名，排序变化后旧游标失效"""
+    values = [getattr(obj, field.attname) for field, descending in ordering]
+    # 不用 DjangoJSONEncoder：它把时间截断到毫秒，会跳过同一毫秒内的行
+    payload = json.dumps([_signature(ordering), values], default=_encode_value)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(ordering, cursor):
+    """解析游标，返回排序字段的值；游标无效或排序不一致时返回 None"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        signature, values = json.loads(payload)
+        if signature != _signature(ordering) or len(values) != len(ordering):
+            return None
+        return [field.to_python(value) for (field, descending), value in zip(ordering, values)]
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        logger.debug(f'Invalid cursor {cursor!r}: {e}')
+        return None
+
+
+def keyset_page(queryset, ordering, cursor, per_page):
+    """返回 (本页对象列表, 下一页游标或 None)，只执行一条带 LIMIT 的查询，没有 OFFSET"""
+    values = decode_cursor(ordering, cursor) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(seek_q(ordering, values))
+    rows = list(queryset[:per_page + 1])
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(ordering, rows[-1])
+
+
+# ---- 后台 ----
+
+class KeysetChangeList(ChangeList):
+    """大表上改用 keyset 分页和估计总数的 ChangeList"""
+
+    keyset = False
+    next_cursor = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # 排序、筛选、搜索变化后从第一页开始
+        new_params = {CURSOR_VAR: None, **(new_params or {})}
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        ordering = keyset_ordering(self.queryset)
+        if ordering is None or estimated_count(self.model, self.queryset.db) < _config()['keyset_threshold']:
+            return super().get_results(request)
+
+        self.keyset = True
+        cursor = request.GET.get(CURSOR_VAR)
+        self.result_list, self.next_cursor = keyset_page(self.queryset, ordering, cursor, self.list_per_page)
+        self.result_count = cached_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(cursor or self.next_cursor)
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.first_url = self.get_query_string() if cursor else None
+        self.next_url = self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin 混入类：表行数估计超过 ADMIN_PAGINATION['keyset_threshold'] 时，
+    按当前排序做 keyset 分页（只有「第一页 / 下一页」），总数显示估计值或缓存的 COUNT
+
+    排序不能走索引（例如按注解字段或关联字段排序）时仍使用默认的 OFFSET 分页。
+    """
+
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
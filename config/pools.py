@@ -0,0 +1,100 @@
+"""
+Celery worker pool awareness.
+
+worker 的任务几乎都在等待路由器（requests）或 LDAP（python-ldap），用 I/O 型执行池
+（-P threads / gevent / eventlet）时一个进程可以同时运行几百个任务：
+
+- worker_init 时记录当前 worker 的执行池，current_pool() / io_pool() 供任务判断
+- I/O 型池中每个线程 / greenlet 各有一个 Django 数据库连接；任务在等待路由器之前调用
+  release_db_connection() 把连接还给数据库，几百个并发任务不会占满 MySQL 的 max_connections
+- python-ldap 是 C 扩展，调用期间会阻塞 gevent / eventlet 的事件循环；这类 worker
+  消费了 LDAP 同步任务所在的队列时，启动时记录警告（LDAP 任务应留在 prefork 或 threads worker）
+- threads 池不执行任务的 time_limit，消费了声明 time_limit 的任务时同样记录警告
+
+路由器客户端的会话与连接池见 sync_manager/routers.py。
+"""
+
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+IO_POOLS = frozenset({'threads', 'gevent', 'eventlet'})
+GREEN_POOLS = frozenset({'gevent', 'eventlet'})
+# 会阻塞事件循环的任务（同步的 C 扩展调用）
+BLOCKING_TASKS = frozenset({'account.tasks.sync_ldap_users_task'})
+
+_pool = None
+
+
+def _pool_name(pool_cls):
+    """celery.concurrency.<模块>.TaskPool -> prefork / threads / gevent / eventlet / solo"""
+    if isinstance(pool_cls, str):
+        name = pool_cls
+    else:
+        name = pool_cls.__module__.rsplit('.', 1)[-1]
+    return {'thread': 'threads', 'processes': 'prefork'}.get(name, name)
+
+
+def _consumed(sender, task_names):
+    """task_names 中路由到当前 worker 所消费队列的任务"""
+    queues = sender.app.amqp.queues
+    consumed = set(queues.consume_from or queues)
+    routes = getattr(settings, 'CELERY_TASK_ROUTES', {})
+    default_queue = getattr(settings, 'CELERY_TASK_DEFAULT_QUEUE', 'celery')
+    return sorted(task for task in task_names if routes.get(task, {}).get('queue', default_queue) in consumed)
+
+
+def record_pool(sender=None, **kwargs):
+    """
+    worker_init 信号：记录执行池
+
+    green 池消费阻塞任务的队列、线程池（不执行 time_limit）消费声明了 time_limit 的任务时警告。
+    """
+    global _pool
+    pool_cls = getattr(sender, 'pool_cls', None)
+    if pool_cls is None:
+        return
+    _pool = _pool_name(pool_cls)
+    logger.info(f'Celery worker pool: {_pool}')
+    if _pool in GREEN_POOLS:
+        blocking = _consumed(sender, BLOCKING_TASKS)
+        if blocking:
+            logger.warning(
+                f'{_pool} worker consumes {", ".join(blocking)}, which block the event loop; '
+                f'run them on a prefork or threads worker'
+            )
+    elif _pool == 'threads':
+        limited = _consumed(sender, [
+            name for name, task in sender.app.tasks.items() if getattr(task, 'time_limit', None)
+        ])
+        if limited:
+            logger.warning(
+                f'threads worker does not enforce time_limit for {", ".join(limited)}; '
+                f'only the iKuai client deadline bounds them'
+            )
+
+
+def current_pool():
+    """当前 worker 的执行池名称，不在 worker 中（web、管理命令）时为 None"""
+    return _pool
+
+
+def io_pool():
+    return _pool in IO_POOLS
+
+
+def release_db_connection():
+    """
+    I/O 型池中，在等待网络之前关闭当前线程 / greenlet 的数据库连接（下一次查询时自动重连）
+
+    事务中的连接不关闭；prefork 池和 worker 之外不做任何事。
+    """
+    if not io_pool():
+        return
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
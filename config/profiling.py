@@ -0,0 +1,292 @@
+"""
+On-demand sampling profiler for requests and Celery tasks.
+
+管理员在后台（/admin/profiling/）开启后，按采样比例对指定页面和任务做统计采样：
+后台线程每隔 interval 秒读取一次目标线程的调用栈（sys._current_frames），
+结束时把调用栈按 folded 格式（`帧;帧;帧 次数`）写入磁盘，
+可直接交给 flamegraph.pl、speedscope 或 inferno 生成火焰图。
+
+开关保存在 Django 缓存（Redis）中，所有 gunicorn / Celery 进程共享，到期自动关闭；
+每个进程最多每 CONFIG_REFRESH_SECONDS 秒读取一次，关闭时几乎没有开销。
+"""
+
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+CONFIG_CACHE_KEY = 'profiling:config'
+CONFIG_REFRESH_SECONDS = 5
+
+# 可采样的目标：请求按 URL name，任务按任务名
+REQUEST_TARGETS = {
+    'sync_manager:dashboard': 'OpenVPN 首页',
+    'sync_manager:account_status': '账号状态接口',
+    'admin:changelist': '后台列表页',
+}
+TASK_TARGETS = {
+    'sync_manager.tasks.sync_openvpn_accounts': '路由器账号同步',
+    'account.tasks.sync_ldap_users_task': 'LDAP 同步',
+}
+
+_config_cache = (0.0, None)
+_config_lock = threading.Lock()
+# 正在执行的任务采样器：task_id -> SamplingProfiler
+_task_profilers = {}
+
+
+def _settings():
+    return getattr(settings, 'PROFILING', {})
+
+
+def profile_dir():
+    return Path(_settings().get('dir', Path(settings.BASE_DIR) / 'logs' / 'profiles'))
+
+
+# ---- 开关 ----
+
+def get_config(refresh=False):
+    """当前采样配置，未开启返回 None（进程内缓存 CONFIG_REFRESH_SECONDS 秒）"""
+    global _config_cache
+    now = time.monotonic()
+    expires, config = _config_cache
+    if refresh or now >= expires:
+        with _config_lock:
+            try:
+                config = cache.get(CONFIG_CACHE_KEY)
+            except Exception as e:
+                logger.warning(f'读取采样配置失败: {e}')
+                config = None
+            _config_cache = (now + CONFIG_REFRESH_SECONDS, config)
+    return config
+
+
+def enable(sample_rate, targets, duration_minutes, interval=None):
+    """开启采样，duration_minutes 分钟后自动关闭"""
+    config = {
+        'sample_rate': max(0.0, min(float(sample_rate), 1.0)),
+        'targets': list(targets),
+        'interval': interval or _settings().get('interval', 0.005),
+        'expires_at': time.time() + duration_minutes * 60,
+    }
+    cache.set(CONFIG_CACHE_KEY, config, timeout=int(duration_minutes * 60))
+    get_config(refresh=True)
+    return config
+
+
+def disable():
+    cache.delete(CONFIG_CACHE_KEY)
+    get_config(refresh=True)
+
+
+def should_sample(target):
+    """target 是否在本次采样范围内，命中采样比例时返回采样间隔，否则返回 None"""
+    config = get_config()
+    if not config or target not in config['targets']:
+        return None
+    if random.random() >= config['sample_rate']:
+        return None
+    return config['interval']
+
+
+# ---- 采样器 ----
+
+class SamplingProfiler:
+    """
+    对单个线程做统计采样
+
+    用法:
+        profiler = SamplingProfiler(interval=0.005).start()
+        ...
+        stacks = profiler.stop()   # Counter({'a;b;c': 12, ...})
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+
+
+def _collapse(frame):
+    """把调用栈转成 folded 格式的一行（根在前）"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _short_path(filename):
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        return os.path.relpath(filename, base)
+    for marker in ('site-packages' + os.sep, 'lib' + os.sep + 'python'):
+        index = filename.find(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
+
+
+# ---- 存储 ----
+
+def _safe(name):
+    # 文件名以 _ 分隔字段，目标名中的 _ 也替换掉
+    return re.sub(r'[^A-Za-z0-9.-]+', '-', name).strip('-')
+
+
+def save_profile(kind, target, profiler):
+    """写入 <时间>_<类型>_<目标>_<耗时ms>ms.folded，超出保留数量时删除最旧的"""
+    if not profiler.stacks:
+        return None
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}_{kind}_{_safe(target)}_{int(profiler.elapsed * 1000)}ms.folded'
+    path = directory / name
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in profiler.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+
+    keep = _settings().get('keep', 200)
+    files = sorted(directory.glob('*.folded'))
+    for old in files[:max(len(files) - keep, 0)]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def list_profiles():
+    """返回已保存的采样结果（新的在前）"""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.folded'), reverse=True):
+        parts = path.stem.split('_')
+        if len(parts) != 4:
+            continue
+        started, kind, target, duration = parts
+        profiles.append({
+            'name': path.name,
+            'started': started,
+            'kind': kind,
+            'target': target,
+            'duration_ms': int(duration.rstrip('ms') or 0),
+            'size': path.stat().st_size,
+        })
+    return profiles
+
+
+def read_profile(name):
+    """读取一个采样文件，name 必须是 list_profiles 中的文件名"""
+    if name != Path(name).name or not name.endswith('.folded'):
+        raise FileNotFoundError(name)
+    return (profile_dir() / name).read_text(encoding='utf-8')
+
+
+def top_frames(folded, limit=30):
+    """按自身耗时（栈顶帧）汇总，返回 [(帧, 采样数, 占比)]"""
+    self_counts = Counter()
+    total = 0
+    for line in folded.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if not stack:
+            continue
+        self_counts[stack.rsplit(';', 1)[-1]] += int(count)
+        total += int(count)
+    return [(frame, count, count / total) for frame, count in self_counts.most_common(limit)]
+
+
+# ---- 请求与任务挂钩 ----
+
+def _request_target(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if match.namespace == 'admin' and match.url_name and match.url_name.endswith('_changelist'):
+        return 'admin:changelist'
+    return match.view_name
+
+
+class ProfilingMiddleware:
+    """对命中采样的请求做统计采样（包括其后的中间件和视图）"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if get_config() is None:
+            return self.get_response(request)
+        target = _request_target(request)
+        interval = should_sample(target) if target else None
+        if interval is None:
+            return self.get_response(request)
+
+        profiler = SamplingProfiler(interval=interval).start()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.stop()
+            try:
+                save_profile('request', target, profiler)
+            except Exception as e:
+                logger.warning(f'保存请求采样结果失败: {e}')
+
+
+def start_task_profile(task_id=None, task=None, **kwargs):
+    """task_prerun：按配置对任务采样"""
+    if task is None or get_config() is None:
+        return
+    interval = should_sample(task.name)
+    if interval is not None:
+        _task_profilers[task_id] = SamplingProfiler(interval=interval).start()
+
+
+def end_task_profile(task_id=None, task=None, **kwargs):
+    """task_postrun：保存任务采样结果"""
+    profiler = _task_profilers.pop(task_id, None)
+    if profiler is None:
+        return
+    profiler.stop()
+    try:
+        save_profile('task', task.name, profiler)
+    except Exception as e:
+        logger.warning(f'保存任务采样结果失败: {e}')
+
@@ -0,0 +1,96 @@
+"""
+Admin pages for the on-demand profiler (config/profiling.py).
+
+仅超级管理员可用：开启/关闭采样、查看热点帧、下载 folded 文件。
+"""
+
+import math
+import time
+
+from django.contrib import admin
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.shortcuts import redirect, render
+
+from config.profiling import (
+    REQUEST_TARGETS,
+    TASK_TARGETS,
+    disable,
+    enable,
+    get_config,
+    list_profiles,
+    read_profile,
+    top_frames,
+)
+
+
+def _require_superuser(view):
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return HttpResponseForbidden('仅超级管理员可用')
+        return view(request, *args, **kwargs)
+    return admin.site.admin_view(wrapper)
+
+
+def _float_param(request, name, default, low, high):
+    """POST 中的数值参数，限制在 [low, high]；不是有限数值时抛 ValueError"""
+    value = float(request.POST.get(name) or default)
+    if not math.isfinite(value):
+        raise ValueError(f'{name} 必须是有限数值')
+    return max(low, min(value, high))
+
+
+def _profiling_view(request):
+    """开启/关闭采样，列出采样结果；?name= 时展示单个结果的热点帧"""
+    if request.method == 'POST':
+        if request.POST.get('action') == 'enable':
+            try:
+                sample_rate = _float_param(request, 'sample_rate', 0.1, 0.0, 1.0)
+                # 与页面上输入框的范围一致
+                duration_minutes = _float_param(request, 'duration_minutes', 10, 1, 240)
+            except ValueError:
+                return HttpResponseBadRequest('采样比例应为 0~1 的数值，持续时间应为 1~240 分钟')
+            enable(
+                sample_rate=sample_rate,
+                targets=request.POST.getlist('targets'),
+                duration_minutes=duration_minutes,
+            )
+        else:
+            disable()
+        return redirect(request.path)
+
+    selected = request.GET.get('name')
+    top = None
+    if selected:
+        try:
+            top = top_frames(read_profile(selected))
+        except FileNotFoundError:
+            raise Http404(selected)
+
+    config = get_config(refresh=True)
+    context = {
+        **admin.site.each_context(request),
+        'title': '性能采样',
+        'config': config,
+        'expires_in': int(config['expires_at'] - time.time()) if config else 0,
+        'request_targets': REQUEST_TARGETS,
+        'task_targets': TASK_TARGETS,
+        'profiles': list_profiles(),
+        'selected': selected,
+        'top_frames': top,
+    }
+    return render(request, 'admin/profiling.html', context)
+
+
+def _profile_download_view(request, name):
+    """下载 folded 文件（交给 flamegraph.pl / speedscope）"""
+    try:
+        content = read_profile(name)
+    except FileNotFoundError:
+        raise Http404(name)
+    response = HttpResponse(content, content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+profiling_view = _require_superuser(_profiling_view)
+profile_download_view = _require_superuser(_profile_download_view)
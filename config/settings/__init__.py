@@ -17,13 +17,11 @@ ENVIRONMENT = os.environ.get('DJANGO_ENV', 'dev').lower()
 if ENVIRONMENT == 'prod':
     try:
         from .prod import *
-        print(f"Loaded production settings")
     except ImportError:
         pass
 elif ENVIRONMENT == 'dev':
     try:
         from .dev import *
-        print(f"Loaded development settings")
     except ImportError:
         pass
 else:
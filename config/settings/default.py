@@ -3,9 +3,13 @@ Default Django settings for config project.
 These settings are always loaded and can be overridden by dev.py or prod.py
 """
 
+import importlib.util
+import json
 import os
 from pathlib import Path
 
+from django.utils.functional import SimpleLazyObject
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -42,15 +46,25 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # 静态文件在会话、认证之前直接返回；带哈希的文件名缓存一年，优先返回预压缩的 .br / .gz
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # HTML / JSON 响应按 Accept-Encoding 压缩（已压缩的静态文件和导出不再压缩）
+    'config.middleware.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # 同 AuthenticationMiddleware，用户、部门和 VPN 账号从身份缓存读取（见 config/identity_cache.py）
+    'config.identity_cache.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'config.middleware.LoginRequiredMiddleware',  # Force login for all views
 ]
 
+# 按需采样放在最外层，采样范围包含全部中间件（未开启时每 5 秒读一次缓存）
+MIDDLEWARE.insert(0, 'config.profiling.ProfilingMiddleware')
+# 健康检查在所有中间件之前直接返回，不加载会话和用户
+MIDDLEWARE.insert(0, 'config.health.HealthCheckMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -144,11 +158,25 @@ SYSTEM_SUPER_ADMIN_USERNAME = os.environ.get('SYSTEM_SUPER_ADMIN_USERNAME', 'adm
 
 
 
-# Try to enable LDAP if available
-try:
-    import ldap
-    from django_auth_ldap.config import LDAPSearch, GroupOfNamesType
-    
+def _ldap_search(base_dn, filterstr):
+    """延迟到首次使用时才导入 ldap / django_auth_ldap 并构造 LDAPSearch"""
+    def build():
+        import ldap
+        from django_auth_ldap.config import LDAPSearch
+
+        return LDAPSearch(base_dn, ldap.SCOPE_SUBTREE, filterstr)
+    return SimpleLazyObject(build)
+
+
+def _group_of_names_type():
+    from django_auth_ldap.config import GroupOfNamesType
+
+    return GroupOfNamesType(name_attr="cn")
+
+
+# Enable LDAP if available
+# 只检查是否安装，不在加载配置时导入（python-ldap 和 django_auth_ldap 导入较慢）
+if importlib.util.find_spec('ldap') and importlib.util.find_spec('django_auth_ldap'):
     # Add custom LDAP backend if package is installed
     AUTHENTICATION_BACKENDS+= [
         LDAP_BACKEND,
@@ -168,9 +196,8 @@ try:
     # sn -> first_name (姓名/昵称)
     # employeeNumber -> profile.employee_number (业务用户ID)
     # departmentNumber -> profile.department_number (部门ID)
-    AUTH_LDAP_USER_SEARCH = LDAPSearch(
+    AUTH_LDAP_USER_SEARCH = _ldap_search(
         os.environ.get('LDAP_USER_SEARCH_BASE', 'ou=ikuaier,dc=example,dc=top'),
-        ldap.SCOPE_SUBTREE,
         "(cn=%(user)s)"
     )
 
@@ -191,14 +218,13 @@ try:
     # 组类型: groupOfNames (级联结构)
     # 组结构: cn=<group_id>,ou=groups,dc=example,dc=top
     #         cn=<sub_group_id>,cn=<parent_group_id>,ou=groups,dc=example,dc=top
-    AUTH_LDAP_GROUP_SEARCH = LDAPSearch(
+    AUTH_LDAP_GROUP_SEARCH = _ldap_search(
         os.environ.get('LDAP_GROUP_SEARCH_BASE', 'ou=groups,dc=example,dc=top'),
-        ldap.SCOPE_SUBTREE,
         "(objectClass=groupOfNames)"
     )
 
     # 使用 GroupOfNamesType 而不是 PosixGroupType
-    AUTH_LDAP_GROUP_TYPE = GroupOfNamesType(name_attr="cn")
+    AUTH_LDAP_GROUP_TYPE = SimpleLazyObject(_group_of_names_type)
 
     # Mirror LDAP groups to Django groups
     AUTH_LDAP_MIRROR_GROUPS = True
@@ -225,11 +251,7 @@ try:
     logger = logging.getLogger('django_auth_ldap')
     logger.addHandler(logging.StreamHandler())
     logger.setLevel(logging.DEBUG)
-    
-    print("LDAP authentication enabled (inetOrgPerson + groupOfNames)")
-except ImportError:
-    print("LDAP packages not installed. Using Django authentication only.")
-    print("To enable LDAP, install: uv sync --extra ldap")
+# 未安装时只使用 Django 自带认证，启用 LDAP 需执行 uv sync --extra ldap
 
 # Login settings
 LOGIN_URL = '/accounts/login/'
@@ -238,11 +260,61 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 
 # URLs that don't require authentication
 LOGIN_EXEMPT_URLS = [
-    r'^/accounts/login$',
+    r'^/accounts/login/',
     r'^/admin/',
     r'^/static/',
 ]
 
+# 健康检查（见 config/health.py）
+# timeout: 每次就绪检查的总超时（秒）；cache_seconds: 探测结果在进程内的缓存时间
+# critical: 失败时 /readyz 返回 503 的依赖，其余依赖只报告状态
+HEALTH_CHECKS = {
+    'timeout': float(os.environ.get('HEALTH_CHECK_TIMEOUT', '2')),
+    'cache_seconds': int(os.environ.get('HEALTH_CHECK_CACHE_SECONDS', '5')),
+    'critical': ['database', 'redis', 'broker'],
+}
+
+# 身份缓存（见 config/identity_cache.py）
+# l1_size / l1_ttl: 进程内缓存的条数和秒数；l2_ttl: Redis 中的秒数
+# channel: 广播失效消息的 pub/sub 频道
+IDENTITY_CACHE = {
+    'enabled': os.environ.get('IDENTITY_CACHE_ENABLED', 'true').lower() == 'true',
+    'l1_size': int(os.environ.get('IDENTITY_CACHE_L1_SIZE', '2000')),
+    'l1_ttl': int(os.environ.get('IDENTITY_CACHE_L1_TTL', '60')),
+    'l2_ttl': int(os.environ.get('IDENTITY_CACHE_L2_TTL', '300')),
+    'channel': 'identity:invalidate',
+}
+
+# 后台大表分页（见 config/pagination.py）
+# 表行数估计超过 keyset_threshold 时，用户 / OpenVPN 账号列表改为 keyset 分页；
+# 行数估计和带筛选的 COUNT 在缓存中保存 count_cache_seconds 秒
+ADMIN_PAGINATION = {
+    'keyset_threshold': int(os.environ.get('ADMIN_KEYSET_THRESHOLD', '50000')),
+    'count_cache_seconds': int(os.environ.get('ADMIN_COUNT_CACHE_SECONDS', '300')),
+}
+
+# LDAP 密码写回路由器（见 sync_manager/passwords.py）
+# 密码变化后 debounce_seconds 秒执行一次写回，合并期间的全部变更；每批读取 batch_size 个账号
+PASSWORD_SYNC = {
+    'debounce_seconds': int(os.environ.get('PASSWORD_SYNC_DEBOUNCE_SECONDS', '30')),
+    'batch_size': int(os.environ.get('PASSWORD_SYNC_BATCH_SIZE', '500')),
+}
+
+# 连接历史（见 sync_manager/history.py）
+# 原始记录、小时汇总、天汇总各自的保留天数
+CONNECTION_HISTORY = {
+    'raw_days': int(os.environ.get('CONNECTION_HISTORY_RAW_DAYS', '14')),
+    'hourly_days': int(os.environ.get('CONNECTION_HISTORY_HOURLY_DAYS', '90')),
+    'daily_days': int(os.environ.get('CONNECTION_HISTORY_DAILY_DAYS', '730')),
+}
+
+# 部门使用情况（见 sync_manager/usage.py）
+# expiring_days: 多少天内过期算「即将过期」；vectorized: 全量重算时使用 NumPy（未安装时自动回退）
+DEPARTMENT_USAGE = {
+    'expiring_days': int(os.environ.get('DEPARTMENT_USAGE_EXPIRING_DAYS', '7')),
+    'vectorized': os.environ.get('DEPARTMENT_USAGE_VECTORIZED', 'true').lower() == 'true',
+}
+
 
 # Redis Configuration
 REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
@@ -277,6 +349,77 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
 
+# Celery 队列拓扑
+# - interactive: 用户触发的短任务（创建/删除账号），独立 worker，优先级最高
+# - bulk: 定时全量同步等长任务，acks_late + prefetch=1，避免长任务囤积消息
+from kombu import Queue
+
+CELERY_TASK_QUEUES = (
+    Queue('interactive', routing_key='interactive'),
+    Queue('bulk', routing_key='bulk'),
+)
+CELERY_TASK_DEFAULT_QUEUE = 'bulk'
+CELERY_TASK_ROUTES = {
+    'sync_manager.tasks.create_openvpn_account': {'queue': 'interactive', 'priority': 0},
+    'sync_manager.tasks.delete_openvpn_account': {'queue': 'interactive', 'priority': 0},
+    'sync_manager.tasks.sync_openvpn_accounts': {'queue': 'bulk', 'priority': 6},
+    'sync_manager.tasks.check_expired_accounts': {'queue': 'bulk', 'priority': 6},
+    'sync_manager.tasks.rollup_connection_history': {'queue': 'bulk', 'priority': 6},
+    'sync_manager.tasks.rebuild_department_usage': {'queue': 'bulk', 'priority': 6},
+    # 后台 / API 的批量启用、禁用、续期：有人在等结果，排在定时任务前面
+    'sync_manager.tasks.push_account_changes': {'queue': 'bulk', 'priority': 3},
+    # LDAP 密码变更后的写回：用户刚登录、正等着用新密码连 VPN
+    'sync_manager.tasks.sync_account_passwords': {'queue': 'bulk', 'priority': 3},
+    'sync_manager.tasks.adopt_router_accounts': {'queue': 'bulk', 'priority': 6},
+    'account.tasks.sync_ldap_users_task': {'queue': 'bulk', 'priority': 6},
+}
+# Redis 优先级：0 最高，9 最低
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # acks_late 的消息在超时未确认后会重新投递，必须大于最长任务的运行时间
+    'visibility_timeout': 3600,
+}
+# 默认每个进程只预取一条消息，长任务不会把短任务挡在本地缓冲里
+# （interactive worker 在 supervisord 中单独调高）
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# 队列积压驱动的扩缩容建议（见 manage.py queue_stats）
+# target_backlog: 每个 worker 进程可接受的积压消息数
+CELERY_QUEUE_AUTOSCALE = {
+    'interactive': {'min': 2, 'max': 8, 'target_backlog': 2},
+    'bulk': {'min': 1, 'max': 4, 'target_backlog': 1},
+}
+
+# Prometheus 指标（见 config/metrics.py）
+# /metrics 要求 Authorization: Bearer <METRICS_TOKEN>；未设置 token 时拒绝访问，
+# 除非 METRICS_ALLOW_ANONYMOUS=true（仅用于只有内网可达的部署）
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOW_ANONYMOUS = os.environ.get('METRICS_ALLOW_ANONYMOUS', 'false').lower() == 'true'
+# Celery worker 主进程的指标端口，0 表示不启动
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', '0'))
+
+# 按需性能采样（见 config/profiling.py，在 /admin/profiling/ 开关）
+# interval: 采样间隔（秒）；keep: 磁盘上保留的采样文件数
+PROFILING = {
+    'dir': os.environ.get('PROFILING_DIR', str(BASE_DIR / 'logs' / 'profiles')),
+    'interval': float(os.environ.get('PROFILING_INTERVAL', '0.005')),
+    'keep': int(os.environ.get('PROFILING_KEEP', '200')),
+}
+
+# OpenTelemetry 链路追踪（见 config/tracing.py，需要安装 tracing 可选依赖）
+# exporter: file（每行一个 span 的 JSON）/ otlp（发送到本地 collector）/ console
+TRACING = {
+    'enabled': os.environ.get('TRACING_ENABLED', 'false').lower() == 'true',
+    'exporter': os.environ.get('TRACING_EXPORTER', 'file'),
+    'file_path': os.environ.get('TRACING_FILE', str(BASE_DIR / 'logs' / 'traces.jsonl')),
+    'endpoint': os.environ.get('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT', 'http://localhost:4318/v1/traces'),
+    'service_name': os.environ.get('OTEL_SERVICE_NAME', 'network-manager'),
+    'sample_ratio': float(os.environ.get('TRACING_SAMPLE_RATIO', '1.0')),
+}
+
 # Celery Beat Schedule (for periodic tasks)
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
@@ -308,6 +451,30 @@ CELERY_BEAT_SCHEDULE = {
             'expires': 3600,
         }
     },
+    # 每小时汇总连接历史并清理过期数据
+    'rollup-connection-history': {
+        'task': 'sync_manager.tasks.rollup_connection_history',
+        'schedule': crontab(minute=5),  # 每小时的第 5 分钟执行
+        'options': {
+            'expires': 3600,
+        }
+    },
+    # 重试写回失败的 VPN 密码（正常情况下密码变更后会自动投递）
+    'sync-account-passwords': {
+        'task': 'sync_manager.tasks.sync_account_passwords',
+        'schedule': crontab(minute='*/10'),
+        'options': {
+            'expires': 600,
+        }
+    },
+    # 每小时全量重算部门使用情况（在 LDAP 同步之后）
+    'rebuild-department-usage': {
+        'task': 'sync_manager.tasks.rebuild_department_usage',
+        'schedule': crontab(minute=15),  # 每小时的第 15 分钟执行
+        'options': {
+            'expires': 3600,
+        }
+    },
 }
 
 
@@ -316,6 +483,49 @@ IKUAI_CONFIG = {
     'base_url': os.environ.get('IKUAI_BASE_URL', 'http://192.168.1.1'),
     'username': os.environ.get('IKUAI_USERNAME', 'admin'),
     'password': os.environ.get('IKUAI_PASSWORD', 'admin'),
+    # 单次调用的超时预算（秒），按 action 区分
+    'timeouts': {
+        'login': int(os.environ.get('IKUAI_LOGIN_TIMEOUT', '10')),
+        'add': int(os.environ.get('IKUAI_ADD_TIMEOUT', '15')),
+        'show': int(os.environ.get('IKUAI_SHOW_TIMEOUT', '20')),
+        'edit': int(os.environ.get('IKUAI_EDIT_TIMEOUT', '15')),
+        'del': int(os.environ.get('IKUAI_DEL_TIMEOUT', '15')),
+    },
+    # 幂等操作（login/show/edit/del）的重试策略：带抖动的指数退避
+    'max_retries': int(os.environ.get('IKUAI_MAX_RETRIES', '2')),
+    'retry_backoff': float(os.environ.get('IKUAI_RETRY_BACKOFF', '0.5')),
+    'retry_backoff_max': float(os.environ.get('IKUAI_RETRY_BACKOFF_MAX', '5')),
+    # 每台路由器在一个进程内的最大 HTTP 连接数，超出的请求排队等待（见 sync_manager/routers.py）；
+    # worker 使用 gevent / threads 执行池时按并发任务数和路由器的承受能力调大
+    'pool_maxsize': int(os.environ.get('IKUAI_POOL_MAXSIZE', '10')),
+    # 各任务的整体截止时间（秒），从任务入口一路传递到每一次分页请求
+    'deadlines': {
+        'create': int(os.environ.get('IKUAI_CREATE_DEADLINE', '120')),
+        'delete': int(os.environ.get('IKUAI_DELETE_DEADLINE', '120')),
+        'sync': int(os.environ.get('IKUAI_SYNC_DEADLINE', '480')),
+    },
+}
+
+# 多路由器注册表：名称 -> 连接配置
+# 通过 IKUAI_ROUTERS 环境变量以 JSON 配置，例如：
+# {"r1": {"base_url": "http://10.0.0.1", "username": "admin", "password": "x", "capacity": 2000},
+#  "r2": {"base_url": "http://10.0.0.2", "username": "admin", "password": "y", "capacity": 1000}}
+# capacity 为放置权重（最大承载账号数），enabled=false 的路由器不再接收新账号。
+# 未配置时使用 IKUAI_CONFIG 作为唯一的 default 路由器。
+IKUAI_ROUTERS = json.loads(os.environ['IKUAI_ROUTERS']) if os.environ.get('IKUAI_ROUTERS') else {
+    'default': {
+        'base_url': IKUAI_CONFIG['base_url'],
+        'username': IKUAI_CONFIG['username'],
+        'password': IKUAI_CONFIG['password'],
+    },
+}
+
+# 新账号放置策略
+# - least_loaded: 分配到 已用/容量 最低的路由器
+# - department: 按部门ID映射路由器（IKUAI_DEPARTMENT_ROUTERS，JSON），未映射的回退到 least_loaded
+IKUAI_PLACEMENT = {
+    'strategy': os.environ.get('IKUAI_PLACEMENT_STRATEGY', 'least_loaded'),
+    'department_routers': json.loads(os.environ.get('IKUAI_DEPARTMENT_ROUTERS', '{}')),
 }
 
 # OpenVPN Server Configuration
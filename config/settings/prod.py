@@ -33,6 +33,12 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # CSRF settings for reverse proxy
 CSRF_TRUSTED_ORIGINS = os.environ.get('CSRF_TRUSTED_ORIGINS', 'https://vpn.example.top').split(',')
 
+# collectstatic 时为文件名加内容哈希（WhiteNoise 以一年的 immutable 缓存返回），并预先生成 .gz / .br
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
 # Production logging
 LOGGING = {
     'version': 1,
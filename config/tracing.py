@@ -0,0 +1,240 @@
+"""
+OpenTelemetry tracing for views, Celery tasks and router calls.
+
+链路：视图（create_account/delete_account）-> Celery 消息头 -> 任务 -> iKuai HTTP 调用 / ORM 批量操作。
+任务 span 上记录排队时间（celery.queue_wait_seconds）以及期间的 SQL 次数和耗时，
+据此可以把一次慢创建拆分到 排队 / 登录 / add / 回查 各阶段。
+
+opentelemetry-sdk 为可选依赖（pip install network-manager[tracing]），
+未安装或 TRACING['enabled'] 为假时所有 span 都是空操作，也不会导入 opentelemetry。
+"""
+
+import contextlib
+import functools
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 消息头中记录发布时间，用于计算排队时间
+PUBLISHED_AT_HEADER = 'x-published-at'
+
+_tracer = None
+_tracer_pid = None
+_tracer_lock = threading.Lock()
+# 正在执行的任务 span：task_id -> (span, context token, ExitStack, QueryStats)
+_task_spans = {}
+
+
+def _config():
+    return getattr(settings, 'TRACING', {})
+
+
+@functools.lru_cache(maxsize=None)
+def installed():
+    """是否安装了 opentelemetry（只查找，不导入）"""
+    return importlib.util.find_spec('opentelemetry') is not None
+
+
+def enabled():
+    return bool(_config().get('enabled')) and installed()
+
+
+def _build_exporter(config):
+    exporter = config.get('exporter', 'file')
+    if exporter == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter(endpoint=config.get('endpoint') or None)
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if exporter == 'console':
+        return ConsoleSpanExporter()
+    path = str(config.get('file_path', 'traces.jsonl'))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # 每行一个 span（JSON），便于 jq 或导入到 collector
+    return ConsoleSpanExporter(
+        out=open(path, 'a', encoding='utf-8'),
+        formatter=lambda span: span.to_json(indent=None) + '\n',
+    )
+
+
+def get_tracer():
+    """
+    返回当前进程的 tracer
+
+    按 pid 懒加载：gunicorn / Celery prefork 的子进程在 fork 之后各自创建
+    TracerProvider 和导出线程。
+    """
+    global _tracer, _tracer_pid
+    pid = os.getpid()
+    if _tracer is not None and _tracer_pid == pid:
+        return _tracer
+    with _tracer_lock:
+        if _tracer is None or _tracer_pid != pid:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+
+            config = _config()
+            provider = TracerProvider(
+                resource=Resource.create({'service.name': config.get('service_name', 'network-manager')}),
+                sampler=ParentBasedTraceIdRatio(config.get('sample_ratio', 1.0)),
+            )
+            provider.add_span_processor(BatchSpanProcessor(_build_exporter(config)))
+            _tracer = provider.get_tracer('network_manager')
+            _tracer_pid = pid
+    return _tracer
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    开启一个子 span，未启用追踪时返回 None
+
+    用法:
+        with tracing.span('ikuai.login', router='r1') as s:
+            ...
+    """
+    if not enabled():
+        yield None
+        return
+    with get_tracer().start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+
+def traced(name):
+    """把整个函数包在一个 span 中的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(current, **attributes):
+    """在 span 上追加属性，current 为 None 时忽略"""
+    if current is not None:
+        current.set_attributes(_clean(attributes))
+
+
+def _clean(attributes):
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+class QueryStats:
+    """connection.execute_wrapper：统计 span 期间的 SQL 次数与耗时"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+@contextlib.contextmanager
+def db_span(name, **attributes):
+    """包裹一批 ORM 操作的 span，附带 db.query_count / db.query_seconds"""
+    if not enabled():
+        yield None
+        return
+    from django.db import connection
+
+    stats = QueryStats()
+    with span(name, **attributes) as current, connection.execute_wrapper(stats):
+        yield current
+        set_attributes(current, **{'db.query_count': stats.count, 'db.query_seconds': stats.seconds})
+
+
+# ---- Celery 上下文传播（在 config/celery.py 中连接信号） ----
+
+def inject_headers(headers, **kwargs):
+    """before_task_publish：把当前 trace 上下文和发布时间写入消息头"""
+    if headers is None:
+        return
+    headers[PUBLISHED_AT_HEADER] = time.time()
+    if enabled():
+        from opentelemetry import propagate
+
+        propagate.inject(headers)
+
+
+def _request_header(request, key):
+    """自定义消息头会合并到 task.request 上，部分版本放在 request.headers 中"""
+    value = getattr(request, key, None)
+    if value is None:
+        value = (getattr(request, 'headers', None) or {}).get(key)
+    return value
+
+
+def start_task_span(task_id=None, task=None, **kwargs):
+    """task_prerun：以消息头中的上下文为父节点开启任务 span"""
+    if not enabled() or task is None:
+        return
+    from django.db import connection
+    from opentelemetry import context as otel_context
+    from opentelemetry import propagate, trace
+
+    request = task.request
+    carrier = {key: _request_header(request, key) for key in ('traceparent', 'tracestate')}
+    parent = propagate.extract({key: value for key, value in carrier.items() if value})
+
+    attributes = {
+        'celery.task_name': task.name,
+        'celery.task_id': task_id,
+        'celery.queue': (getattr(request, 'delivery_info', None) or {}).get('routing_key'),
+        'celery.retries': getattr(request, 'retries', None),
+    }
+    published_at = _request_header(request, PUBLISHED_AT_HEADER)
+    if published_at:
+        attributes['celery.queue_wait_seconds'] = max(0.0, time.time() - float(published_at))
+
+    current = get_tracer().start_span(f'celery.task/{task.name}', context=parent, attributes=_clean(attributes))
+    token = otel_context.attach(trace.set_span_in_context(current))
+    stats = QueryStats()
+    stack = contextlib.ExitStack()
+    stack.enter_context(connection.execute_wrapper(stats))
+    _task_spans[task_id] = (current, token, stack, stats)
+
+
+def record_task_failure(task_id=None, exception=None, **kwargs):
+    """task_failure：在任务 span 上记录异常"""
+    entry = _task_spans.get(task_id)
+    if entry and exception is not None:
+        from opentelemetry.trace import Status, StatusCode
+
+        entry[0].record_exception(exception)
+        entry[0].set_status(Status(StatusCode.ERROR, str(exception)))
+
+
+def end_task_span(task_id=None, state=None, **kwargs):
+    """task_postrun：结束任务 span"""
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    from opentelemetry import context as otel_context
+
+    current, token, stack, stats = entry
+    stack.close()
+    set_attributes(current, **{
+        'celery.state': state,
+        'db.query_count': stats.count,
+        'db.query_seconds': stats.seconds,
+    })
+    current.end()
+    otel_context.detach(token)
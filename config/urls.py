@@ -21,17 +21,28 @@ from django.urls import re_path, include
 from django.views.generic import RedirectView
 from sync_manager import views as sync_views
 from config.middleware import login_exempt
+from config.metrics import metrics_view
+from config.profiling_views import profile_download_view, profiling_view
 
 
 urlpatterns = [
+    # 性能采样（需在 admin.site.urls 之前）
+    re_path(r'^admin/profiling/$', profiling_view, name='profiling'),
+    re_path(r'^admin/profiling/download/(?P<name>[^/]+)$', profile_download_view, name='profiling_download'),
     re_path(r"^admin/", admin.site.urls),
     
     # Authentication URLs
     re_path(r'^accounts/login/', login_exempt(auth_views.LoginView.as_view()), name='login'),
     re_path(r'^accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
 
+    # Prometheus metrics
+    re_path(r'^metrics$', login_exempt(metrics_view), name='metrics'),
+
     # OpenVPN Management
     re_path(r"^openvpn/", include('sync_manager.urls')),
+
+    # JSON API（服务台 / 自动化脚本）
+    re_path(r"^api/v1/", include('sync_manager.api_urls')),
     
     # Redirect root to OpenVPN dashboard
     re_path(r"^$", RedirectView.as_view(url='/openvpn/', permanent=False)),
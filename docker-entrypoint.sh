@@ -18,6 +18,10 @@ if [ "${DJANGO_ENV}" = "prod" ]; then
 fi
 
 
+# Prometheus 多进程指标目录，每次启动清空
+rm -rf /tmp/prometheus
+mkdir -p /tmp/prometheus/django /tmp/prometheus/celery-interactive /tmp/prometheus/celery-bulk
+
 echo "==================================="
 echo "Starting services..."
 echo "==================================="
@@ -2,20 +2,32 @@
 Admin configuration for sync_manager app.
 """
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
-from .models import OpenVPNAccount
+from account import search
+from account.admin import DepartmentSubtreeFilter
+from config import identity_cache
+from config.pagination import KeysetPaginationMixin
+
+from . import usage
+from .models import ConnectionRollup, DepartmentUsage, OpenVPNAccount
+
+
+class AccountDepartmentFilter(DepartmentSubtreeFilter):
+    field_prefix = 'user__profile__department__'
 
 
 @admin.register(OpenVPNAccount)
-class OpenVPNAccountAdmin(admin.ModelAdmin):
+class OpenVPNAccountAdmin(KeysetPaginationMixin, admin.ModelAdmin):
     """OpenVPN 账号管理"""
     
     list_display = [
         'username',
         'user_link',
         'status_badge',
+        'router',
         'ip_addr',
         'expires_info',
         'last_conntime',
@@ -25,7 +37,9 @@ class OpenVPNAccountAdmin(admin.ModelAdmin):
     
     list_filter = [
         'status',
+        'router',
         'enabled',
+        AccountDepartmentFilter,
         ('expires', admin.DateFieldListFilter),
         'created_at',
     ]
@@ -60,6 +74,7 @@ class OpenVPNAccountAdmin(admin.ModelAdmin):
         }),
         ('iKuai 信息', {
             'fields': (
+                'router',
                 'ikuai_id',
                 'ip_addr',
                 'ip_type',
@@ -172,6 +187,10 @@ class OpenVPNAccountAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         return qs.select_related('user')
     
+    def get_search_results(self, request, queryset, search_term):
+        """查搜索索引（account.search），索引中包含账号名和 IP"""
+        return search.search_users(queryset, search_term, 'user_id'), False
+    
     actions = ['sync_accounts', 'enable_accounts', 'disable_accounts']
     
     def sync_accounts(self, request, queryset):
@@ -181,14 +200,110 @@ class OpenVPNAccountAdmin(admin.ModelAdmin):
         self.message_user(request, '同步任务已提交')
     sync_accounts.short_description = '同步账号状态'
     
+    def _update_accounts(self, queryset, **values):
+        """批量更新并计入部门汇总，事务提交后投递一个路由器回写任务（与 API 的批量操作相同）"""
+        from .tasks import push_account_changes
+
+        account_ids = list(queryset.values_list('pk', flat=True))
+        count, user_ids = usage.update(queryset.model.objects.filter(pk__in=account_ids), **values)
+        identity_cache.invalidate_users(user_ids)
+        if account_ids:
+            transaction.on_commit(lambda: push_account_changes.delay(account_ids))
+        return count
+
     def enable_accounts(self, request, queryset):
         """启用账号"""
-        count = queryset.update(enabled=True)
-        self.message_user(request, f'已启用 {count} 个账号')
+        count = self._update_accounts(queryset, enabled=True)
+        self.message_user(request, f'已启用 {count} 个账号，正在写回路由器')
     enable_accounts.short_description = '启用选中的账号'
     
     def disable_accounts(self, request, queryset):
         """禁用账号"""
-        count = queryset.update(enabled=False, status='disabled')
-        self.message_user(request, f'已禁用 {count} 个账号')
+        count = self._update_accounts(queryset, enabled=False, status='disabled')
+        self.message_user(request, f'已禁用 {count} 个账号，正在写回路由器')
     disable_accounts.short_description = '禁用选中的账号'
+
+
+@admin.register(ConnectionRollup)
+class ConnectionRollupAdmin(admin.ModelAdmin):
+    """连接历史汇总（只读，由 rollup_connection_history 维护）"""
+
+    list_display = [
+        'bucket',
+        'granularity',
+        'router',
+        'sessions',
+        'active_accounts',
+        'online_hours',
+        'events',
+    ]
+
+    list_filter = [
+        'granularity',
+        'router',
+    ]
+
+    date_hierarchy = 'bucket'
+
+    def online_hours(self, obj):
+        """在线时长（小时）"""
+        return round(obj.online_seconds / 3600, 1)
+    online_hours.short_description = '在线时长（小时）'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DepartmentUsage)
+class DepartmentUsageAdmin(admin.ModelAdmin):
+    """部门使用情况（只读，由同步和账号变更增量维护）"""
+
+    list_display = [
+        'department_name',
+        'accounts',
+        'active_accounts',
+        'online_hours',
+        'packages',
+        'expiring_soon',
+        'updated_at',
+    ]
+
+    list_select_related = ['department']
+
+    search_fields = ['department__name']
+
+    actions = ['rebuild_usage']
+
+    def department_name(self, obj):
+        """部门"""
+        return obj.department.name if obj.department else '未分配部门'
+    department_name.short_description = '部门'
+    department_name.admin_order_field = 'department__name'
+
+    def online_hours(self, obj):
+        """在线时长（小时）"""
+        return round(obj.online_seconds / 3600, 1)
+    online_hours.short_description = '在线时长（小时）'
+    online_hours.admin_order_field = 'online_seconds'
+
+    def rebuild_usage(self, request, queryset):
+        """全量重算"""
+        from .tasks import rebuild_department_usage
+        rebuild_department_usage.delay()
+        self.message_user(request, '重算任务已提交')
+    rebuild_usage.short_description = '全量重算部门使用情况'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
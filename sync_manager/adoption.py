@@ -0,0 +1,171 @@
+"""
+Bulk adoption of pppusers that already exist on the routers.
+
+接入本系统之前路由器上已有的 pppuser 没有对应的 OpenVPNAccount，定时同步不会管理它们。
+adopt() 读取每台路由器的快照（每台只拉取一次），与本地用户做内存中的哈希连接：
+
+- 依次用 pppuser 的 username、name、comment 匹配 User.username（不区分大小写）、
+  UserProfile.employee_number 和姓名（first_name）；comment 整体匹配不上时再按分隔符拆词匹配
+- 匹配上的建立 OpenVPNAccount（字段取自路由器记录，bulk_create），并更新部门汇总和搜索索引
+- 匹配不上或有冲突的行原样列出，供人工处理
+
+查询数与 pppuser 数量无关：用户、已有账号各读一次，写入按 batch_size 分批。
+"""
+
+import logging
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from config import identity_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# 未收编的原因
+REASONS = {
+    'no_match': '没有匹配的用户',
+    'ambiguous': '匹配到多个用户',
+    'user_has_account': '用户已有 VPN 账号',
+    'duplicate': '用户已被另一条 pppuser 匹配',
+    'username_taken': 'VPN 账号名已被其他路由器的账号使用',
+}
+
+# comment 拆词的分隔符，例如 "Created for user: bob"、"张三/1024"
+_SEPARATORS = re.compile(r'[\s,;:，；：、/|()（）]+')
+
+
+def _tokens(value):
+    return [token for token in _SEPARATORS.split(value or '') if len(token) > 1]
+
+
+class UserIndex:
+    """本地用户的哈希索引，一条查询读入：{键: user_id 集合}"""
+
+    def __init__(self):
+        from django.contrib.auth.models import User
+
+        self.usernames = defaultdict(set)
+        self.employee_numbers = defaultdict(set)
+        self.names = defaultdict(set)
+        self.with_account = set()
+        rows = User.objects.values_list('pk', 'username', 'first_name', 'profile__employee_number', 'openvpn_account__id')
+        for pk, username, name, employee_number, account_id in rows:
+            self.usernames[username.lower()].add(pk)
+            if employee_number:
+                self.employee_numbers[employee_number.strip()].add(pk)
+            if name:
+                self.names[name.strip()].add(pk)
+            if account_id is not None:
+                self.with_account.add(pk)
+
+    def lookup(self, value):
+        """value 命中的 user_id 集合：用户名优先，其次员工编号，最后姓名"""
+        key = (value or '').strip()
+        if not key:
+            return set()
+        return self.usernames.get(key.lower()) or self.employee_numbers.get(key) or self.names.get(key) or set()
+
+    def match(self, record):
+        """返回 (user_id, 匹配依据) 或 (None, 未匹配原因)"""
+        steps = (
+            ('username', [record.username]),
+            ('name', [record.name]),
+            ('comment', [record.comment]),
+            ('comment', _tokens(record.comment)),
+        )
+        for source, values in steps:
+            user_ids = set()
+            for value in values:
+                user_ids |= self.lookup(value)
+            if len(user_ids) == 1:
+                return user_ids.pop(), source
+            if user_ids:
+                return None, 'ambiguous'
+        return None, 'no_match'
+
+
+def _unmatched(router, record, reason):
+    return {
+        'router': router,
+        'ikuai_id': record.id,
+        'username': record.username,
+        'name': record.name,
+        'comment': record.comment,
+        'reason': reason,
+    }
+
+
+def adopt(snapshots, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    收编 snapshots（{路由器: {username: PPPUserRecord}}）中本地还没有的 pppuser
+
+    返回 {'adopted', 'already_linked', 'matched_by', 'unmatched'}；
+    dry_run 为 True 时只匹配不写入。
+    """
+    from account import search
+    from sync_manager import usage
+    from sync_manager.models import OpenVPNAccount
+
+    index = UserIndex()
+    # VPN 账号名全局唯一：{username: router}
+    owners = dict(OpenVPNAccount.objects.values_list('username', 'router'))
+    tz = timezone.get_current_timezone()
+
+    accounts = []
+    unmatched = []
+    matched_by = Counter()
+    claimed = set()
+    already_linked = 0
+    for router, snapshot in snapshots.items():
+        for record in sorted(snapshot.values(), key=lambda record: record.id):
+            owner = owners.get(record.username)
+            if owner == router:
+                already_linked += 1
+                continue
+            if owner is not None:
+                unmatched.append(_unmatched(router, record, 'username_taken'))
+                continue
+            user_id, source = index.match(record)
+            if user_id is None:
+                unmatched.append(_unmatched(router, record, source))
+                continue
+            if user_id in index.with_account:
+                unmatched.append(_unmatched(router, record, 'user_has_account'))
+                continue
+            if user_id in claimed:
+                unmatched.append(_unmatched(router, record, 'duplicate'))
+                continue
+
+            account = OpenVPNAccount(user_id=user_id, router=router, username=record.username, password=record.passwd)
+            account.update_from_ikuai_data(record, tz)
+            accounts.append(account)
+            claimed.add(user_id)
+            owners[record.username] = router
+            matched_by[source] += 1
+
+    if accounts and not dry_run:
+        user_ids = [account.user_id for account in accounts]
+        with transaction.atomic():
+            OpenVPNAccount.objects.bulk_create(accounts, batch_size=batch_size)
+            # bulk_create 不触发 post_save
+            changes = usage.Changes()
+            for account in accounts:
+                changes.saved(account, created=True)
+            changes.apply()
+            search.mark(user_ids)
+        identity_cache.invalidate_users(user_ids)
+
+    logger.info(
+        f'{"Matched" if dry_run else "Adopted"} {len(accounts)} router accounts '
+        f'({dict(matched_by)}), {len(unmatched)} unmatched, {already_linked} already linked'
+    )
+    return {
+        'adopted': len(accounts),
+        'already_linked': already_linked,
+        'matched_by': dict(matched_by),
+        'unmatched': unmatched,
+    }
@@ -0,0 +1,390 @@
+"""
+Versioned JSON API (/api/v1/) over VPN accounts, users and departments.
+
+供服务台和自动化脚本使用（需要管理员登录），替代抓取后台页面：
+
+- 列表: GET accounts/ users/ departments/，按主键做 keyset 游标分页（limit / after，
+  返回 next 游标），支持 fields=a,b,c 指定返回字段
+- 稀疏字段: 只查询请求的列（only），只 JOIN 请求字段需要的表（select_related）；
+  加密的 password 不在默认字段中，显式请求且有修改权限时才读取和解密
+- 批量: POST accounts/status|enable|disable|renew，请求体 {"users": [用户名, ...]}，
+  查询数与人数无关；写操作在事务提交后投递一个 push_account_changes 任务写回路由器
+- 导出: GET export/<资源>.csv|ndjson，流式输出（见 sync_manager/export.py）
+"""
+
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Case, DateTimeField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from account import search
+from account.models import Department
+from config import identity_cache
+from config.middleware import login_exempt
+from config.pagination import CURSOR_VAR, keyset_ordering, keyset_page
+
+from . import usage
+from .models import OpenVPNAccount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# 批量接口单次最多的用户数
+BULK_LIMIT = 1000
+# 读取需要修改权限的字段
+SENSITIVE_FIELDS = {'password'}
+CHANGE_PERMISSION = 'sync_manager.change_openvpnaccount'
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# 返回字段 -> ORM 路径；路径中带 __ 的字段需要 JOIN，不在默认字段中
+ACCOUNT_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'password': 'password',
+    'status': 'status',
+    'enabled': 'enabled',
+    'router': 'router',
+    'ip_addr': 'ip_addr',
+    'expires': 'expires',
+    'last_conntime': 'last_conntime',
+    'duration': 'duration',
+    'packages': 'packages',
+    'created_at': 'created_at',
+    'user_id': 'user_id',
+    'user': 'user__username',
+    'name': 'user__first_name',
+    'email': 'user__email',
+    'department_id': 'user__profile__department_id',
+    'department': 'user__profile__department__name',
+}
+
+USER_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'name': 'first_name',
+    'email': 'email',
+    'is_active': 'is_active',
+    'is_staff': 'is_staff',
+    'date_joined': 'date_joined',
+    'last_login': 'last_login',
+    'employee_number': 'profile__employee_number',
+    'department_id': 'profile__department_id',
+    'department': 'profile__department__name',
+    'vpn_username': 'openvpn_account__username',
+    'vpn_status': 'openvpn_account__status',
+    'vpn_expires': 'openvpn_account__expires',
+}
+
+DEPARTMENT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'parent_id': 'parent_id',
+    'path': 'path',
+    'depth': 'depth',
+    'parent': 'parent__name',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+def api_view(methods):
+    """管理员才能访问；未登录返回 401 而不是重定向到登录页，APIError 转为 JSON 错误"""
+    def decorator(view):
+        @login_exempt
+        @require_http_methods(methods)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'success': False, 'message': '未登录'}, status=401)
+            if not request.user.is_staff:
+                return JsonResponse({'success': False, 'message': '无权限'}, status=403)
+            try:
+                return view(request, *args, **kwargs)
+            except APIError as e:
+                return JsonResponse({'success': False, 'message': str(e)}, status=e.status)
+        return wrapper
+    return decorator
+
+
+# ---- 字段 ----
+
+def requested_fields(request, available):
+    """解析 fields 参数；缺省为不需要 JOIN 的非敏感字段"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return [name for name, path in available.items() if '__' not in path and name not in SENSITIVE_FIELDS]
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise APIError(f'未知字段: {", ".join(unknown)}')
+    if SENSITIVE_FIELDS.intersection(names) and not request.user.has_perm(CHANGE_PERMISSION):
+        raise APIError('无权读取敏感字段', status=403)
+    return names
+
+
+def plan(queryset, available, names):
+    """按请求的字段决定 select_related 和 only，未请求的列（包括加密的密码）不读取"""
+    paths = [available[name] for name in names]
+    related = {path.rpartition('__')[0] for path in paths if '__' in path}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only('pk', *paths)
+
+
+def _resolve(obj, path):
+    for part in path.split('__'):
+        try:
+            obj = getattr(obj, part)
+        except ObjectDoesNotExist:
+            # 反向一对一（如用户没有 profile）
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def serialize(objects, available, names):
+    return [{name: _resolve(obj, available[name]) for name in names} for obj in objects]
+
+
+# ---- 列表 ----
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise APIError('limit 必须是整数')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _department(request, prefix):
+    """department=<部门ID>：部门及全部下级部门"""
+    value = request.GET.get('department')
+    if not value:
+        return None
+    try:
+        department = Department.objects.only('path').get(pk=int(value))
+    except (ValueError, Department.DoesNotExist):
+        raise APIError(f'部门不存在: {value}', status=404)
+    return department.subtree_q(prefix)
+
+
+def paginate(request, queryset, available):
+    """按主键游标分页，返回 JSON 响应"""
+    names = requested_fields(request, available)
+    queryset = plan(queryset, available, names).order_by('pk')
+    ordering = keyset_ordering(queryset)
+    objects, next_cursor = keyset_page(queryset, ordering, request.GET.get(CURSOR_VAR), _limit(request))
+    return JsonResponse({
+        'success': True,
+        'results': serialize(objects, available, names),
+        'next': next_cursor,
+    })
+
+
+def account_queryset(request):
+    """VPN 账号：status / router / q（搜索索引）/ department 过滤"""
+    queryset = OpenVPNAccount.objects.all()
+    for name in ('status', 'router'):
+        if request.GET.get(name):
+            queryset = queryset.filter(**{name: request.GET[name]})
+    if request.GET.get('q'):
+        queryset = search.search_users(queryset, request.GET['q'], 'user_id')
+    subtree = _department(request, 'user__profile__department__')
+    if subtree is not None:
+        queryset = queryset.filter(subtree)
+    return queryset
+
+
+def user_queryset(request):
+    """用户：is_active / q（搜索索引）/ department 过滤"""
+    queryset = User.objects.all()
+    if request.GET.get('is_active'):
+        queryset = queryset.filter(is_active=request.GET['is_active'].lower() in ('1', 'true', 'yes'))
+    if request.GET.get('q'):
+        queryset = search.search_users(queryset, request.GET['q'])
+    subtree = _department(request, 'profile__department__')
+    if subtree is not None:
+        queryset = queryset.filter(subtree)
+    return queryset
+
+
+def department_queryset(request):
+    """部门：parent（上级部门ID，0 表示一级部门）/ q 过滤"""
+    queryset = Department.objects.all()
+    parent = request.GET.get('parent')
+    if parent:
+        if not parent.isdigit():
+            raise APIError('parent 必须是部门ID')
+        queryset = queryset.filter(parent_id=int(parent) or None)
+    if request.GET.get('q'):
+        queryset = search.search_departments(queryset, request.GET['q'])
+    return queryset
+
+
+# 资源名 -> (模型, 按请求参数过滤的 queryset, 字段)
+RESOURCES = {
+    'accounts': (OpenVPNAccount, account_queryset, ACCOUNT_FIELDS),
+    'users': (User, user_queryset, USER_FIELDS),
+    'departments': (Department, department_queryset, DEPARTMENT_FIELDS),
+}
+
+
+@api_view(['GET'])
+def accounts(request):
+    return paginate(request, account_queryset(request), ACCOUNT_FIELDS)
+
+
+@api_view(['GET'])
+def users(request):
+    return paginate(request, user_queryset(request), USER_FIELDS)
+
+
+@api_view(['GET'])
+def departments(request):
+    return paginate(request, department_queryset(request), DEPARTMENT_FIELDS)
+
+
+@api_view(['GET'])
+def export(request, resource, fmt):
+    """
+    流式导出（CSV / NDJSON），过滤参数和 fields 与列表接口相同；gzip=1 时下载 .gz 文件
+
+    按主键分批查询，边查边写，内存占用与行数无关（见 sync_manager/export.py）。
+    """
+    from . import export as exporter
+
+    if resource not in RESOURCES or fmt not in exporter.FORMATS:
+        raise APIError(f'不支持的导出: {resource}.{fmt}', status=404)
+    model, build_queryset, available = RESOURCES[resource]
+    names = requested_fields(request, available)
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+    response = StreamingHttpResponse(
+        exporter.stream(build_queryset(request), available, names, fmt, compress),
+        content_type='application/gzip' if compress else exporter.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exporter.filename(resource, fmt, compress)}"'
+    return response
+
+
+# ---- 批量 ----
+
+def _bulk_usernames(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        raise APIError('请求体不是合法的 JSON')
+    usernames = body.get('users') if isinstance(body, dict) else None
+    if not isinstance(usernames, list) or not all(isinstance(name, str) for name in usernames):
+        raise APIError('users 必须是用户名列表')
+    if len(usernames) > BULK_LIMIT:
+        raise APIError(f'单次最多 {BULK_LIMIT} 个用户')
+    return body, list(dict.fromkeys(usernames))
+
+
+def _bulk_accounts(usernames, statuses=None):
+    """一条查询取出账号，返回 ({用户名: 账号ID}, 未找到的用户名, 状态不符的用户名)"""
+    found = {}
+    skipped = []
+    rows = OpenVPNAccount.objects.filter(user__username__in=usernames).values_list('pk', 'user__username', 'status')
+    for pk, username, status in rows:
+        if statuses is not None and status not in statuses:
+            skipped.append(username)
+        else:
+            found[username] = pk
+    missing = [name for name in usernames if name not in found and name not in skipped]
+    return found, missing, skipped
+
+
+def _bulk_update(usernames, values, statuses=None):
+    """批量更新并计入部门汇总，事务提交后投递一个路由器回写任务"""
+    from .tasks import push_account_changes
+
+    found, missing, skipped = _bulk_accounts(usernames, statuses)
+    account_ids = list(found.values())
+    count = 0
+    if account_ids:
+        with transaction.atomic():
+            count, user_ids = usage.update(OpenVPNAccount.objects.filter(pk__in=account_ids), **values)
+        identity_cache.invalidate_users(user_ids)
+        transaction.on_commit(lambda: push_account_changes.delay(account_ids))
+    return JsonResponse({
+        'success': True,
+        'updated': count,
+        'missing': missing,
+        'skipped': skipped,
+    })
+
+
+def _require_change_permission(request):
+    if not request.user.has_perm(CHANGE_PERMISSION):
+        raise APIError('无权修改账号', status=403)
+
+
+@api_view(['POST'])
+def accounts_status(request):
+    """多个用户的账号状态（一条查询），支持 fields"""
+    body, usernames = _bulk_usernames(request)
+    names = requested_fields(request, ACCOUNT_FIELDS)
+    # 结果按用户名返回，总是带上 user__username
+    objects = list(plan(OpenVPNAccount.objects.filter(user__username__in=usernames), ACCOUNT_FIELDS, [*names, 'user']))
+    results = {account.user.username: row for account, row in zip(objects, serialize(objects, ACCOUNT_FIELDS, names))}
+    return JsonResponse({
+        'success': True,
+        'accounts': results,
+        'missing': [name for name in usernames if name not in results],
+    })
+
+
+@api_view(['POST'])
+def accounts_enable(request):
+    """批量启用；已禁用的账号恢复为正常（过期的由 check_expired_accounts 再标记）"""
+    _require_change_permission(request)
+    body, usernames = _bulk_usernames(request)
+    return _bulk_update(usernames, {
+        'enabled': True,
+        'status': Case(When(status='disabled', then=Value('active')), default=F('status')),
+    })
+
+
+@api_view(['POST'])
+def accounts_disable(request):
+    """批量禁用"""
+    _require_change_permission(request)
+    body, usernames = _bulk_usernames(request)
+    return _bulk_update(usernames, {'enabled': False, 'status': 'disabled'})
+
+
+@api_view(['POST'])
+def accounts_renew(request):
+    """批量续期 days 天（默认 30）：从当前过期时间或现在起延长，与个人续期的规则一致"""
+    _require_change_permission(request)
+    body, usernames = _bulk_usernames(request)
+    days = body.get('days', 30)
+    if not isinstance(days, int) or isinstance(days, bool) or not 0 < days <= 3650:
+        raise APIError('days 必须是 1~3650 的整数')
+    now = timezone.now()
+    expires = ExpressionWrapper(
+        Greatest(Coalesce(F('expires'), Value(now)), Value(now)) + Value(timedelta(days=days)),
+        output_field=DateTimeField(),
+    )
+    return _bulk_update(usernames, {
+        'expires': expires,
+        'status': Case(When(status='expired', then=Value('active')), default=F('status')),
+    }, statuses={'active', 'expired'})
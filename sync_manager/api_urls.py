@@ -0,0 +1,20 @@
+"""
+URL configuration for the /api/v1/ JSON API (see sync_manager/api.py).
+"""
+
+from django.urls import path
+
+from . import api
+
+app_name = 'api_v1'
+
+urlpatterns = [
+    path('accounts/', api.accounts, name='accounts'),
+    path('accounts/status/', api.accounts_status, name='accounts_status'),
+    path('accounts/enable/', api.accounts_enable, name='accounts_enable'),
+    path('accounts/disable/', api.accounts_disable, name='accounts_disable'),
+    path('accounts/renew/', api.accounts_renew, name='accounts_renew'),
+    path('users/', api.users, name='users'),
+    path('departments/', api.departments, name='departments'),
+    path('export/<str:resource>.<str:fmt>', api.export, name='export'),
+]
@@ -9,3 +9,14 @@ class SyncManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sync_manager'
     verbose_name = '应用管理'
+
+    def ready(self):
+        # 账号、用户、档案变更时使身份缓存失效
+        from config import identity_cache
+        from sync_manager import passwords, usage
+
+        identity_cache.connect_signals()
+        # 账号保存 / 删除时增量更新部门汇总
+        usage.connect_signals()
+        # LDAP 密码变化后写回路由器
+        passwords.connect_signals()
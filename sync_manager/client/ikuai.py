@@ -1,187 +1,226 @@
 import base64
 from copy import deepcopy
+import functools
 from datetime import datetime, timedelta
 import hashlib
-from pydantic import BaseModel, Field
-import requests
-import urllib3
-from cachetools import TTLCache
-from cachetools import cached
+import random
+import threading
+import time
 import logging
+from typing import TYPE_CHECKING
 from django.utils import timezone as django_timezone
+from config import metrics, tracing
+from sync_manager.client.records import PPPUserRecord
+
+if TYPE_CHECKING:
+    from sync_manager.client.schemas import EditPPPUserRequestData
+
+# requests、pydantic、cachetools 导入较慢，在首次使用时才导入，
+# 不拖慢 gunicorn / Celery worker 和 manage.py 的启动
 
 logger = logging.getLogger(__name__)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-class AddPPPUserRequestData(BaseModel):
+
+# 各类操作的默认超时预算（秒），可通过 IKUAI_CONFIG['timeouts'] 覆盖
+DEFAULT_TIMEOUTS = {
+    'login': 10,
+    'add': 15,
+    'show': 20,
+    'edit': 15,
+    'del': 15,
+}
+
+# 可以安全重试的操作：重复执行不会产生额外副作用
+IDEMPOTENT_ACTIONS = frozenset({'login', 'show', 'edit', 'del'})
+
+
+def new_session():
+    """新建 HTTP 会话（路由器多为自签名证书，关闭证书告警）"""
+    import requests
+    import urllib3
+
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return requests.Session()
+
+
+def counted_cache(name, maxsize, ttl):
     """
-        添加 PPP 用户请求数据模型
-        
-        数据示例：
-        {
-            "username": "test",
-            "passwd": "123456112",
-            "enabled": "yes",
-            "ppptype": "any",
-            "bind_ifname": "any",
-            "share": "999",
-            "auto_mac": "1",
-            "upload": 0,
-            "download": 0,
-            "bind_vlanid": 0,
-            "packages": 0,
-            "comment": "xxxa1",
-            "auto_vlanid": 1,
-            "ip_addr": "",
-            "mac": "",
-            "address": "",
-            "name": "xxx",
-            "phone": "",
-            "cardid": "",
-            "ip_type": 0,
-            "pppoev6_wan": "",
-            "start_time": 1762614055,
-            "create_time": "",
-            "expires": 1763132476
-        }
+    与 cachetools.cached(TTLCache(maxsize, ttl)) 相同，另外按命中/未命中记录到 cache_requests_total
+
+    缓存在首次调用时创建。TTLCache 本身不是线程安全的，读写都加锁，
+    threads / gevent / eventlet 池中并发的任务可以共用（gevent 打补丁后锁不会阻塞事件循环）。
     """
-    # 必填字段
-    username: str = Field(description="用户名")
-    passwd: str = Field(description="密码")
-    
-    # 启用状态
-    enabled: str = Field(default="yes", description="启用状态：yes 或 no")
-    
-    # 时间相关字段（Unix 时间戳）
-    start_time: int = Field(description="开始时间（Unix 时间戳）", default_factory=lambda: int(django_timezone.now().timestamp()))
-    expires: int = Field(default=0, description="过期时间（Unix 时间戳），0为不过期")
-    create_time: str = Field(default="", description="创建时间")
-    
-    # 连接配置
-    ppptype: str = Field(default="any", description="PPP 类型")
-    bind_ifname: str = Field(default="any", description="绑定接口")
-    bind_vlanid: int | str = Field(default=0, description="绑定 VLAN ID")
-    auto_vlanid: int = Field(default=1, description="自动 VLAN")
-    pppoev6_wan: str = Field(default="", description="PPPoE IPv6 WAN")
-    
-    # IP 和 MAC 配置
-    ip_type: int = Field(default=0, description="IP 类型（0=自动）")
-    ip_addr: str = Field(default="", description="IP 地址")
-    mac: str = Field(default="", description="MAC 地址")
-    auto_mac: int | str = Field(default=1, description="自动 MAC")
-    
-    # 限制配置
-    share: int | str = Field(default=999, description="共享连接数")
-    upload: int = Field(default=0, description="上传限速（KB/s）")
-    download: int = Field(default=0, description="下载限速（KB/s）")
-    packages: int = Field(default=0, description="流量包（字节）")
-    
-    # 用户信息
-    name: str = Field(default="", description="姓名/名称")
-    phone: str = Field(default="", description="电话")
-    address: str = Field(default="", description="地址")
-    comment: str = Field(default="openvpn创建", description="备注")
-    
-    # 其他字段
-    cardid: str = Field(default="", description="卡号")
+    def decorator(func):
+        state = {}
+        init_lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not state:
+                with init_lock:
+                    if not state:
+                        from cachetools import TTLCache, cached
+                        from cachetools.keys import hashkey
+
+                        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+                        lock = threading.RLock()
+                        state.update(cache=cache, key=hashkey, lock=lock,
+                                     func=cached(cache, key=hashkey, lock=lock)(func))
+            with state['lock']:
+                hit = state['key'](*args, **kwargs) in state['cache']
+            metrics.record_cache(name, hit)
+            return state['func'](*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class IKuaiError(Exception):
+    """iKuai API 调用失败"""
+
 
+class IKuaiTimeoutError(IKuaiError):
+    """iKuai API 调用超时，或已超出整体截止时间"""
 
-class EditPPPUserRequestData(BaseModel):
+
+class Deadline:
     """
-        编辑 PPP 用户请求数据模型
-
-        数据示例：
-        {
-            "passwd": "test123456",
-            "duration": -25412,
-            "expires": 1762627484,
-            "start_time": 1762541072,
-            "create_time": 1762541096,
-            "ppptype": "any",
-            "cardid": "",
-            "pppname": "",
-            "last_offtime": 1762586779,
-            "share": 1,
-            "auto_mac": 1,
-            "upload": 0,
-            "download": 0,
-            "ip_type": 0,
-            "ip_addr": "10.100.250.5",
-            "mac": "",
-            "address": "",
-            "name": "XXX",
-            "last_conntime": 0,
-            "phone": "",
-            "packages": 0,
-            "proxy_username": "",
-            "pppoev6_wan": "",
-            "auto_vlanid": 1,
-            "bind_vlanid": "0",
-            "bind_ifname": "any",
-            "id": 2,
-            "enabled": "yes",
-            "comment": "remark",
-            "username": "test"
-        }
+    整体截止时间
+
+    在任务入口创建，随客户端一路传递到每一次 HTTP 调用（包括分页拉取），
+    单次调用的超时取「操作预算」与「剩余时间」中的较小值。
     """
-    # 必填字段
-    id: int = Field(description="账号ID")
-    username: str = Field(description="用户名")
-    passwd: str = Field(description="密码")
-    expires: int = Field(description="过期时间（Unix 时间戳），0为不过期",default=0)
-    start_time: int = Field(description="开始时间（Unix 时间戳）",default_factory=lambda: int(django_timezone.now().timestamp()))
-    
-    # 启用状态
-    enabled: str = Field(default="yes", description="启用状态：yes 或 no")
-    
-    # 时间相关字段（Unix 时间戳）
-    create_time: int = Field(default=0, description="创建时间")
-    last_conntime: int = Field(default=0, description="最后连接时间")
-    last_offtime: int = Field(default=0, description="最后离线时间")
-    duration: int = Field(default=0, description="在线时长（秒）")
-    
-    # 连接配置
-    ppptype: str = Field(default="any", description="PPP 类型")
-    pppname: str = Field(default="", description="PPP 名称")
-    bind_ifname: str = Field(default="any", description="绑定接口")
-    bind_vlanid: str = Field(default="0", description="绑定 VLAN ID")
-    auto_vlanid: int = Field(default=1, description="自动 VLAN")
-    pppoev6_wan: str = Field(default="", description="PPPoE IPv6 WAN")
-    
-    # IP 和 MAC 配置
-    ip_type: int = Field(default=0, description="IP 类型（0=自动）")
-    ip_addr: str = Field(default="", description="IP 地址")
-    mac: str = Field(default="", description="MAC 地址")
-    auto_mac: int = Field(default=1, description="自动 MAC")
-    
-    # 限制配置
-    share: int = Field(default=999, description="共享连接数")
-    upload: int = Field(default=0, description="上传限速（KB/s）")
-    download: int = Field(default=0, description="下载限速（KB/s）")
-    packages: int = Field(default=0, description="流量包（字节）")
-    
-    # 用户信息
-    name: str = Field(default="", description="姓名/名称")
-    phone: str = Field(default="", description="电话")
-    address: str = Field(default="", description="地址")
-    comment: str = Field(default="openvpn创建", description="备注")
-    
-    # 其他字段
-    cardid: str = Field(default="", description="卡号")
-    proxy_username: str = Field(default="", description="代理用户名")
 
-    
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        """剩余秒数，未设置截止时间返回 None"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, budget):
+        """计算本次调用可用的超时时间，已超时则抛出 IKuaiTimeoutError"""
+        remaining = self.remaining()
+        if remaining is None:
+            return budget
+        if remaining <= 0:
+            raise IKuaiTimeoutError('Deadline exceeded before calling iKuai')
+        return min(budget, remaining)
+
 
 class IKuaiAPIClient:
     """iKuai API 客户端"""
     FIXED_SALT = "salt_11"
     
-    def __init__(self, base_url, username, password):
+    def __init__(self, base_url, username, password, timeouts=None, max_retries=2,
+                 retry_backoff=0.5, retry_backoff_max=5, deadline=None, session=None, name='default'):
+        """
+        Args:
+            base_url: iKuai 管理地址
+            username: 管理员用户名
+            password: 管理员密码
+            timeouts: 各操作的超时预算（秒），按 action 覆盖 DEFAULT_TIMEOUTS
+            max_retries: 幂等操作的最大重试次数
+            retry_backoff: 指数退避的基准间隔（秒）
+            retry_backoff_max: 单次退避的上限（秒）
+            deadline: 整体截止时间（Deadline），为空则不限制
+            session: 复用的 requests.Session，为空则新建
+            name: 路由器名称，用作指标标签
+        """
         self.base_url = base_url.rstrip('/')
         self.LOGIN_URL = f"{self.base_url}/Action/login"
+        self.CALL_URL = f"{self.base_url}/Action/call"
         self.username = username
         self.password = password
-        self.session = requests.Session()
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.deadline = deadline or Deadline()
+        self.session = session or new_session()
+        self.name = name
+
+    def _backoff(self, attempt, action):
+        """带抖动的指数退避（full jitter），不会超过剩余截止时间"""
+        delay = random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * (2 ** attempt)))
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            if remaining <= delay:
+                metrics.IKUAI_TIMEOUTS.labels(self.name, action).inc()
+                raise IKuaiTimeoutError('Deadline exceeded while waiting to retry iKuai call')
+            delay = min(delay, remaining)
+        time.sleep(delay)
+
+    def _post(self, url, payload, action, func_name=''):
+        """
+        发送请求到 iKuai
+
+        超时取操作预算与整体截止时间剩余量的较小值；幂等操作在超时、
+        连接错误和 5xx 时按带抖动的指数退避重试。
+        """
+        import requests
+
+        retries = self.max_retries if action in IDEMPOTENT_ACTIONS else 0
+        attempt = 0
+        while True:
+            try:
+                timeout = self.deadline.timeout(self.timeouts.get(action, DEFAULT_TIMEOUTS['show']))
+            except IKuaiTimeoutError:
+                metrics.IKUAI_TIMEOUTS.labels(self.name, action).inc()
+                raise
+            started = time.perf_counter()
+            with tracing.span(f'ikuai.{action}', **{
+                'ikuai.router': self.name,
+                'ikuai.action': action,
+                'ikuai.func_name': func_name,
+                'ikuai.attempt': attempt,
+                'http.timeout': timeout,
+            }) as current:
+                try:
+                    response = self.session.post(url, json=payload, verify=False, timeout=timeout)
+                    tracing.set_attributes(current, **{'http.status_code': response.status_code})
+                    response.raise_for_status()
+                    return response.json()
+                except requests.Timeout as e:
+                    metrics.IKUAI_TIMEOUTS.labels(self.name, action).inc()
+                    error = IKuaiTimeoutError(f'iKuai {action} timed out after {timeout:.1f}s')
+                    error.__cause__ = e
+                except requests.ConnectionError as e:
+                    error = e
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code < 500:
+                        metrics.IKUAI_CALL_ERRORS.labels(self.name, action, 'http').inc()
+                        raise
+                    error = e
+                finally:
+                    metrics.IKUAI_CALL_SECONDS.labels(self.name, action, func_name).observe(time.perf_counter() - started)
+                tracing.set_attributes(current, error=type(error).__name__)
+
+            metrics.IKUAI_CALL_ERRORS.labels(self.name, action, type(error).__name__).inc()
+            if attempt >= retries:
+                raise error
+            attempt += 1
+            metrics.IKUAI_RETRIES.labels(self.name, action).inc()
+            logger.warning(f'iKuai {action} failed ({error}), retrying ({attempt}/{retries})')
+            self._backoff(attempt, action)
+
+    def _call(self, action, func_name, param):
+        """调用 /Action/call 接口，返回解析后的 JSON"""
+        return self._post(
+            self.CALL_URL,
+            {
+                'action': action,
+                'func_name': func_name,
+                'param': param,
+            },
+            action,
+            func_name,
+        )
     
     def login(self):
         """登录 iKuai 系统获取 token"""
@@ -200,20 +239,25 @@ class IKuaiAPIClient:
             self.session.cookies.set("username", self.username)
             self.session.cookies.set("sess_key", "")
             payload = self.build_payload(self.username, self.password)
-            response = self.session.post(self.LOGIN_URL, json=payload, verify=False, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._post(self.LOGIN_URL, payload, 'login', 'login')
             
             if data.get('Result') == 10000:
+                metrics.IKUAI_LOGINS.labels(self.name, 'success').inc()
                 logger.info('Successfully logged in to iKuai')
                 return True
             else:
+                metrics.IKUAI_LOGINS.labels(self.name, 'rejected').inc()
                 logger.error(f'iKuai login failed: {data.get("ErrMsg")}')
                 return False
+        except IKuaiTimeoutError:
+            metrics.IKUAI_LOGINS.labels(self.name, 'error').inc()
+            raise
         except Exception as e:
+            metrics.IKUAI_LOGINS.labels(self.name, 'error').inc()
             logger.error(f'iKuai login error: {str(e)}')
             return False
 
+    @tracing.traced('ikuai.client.create_account')
     def create_account(self, username, password, expires_days=30, **kwargs) -> int:
         """
         创建 OpenVPN 账号
@@ -225,11 +269,13 @@ class IKuaiAPIClient:
             **kwargs: 其他可选参数
         """
         if not self.login():
-            raise Exception('Failed to login to iKuai')
+            raise IKuaiError('Failed to login to iKuai')
         
         now = int(django_timezone.now().timestamp())
         expires = int((django_timezone.now() + timedelta(days=expires_days)).timestamp()) if expires_days > 0 else 0
         
+        from sync_manager.client.schemas import AddPPPUserRequestData
+
         # 使用 Pydantic 模型构建数据
         request_data = AddPPPUserRequestData(
             username=username,
@@ -251,16 +297,8 @@ class IKuaiAPIClient:
         data = request_data.model_dump()
         
         try:
-            response = self.session.post(
-                f'{self.base_url}/Action/call',
-                json={
-                    'action': 'add',
-                    'func_name': 'pppuser',
-                    'param': data
-                },
-            )
-            response.raise_for_status()
-            result = response.json()
+            # 新增操作不是幂等的，不做自动重试，避免重复创建
+            result = self._call('add', 'pppuser', data)
             
             if result.get('Result') == 30000:
                 logger.info(f'Successfully created account: {username}')
@@ -268,97 +306,82 @@ class IKuaiAPIClient:
             else:
                 error_msg = result.get('ErrMsg', 'Unknown error')
                 logger.error(f'Failed to create account {username}: {error_msg}')
-                raise Exception(error_msg)
+                raise IKuaiError(error_msg)
         except Exception as e:
             logger.error(f'Error creating account {username}: {str(e)}')
             raise
     
+    @tracing.traced('ikuai.client.get_account')
     def get_account(self, username):
-        """获取账号信息"""
-        if not self.login():
-            raise Exception('Failed to login to iKuai')
-        
+        """获取账号信息（PPPUserRecord），不存在返回 None"""
+        # list_accounts 自己会登录（或命中缓存），这里不再单独登录一次
         accounts = self.list_accounts()
         for account in accounts:
-            if account.get('username') == username:
+            if account.username == username:
                 return account
         return None
     
-    def _list_accounts(self,index,end_index):
-        response = self.session.post(
-                f'{self.base_url}/Action/call',
-                json={
-                    'action': 'show',
-                    'func_name': 'pppuser',
-                    'param': {
-                    "TYPE": "total,data",
-                    "limit": f"{index},{end_index}",
-                    "ORDER_BY": "",
-                    "ORDER": "",
-                    "FINDS": "username,name,address,phone,comment",
-                    "KEYWORDS": "",
-                    "FILTER1": "",
-                    "FILTER2": "",
-                    "FILTER3": "",
-                    "FILTER4": "",
-                    "FILTER5": ""
-                }
-            }
-        )
-        response.raise_for_status()
-        result = response.json()
+    # show 接口每页拉取的条数
+    PAGE_SIZE = 100
+
+    def _list_accounts(self, offset, count):
+        """拉取一页账号，limit 为 "偏移量,条数"，返回 (本页 PPPUserRecord 列表, 总数)"""
+        result = self._call('show', 'pppuser', {
+            "TYPE": "total,data",
+            "limit": f"{offset},{count}",
+            "ORDER_BY": "",
+            "ORDER": "",
+            "FINDS": "username,name,address,phone,comment",
+            "KEYWORDS": "",
+            "FILTER1": "",
+            "FILTER2": "",
+            "FILTER3": "",
+            "FILTER4": "",
+            "FILTER5": ""
+        })
         
         if result.get('Result') == 30000:
-            accounts = result.get('Data', {}).get('data', [])
-            total = result.get('Data', {}).get('total', 0)
-            return accounts,total
+            data = result.get('Data', {})
+            return PPPUserRecord.from_page(data.get('data', [])), data.get('total', 0)
         else:
             error_msg = result.get('ErrMsg', 'Unknown error')
             logger.error(f'Failed to list accounts: {error_msg}')
-            raise Exception(error_msg)
+            raise IKuaiError(error_msg)
     
-    @cached(TTLCache(maxsize=150, ttl=5))
+    @tracing.traced('ikuai.client.list_accounts')
+    @counted_cache('ikuai_list_accounts', maxsize=150, ttl=5)
     def list_accounts(self):
-        """列出所有账号"""
+        """列出所有账号（PPPUserRecord 列表，每一页都受整体截止时间约束）"""
         if not self.login():
-            raise Exception('Failed to login to iKuai')
+            raise IKuaiError('Failed to login to iKuai')
         
         try:
-            _index = 0
-            _end_index = 100
+            offset = 0
+            pages = 0
             all_accounts = []
-            total = 0  # Initialize total before the loop
             while True:
-                accounts, total = self._list_accounts(_index,_end_index)
-                if accounts:
-                    all_accounts.extend(accounts)
-                _index += _end_index + 1
-                _end_index = _index + 100
-                if _index + 1 > total:
-                    # 下一轮索引超出总数，结束循环
+                accounts, total = self._list_accounts(offset, self.PAGE_SIZE)
+                pages += 1
+                all_accounts.extend(accounts)
+                offset += self.PAGE_SIZE
+                if not accounts or offset >= total:
+                    # 已拉取到最后一页
                     break
+            metrics.IKUAI_LIST_PAGES.labels(self.name).observe(pages)
             return all_accounts
         except Exception as e:
             logger.error(f'Error listing accounts: {str(e)}')
             raise e
 
-    def update_account(self, account_id, params: EditPPPUserRequestData):
+    @tracing.traced('ikuai.client.update_account')
+    def update_account(self, account_id, params: 'EditPPPUserRequestData'):
         """更新账号信息"""
         if not self.login():
-            raise Exception('Failed to login to iKuai')
+            raise IKuaiError('Failed to login to iKuai')
         params.id = account_id
         data = params.model_dump()
         try:
-            response = self.session.post(
-                f'{self.base_url}/Action/call',
-                json={
-                    'action': 'edit',
-                    'func_name': 'pppuser',
-                    'param': data
-                }
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = self._call('edit', 'pppuser', data)
             
             if result.get('Result') == 30000:
                 logger.info(f'Successfully updated account ID: {account_id}')
@@ -366,27 +389,19 @@ class IKuaiAPIClient:
             else:
                 error_msg = result.get('ErrMsg', 'Unknown error')
                 logger.error(f'Failed to update account {account_id}: {error_msg}')
-                raise Exception(error_msg)
+                raise IKuaiError(error_msg)
         except Exception as e:
             logger.error(f'Error updating account {account_id}: {str(e)}')
             raise
     
+    @tracing.traced('ikuai.client.delete_account')
     def delete_account(self, account_id):
         """删除账号"""
         if not self.login():
-            raise Exception('Failed to login to iKuai')
+            raise IKuaiError('Failed to login to iKuai')
         
         try:
-            response = self.session.post(
-                f'{self.base_url}/Action/call',
-                json={
-                    'action': 'del',
-                    'func_name': 'pppuser',
-                    'param': {'id': str(account_id)}
-                }
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = self._call('del', 'pppuser', {'id': str(account_id)})
             
             if result.get('Result') == 30000:
                 logger.info(f'Successfully deleted account ID: {account_id}')
@@ -394,7 +409,7 @@ class IKuaiAPIClient:
             else:
                 error_msg = result.get('ErrMsg', 'Unknown error')
                 logger.error(f'Failed to delete account {account_id}: {error_msg}')
-                raise Exception(error_msg)
+                raise IKuaiError(error_msg)
         except Exception as e:
             logger.error(f'Error deleting account {account_id}: {str(e)}')
             raise e
@@ -412,8 +427,3 @@ class IKuaiAPIClient:
             "pass": pass_b64,
             "remember_password": "true"
         }
-
-
-
-
-
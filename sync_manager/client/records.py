@@ -0,0 +1,98 @@
+"""
+Compact pppuser records decoded from the iKuai `show` API.
+
+路由器每行返回约 30 个键的 JSON 对象，全量快照（上万行）如果直接保留 dict，
+内存和后续的 data.get 开销都很可观。这里每页解码一次，转成带 __slots__ 的
+PPPUserRecord，字段与 EditPPPUserRequestData 一致，可直接用于回写（见 schemas.py）。
+"""
+
+from datetime import datetime
+
+# 字段 -> 缺省值，与 EditPPPUserRequestData 的默认值一致（id / start_time 在模型中没有固定默认值），
+# 路由器返回的行缺少字段时回写不会改变账号设置；一致性由单元测试检查
+FIELDS = {
+    'id': None,
+    'username': '',
+    'passwd': '',
+    'enabled': 'yes',
+    'start_time': 0,
+    'expires': 0,
+    'create_time': 0,
+    'last_conntime': 0,
+    'last_offtime': 0,
+    'duration': 0,
+    'ppptype': 'any',
+    'pppname': '',
+    'bind_ifname': 'any',
+    'bind_vlanid': '0',
+    'auto_vlanid': 1,
+    'pppoev6_wan': '',
+    'ip_type': 0,
+    'ip_addr': '',
+    'mac': '',
+    'auto_mac': 1,
+    'share': 999,
+    'upload': 0,
+    'download': 0,
+    'packages': 0,
+    'name': '',
+    'phone': '',
+    'address': '',
+    'comment': 'openvpn创建',
+    'cardid': '',
+    'proxy_username': '',
+}
+
+# 取值种类很少的字符串字段，解码时复用同一个 str 对象
+_SHARED_FIELDS = frozenset({'enabled', 'ppptype', 'bind_ifname', 'bind_vlanid', 'pppoev6_wan'})
+
+_DEFAULTS = tuple((name, default, name in _SHARED_FIELDS) for name, default in FIELDS.items())
+_shared = {}
+
+
+class PPPUserRecord:
+    """单个 pppuser，原样保存路由器返回的值（时间为 Unix 时间戳，0 表示未设置）"""
+
+    __slots__ = tuple(FIELDS)
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        get = row.get
+        share = _shared.setdefault
+        for name, default, shared in _DEFAULTS:
+            value = get(name, default)
+            if shared and value.__class__ is str:
+                value = share(value, value)
+            setattr(record, name, value)
+        return record
+
+    @classmethod
+    def from_page(cls, rows):
+        """解码一页数据，解码后原始 dict 即可释放"""
+        from_row = cls.from_row
+        return [from_row(row) for row in rows]
+
+    @property
+    def is_enabled(self):
+        return self.enabled == 'yes'
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, PPPUserRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'<PPPUserRecord {self.id} {self.username}>'
+
+
+def to_datetime(timestamp, tz):
+    """Unix 时间戳转带时区的 datetime，0 / 空返回 None"""
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=tz)
@@ -0,0 +1,178 @@
+"""
+Request payload models for the iKuai pppuser API.
+
+pydantic 导入较慢，只在创建/编辑账号时由 ikuai.py 按需导入本模块。
+"""
+
+from pydantic import BaseModel, Field
+from django.utils import timezone as django_timezone
+
+
+class AddPPPUserRequestData(BaseModel):
+    """
+        添加 PPP 用户请求数据模型
+        
+        数据示例：
+        {
+            "username": "test",
+            "passwd": "123456112",
+            "enabled": "yes",
+            "ppptype": "any",
+            "bind_ifname": "any",
+            "share": "999",
+            "auto_mac": "1",
+            "upload": 0,
+            "download": 0,
+            "bind_vlanid": 0,
+            "packages": 0,
+            "comment": "xxxa1",
+            "auto_vlanid": 1,
+            "ip_addr": "",
+            "mac": "",
+            "address": "",
+            "name": "xxx",
+            "phone": "",
+            "cardid": "",
+            "ip_type": 0,
+            "pppoev6_wan": "",
+            "start_time": 1762614055,
+            "create_time": "",
+            "expires": 1763132476
+        }
+    """
+    # 必填字段
+    username: str = Field(description="用户名")
+    passwd: str = Field(description="密码")
+    
+    # 启用状态
+    enabled: str = Field(default="yes", description="启用状态：yes 或 no")
+    
+    # 时间相关字段（Unix 时间戳）
+    start_time: int = Field(description="开始时间（Unix 时间戳）", default_factory=lambda: int(django_timezone.now().timestamp()))
+    expires: int = Field(default=0, description="过期时间（Unix 时间戳），0为不过期")
+    create_time: str = Field(default="", description="创建时间")
+    
+    # 连接配置
+    ppptype: str = Field(default="any", description="PPP 类型")
+    bind_ifname: str = Field(default="any", description="绑定接口")
+    bind_vlanid: int | str = Field(default=0, description="绑定 VLAN ID")
+    auto_vlanid: int = Field(default=1, description="自动 VLAN")
+    pppoev6_wan: str = Field(default="", description="PPPoE IPv6 WAN")
+    
+    # IP 和 MAC 配置
+    ip_type: int = Field(default=0, description="IP 类型（0=自动）")
+    ip_addr: str = Field(default="", description="IP 地址")
+    mac: str = Field(default="", description="MAC 地址")
+    auto_mac: int | str = Field(default=1, description="自动 MAC")
+    
+    # 限制配置
+    share: int | str = Field(default=999, description="共享连接数")
+    upload: int = Field(default=0, description="上传限速（KB/s）")
+    download: int = Field(default=0, description="下载限速（KB/s）")
+    packages: int = Field(default=0, description="流量包（字节）")
+    
+    # 用户信息
+    name: str = Field(default="", description="姓名/名称")
+    phone: str = Field(default="", description="电话")
+    address: str = Field(default="", description="地址")
+    comment: str = Field(default="openvpn创建", description="备注")
+    
+    # 其他字段
+    cardid: str = Field(default="", description="卡号")
+
+
+class EditPPPUserRequestData(BaseModel):
+    """
+        编辑 PPP 用户请求数据模型
+
+        数据示例：
+        {
+            "passwd": "test123456",
+            "duration": -25412,
+            "expires": 1762627484,
+            "start_time": 1762541072,
+            "create_time": 1762541096,
+            "ppptype": "any",
+            "cardid": "",
+            "pppname": "",
+            "last_offtime": 1762586779,
+            "share": 1,
+            "auto_mac": 1,
+            "upload": 0,
+            "download": 0,
+            "ip_type": 0,
+            "ip_addr": "10.100.250.5",
+            "mac": "",
+            "address": "",
+            "name": "XXX",
+            "last_conntime": 0,
+            "phone": "",
+            "packages": 0,
+            "proxy_username": "",
+            "pppoev6_wan": "",
+            "auto_vlanid": 1,
+            "bind_vlanid": "0",
+            "bind_ifname": "any",
+            "id": 2,
+            "enabled": "yes",
+            "comment": "remark",
+            "username": "test"
+        }
+    """
+    # 必填字段
+    id: int = Field(description="账号ID")
+    username: str = Field(description="用户名")
+    passwd: str = Field(description="密码")
+    expires: int = Field(description="过期时间（Unix 时间戳），0为不过期",default=0)
+    start_time: int = Field(description="开始时间（Unix 时间戳）",default_factory=lambda: int(django_timezone.now().timestamp()))
+    
+    # 启用状态
+    enabled: str = Field(default="yes", description="启用状态：yes 或 no")
+    
+    # 时间相关字段（Unix 时间戳）
+    create_time: int = Field(default=0, description="创建时间")
+    last_conntime: int = Field(default=0, description="最后连接时间")
+    last_offtime: int = Field(default=0, description="最后离线时间")
+    duration: int = Field(default=0, description="在线时长（秒）")
+    
+    # 连接配置
+    ppptype: str = Field(default="any", description="PPP 类型")
+    pppname: str = Field(default="", description="PPP 名称")
+    bind_ifname: str = Field(default="any", description="绑定接口")
+    bind_vlanid: str = Field(default="0", description="绑定 VLAN ID")
+    auto_vlanid: int = Field(default=1, description="自动 VLAN")
+    pppoev6_wan: str = Field(default="", description="PPPoE IPv6 WAN")
+    
+    # IP 和 MAC 配置
+    ip_type: int = Field(default=0, description="IP 类型（0=自动）")
+    ip_addr: str = Field(default="", description="IP 地址")
+    mac: str = Field(default="", description="MAC 地址")
+    auto_mac: int = Field(default=1, description="自动 MAC")
+    
+    # 限制配置
+    share: int = Field(default=999, description="共享连接数")
+    upload: int = Field(default=0, description="上传限速（KB/s）")
+    download: int = Field(default=0, description="下载限速（KB/s）")
+    packages: int = Field(default=0, description="流量包（字节）")
+    
+    # 用户信息
+    name: str = Field(default="", description="姓名/名称")
+    phone: str = Field(default="", description="电话")
+    address: str = Field(default="", description="地址")
+    comment: str = Field(default="openvpn创建", description="备注")
+    
+    # 其他字段
+    cardid: str = Field(default="", description="卡号")
+    proxy_username: str = Field(default="", description="代理用户名")
+
+    @classmethod
+    def from_record(cls, record, **changes):
+        """
+        以路由器返回的记录为基础构造编辑请求，只替换 changes 中的字段
+
+        记录来自路由器本身，字段已是正确的类型，用 model_construct 跳过校验，
+        批量回写（如同步密码）时不必为每行做一次完整校验。
+        """
+        values = record.as_dict()
+        values.update(changes)
+        return cls.model_construct(**values)
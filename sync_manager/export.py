@@ -0,0 +1,101 @@
+"""
+Streaming CSV / NDJSON export of accounts, users and departments.
+
+按主键分批读取（pk > 上一批最后一行，LIMIT chunk_size），每批用 values_list(...).iterator()
+逐行编码后立即写出，内存占用与总行数无关：
+
+- mysqlclient 会把整个结果集缓存在客户端，单条查询的 iterator() 仍会占用与结果集成正比的内存，
+  所以按主键分批，每批是一条可以走主键索引的查询
+- 只查询请求的字段，关联字段（部门名等）由 values_list 在同一条查询中 JOIN
+
+字段定义与 /api/v1/ 相同（见 sync_manager/api.py）。
+"""
+
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK_SIZE = 2000
+# 编码后的文本攒到这么大再写出，减少 StreamingHttpResponse 的分块数
+FLUSH_BYTES = 64 * 1024
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def rows(queryset, paths, chunk_size=CHUNK_SIZE):
+    """按主键分批产出 values_list 元组（不含主键）"""
+    queryset = queryset.order_by('pk').values_list('pk', *paths)
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(pk__gt=last)
+        count = 0
+        for pk, *values in batch[:chunk_size].iterator(chunk_size=chunk_size):
+            last = pk
+            count += 1
+            yield values
+        if count < chunk_size:
+            return
+
+
+class _Echo:
+    """csv.writer 的伪文件对象，write 直接返回写入的行"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, values):
+    # 带 BOM，Excel 打开时按 UTF-8 识别中文
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(names)
+    for row in values:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def ndjson_lines(names, values):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in values:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def _buffered(lines):
+    """把文本行攒成 FLUSH_BYTES 左右的 bytes 块"""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(queryset, available, names, fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """
+    导出 queryset 中的 names 字段（available 为 {字段: ORM 路径}），返回 bytes 迭代器
+
+    fmt 为 csv 或 ndjson；compress 为 True 时输出 gzip 文件内容。
+    """
+    values = rows(queryset, [available[name] for name in names], chunk_size)
+    lines = csv_lines(names, values) if fmt == 'csv' else ndjson_lines(names, values)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if compress else chunks
+
+
+def filename(resource, fmt, compress=False):
+    return f'{resource}.{fmt}{".gz" if compress else ""}'
@@ -0,0 +1,173 @@
+"""
+VPN connection history: append-only events, hourly/daily rollups and retention.
+
+OpenVPNAccount 只保存最近一次的连接信息，每次同步都会被覆盖。同步时对比新旧值，
+把变化追加到 ConnectionEvent（批量插入），再由 rollup_connection_history 定时任务：
+- 把原始记录汇总为按路由器的小时 / 天汇总（ConnectionRollup，可重复执行）
+- 按 CONNECTION_HISTORY 中的天数清理过期的原始记录和汇总
+
+容量规划类查询（几个月的在线时长、活跃账号数）只读汇总表，行数为 天数 × 路由器数。
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from sync_manager.models import ConnectionEvent, ConnectionRollup
+
+logger = logging.getLogger(__name__)
+
+# 同步中影响连接历史的字段
+TRACKED_FIELDS = frozenset({'last_conntime', 'last_offtime', 'duration', 'ip_addr'})
+
+INSERT_BATCH_SIZE = 1000
+DELETE_CHUNK_SIZE = 5000
+
+TRUNC = {'hour': TruncHour, 'day': TruncDay}
+
+
+def _config():
+    return {
+        'raw_days': 14,
+        'hourly_days': 90,
+        'daily_days': 730,
+        **getattr(settings, 'CONNECTION_HISTORY', {}),
+    }
+
+
+def snapshot(account):
+    """同步前记录连接相关字段的旧值"""
+    return account.last_conntime, account.duration
+
+
+def observe(account, previous, changed, now):
+    """
+    根据同步前后的变化生成一条 ConnectionEvent，没有连接相关变化时返回 None
+
+    previous 为 snapshot() 的返回值，changed 为 update_from_ikuai_data 返回的字段集合。
+    """
+    if not changed & TRACKED_FIELDS:
+        return None
+    previous_conntime, previous_duration = previous
+    new_session = account.last_conntime is not None and account.last_conntime != previous_conntime
+    duration = account.duration or 0
+    # 新会话的在线时长从 0 开始计
+    delta = duration if new_session else max(duration - (previous_duration or 0), 0)
+    offline = (
+        account.last_offtime is not None
+        and (account.last_conntime is None or account.last_offtime >= account.last_conntime)
+    )
+    return ConnectionEvent(
+        account_id=account.id,
+        username=account.username,
+        router=account.router,
+        day=timezone.localdate(now),
+        observed_at=now,
+        connected_at=account.last_conntime,
+        disconnected_at=account.last_offtime if offline else None,
+        ip_addr=account.ip_addr,
+        new_session=new_session,
+        duration_delta=delta,
+    )
+
+
+def record(events):
+    """批量追加连接记录"""
+    if events:
+        ConnectionEvent.objects.bulk_create(events, batch_size=INSERT_BATCH_SIZE)
+    return len(events)
+
+
+def _floor(moment, granularity):
+    moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def rollup(granularity, since, until=None):
+    """
+    重新计算 [since 所在时间段, until) 内的汇总，返回写入的行数
+
+    同一时间段重复执行会覆盖原有结果，当前未结束的时间段也会被计算，之后再次覆盖。
+    """
+    start = _floor(since, granularity)
+    # day 条件让查询走 (day, router) 索引，observed_at 没有单独的索引
+    events = ConnectionEvent.objects.filter(day__gte=start.date(), observed_at__gte=start)
+    rollups = ConnectionRollup.objects.filter(granularity=granularity, bucket__gte=start)
+    if until is not None:
+        events = events.filter(day__lte=timezone.localdate(until), observed_at__lt=until)
+        rollups = rollups.filter(bucket__lt=until)
+
+    rows = (
+        events
+        .annotate(bucket=TRUNC[granularity]('observed_at'))
+        .values('bucket', 'router')
+        .annotate(
+            sessions=Count('id', filter=Q(new_session=True)),
+            active_accounts=Count('account_id', distinct=True),
+            online_seconds=Sum('duration_delta'),
+            events=Count('id'),
+        )
+        .order_by()
+    )
+    objects = [ConnectionRollup(granularity=granularity, **row) for row in rows]
+    # 删除与写入在同一事务中：失败时保留原有汇总，重叠执行时后一次等待前一次提交
+    with transaction.atomic():
+        rollups.delete()
+        ConnectionRollup.objects.bulk_create(objects, batch_size=INSERT_BATCH_SIZE)
+    return len(objects)
+
+
+def _delete_in_chunks(queryset):
+    """按主键分批删除，避免一次删除大量行长时间持有锁"""
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:DELETE_CHUNK_SIZE])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def purge(now=None):
+    """按保留天数清理原始记录和汇总，返回 {表: 删除行数}"""
+    config = _config()
+    today = _floor(now or timezone.now(), 'day')
+    return {
+        'events': _delete_in_chunks(
+            ConnectionEvent.objects.filter(day__lt=(today - timedelta(days=config['raw_days'])).date())),
+        'hourly': _delete_in_chunks(
+            ConnectionRollup.objects.filter(granularity='hour', bucket__lt=today - timedelta(days=config['hourly_days']))),
+        'daily': _delete_in_chunks(
+            ConnectionRollup.objects.filter(granularity='day', bucket__lt=today - timedelta(days=config['daily_days']))),
+    }
+
+
+def usage(granularity='day', since=None, until=None, router=None):
+    """
+    容量规划查询：返回 [{bucket, sessions, active_accounts, online_seconds}]，多台路由器合并
+
+    active_accounts 为各路由器之和（账号只属于一台路由器，不会重复计数）。
+    """
+    rollups = ConnectionRollup.objects.filter(granularity=granularity)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=since)
+    if until is not None:
+        rollups = rollups.filter(bucket__lt=until)
+    if router is not None:
+        rollups = rollups.filter(router=router)
+    return list(
+        rollups
+        .values('bucket')
+        .annotate(
+            sessions=Sum('sessions'),
+            active_accounts=Sum('active_accounts'),
+            online_seconds=Sum('online_seconds'),
+        )
+        .order_by('bucket')
+    )
@@ -0,0 +1,63 @@
+"""
+把路由器上已有的 pppuser 收编为本地 OpenVPNAccount（匹配规则见 sync_manager/adoption.py）。
+
+用法：
+    python manage.py adopt_router_accounts --dry-run                # 只匹配，列出结果
+    python manage.py adopt_router_accounts --router default
+    python manage.py adopt_router_accounts --unmatched-csv unmatched.csv
+"""
+
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sync_manager import adoption, routers
+
+
+class Command(BaseCommand):
+    help = '按用户名 / 姓名 / 备注把路由器上已有的 pppuser 关联到本地用户并建立 VPN 账号'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--router', action='append', dest='routers', help='只处理指定的路由器，可重复')
+        parser.add_argument('--dry-run', action='store_true', help='只匹配不写入')
+        parser.add_argument('--unmatched-csv', default='', help='未收编的 pppuser 写入该 CSV 文件，- 为标准输出')
+
+    def handle(self, *args, **options):
+        from sync_manager.tasks import adopt_router_accounts
+
+        unknown = sorted(set(options['routers'] or []) - set(routers.get_routers()))
+        if unknown:
+            raise CommandError(f'未知路由器: {", ".join(unknown)}')
+
+        result = adopt_router_accounts(options['routers'], dry_run=options['dry_run'])
+        for name, error in result['errors'].items():
+            self.stderr.write(self.style.ERROR(f'路由器 {name} 拉取失败: {error}'))
+
+        unmatched = result['unmatched']
+        if options['unmatched_csv']:
+            self._write_csv(unmatched, options['unmatched_csv'])
+        else:
+            for row in unmatched:
+                self.stdout.write(
+                    f"{row['router']:<12} {row['ikuai_id']:<8} {row['username']:<24} "
+                    f"{adoption.REASONS[row['reason']]}  name={row['name']!r} comment={row['comment']!r}"
+                )
+
+        verb = '可收编' if options['dry_run'] else '已收编'
+        matched_by = ', '.join(f'{source}={count}' for source, count in sorted(result['matched_by'].items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result["adopted"]} 个（{matched_by or "无"}），'
+            f'未匹配 {len(unmatched)} 个，已关联 {result["already_linked"]} 个'
+        ))
+
+    def _write_csv(self, unmatched, path):
+        fields = ['router', 'ikuai_id', 'username', 'name', 'comment', 'reason']
+        output = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8-sig')
+        try:
+            writer = csv.DictWriter(output, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(unmatched)
+        finally:
+            if output is not sys.stdout:
+                output.close()
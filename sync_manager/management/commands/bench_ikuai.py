@@ -0,0 +1,46 @@
+"""
+iKuai 客户端与 OpenVPN 任务的端到端基准测试。
+
+用法：
+    python manage.py bench_ikuai                       # 100 / 1000 / 10000 个账号，与基线对比
+    python manage.py bench_ikuai --sizes 100,1000
+    python manage.py bench_ikuai --save-baseline       # 用本次结果覆盖 baselines.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sync_manager.testing import benchmarks
+
+
+class Command(BaseCommand):
+    help = '在本地假路由器上对 list_accounts、同步、创建和删除计时，并与基线对比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(str(s) for s in benchmarks.SIZES),
+                            help='逗号分隔的账号规模')
+        parser.add_argument('--repeat', type=int, default=3, help='list/sync 的重复次数（取中位数）')
+        parser.add_argument('--ops', type=int, default=10, help='create/delete 的执行次数（取平均）')
+        parser.add_argument('--latency', type=float, default=0.0, help='假路由器每个请求的延迟（秒）')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='允许超出基线的比例')
+        parser.add_argument('--save-baseline', action='store_true', help='保存本次结果为新基线')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+        report = benchmarks.run_benchmarks(
+            sizes, repeat=options['repeat'], ops=options['ops'], latency=options['latency'],
+        )
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(report)
+            self.stdout.write(self.style.SUCCESS(f'基线已保存到 {benchmarks.BASELINE_PATH}'))
+            return
+
+        regressions = benchmarks.compare(report, benchmarks.load_baseline(), options['tolerance'])
+        for name, size, expected, seconds in regressions:
+            self.stderr.write(f'{name}@{size}: {seconds:.4f}s，基线 {expected:.4f}s')
+        if regressions:
+            raise CommandError(f'{len(regressions)} 项基准超出基线 {options["tolerance"]:.0%}')
+        self.stdout.write(self.style.SUCCESS('所有基准都在基线范围内'))
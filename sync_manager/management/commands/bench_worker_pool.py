@@ -0,0 +1,48 @@
+"""
+比较不同 Celery 执行池运行路由器密集型任务的吞吐量。
+
+用法：
+    python manage.py bench_worker_pool                                  # prefork:4,prefork:16,threads:100,gevent:200
+    python manage.py bench_worker_pool --pools prefork:4,threads:200 --tasks 1000 --latency 0.1
+    python manage.py bench_worker_pool --json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sync_manager.testing import pool_bench
+
+
+class Command(BaseCommand):
+    help = '在本地假路由器上比较 prefork / threads / gevent / eventlet 执行池的任务吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pools', default=','.join(f'{pool}:{n}' for pool, n in pool_bench.DEFAULT_SPECS),
+                            help='逗号分隔的 池:并发数')
+        parser.add_argument('--tasks', type=int, default=400, help='每种执行池运行的任务数')
+        parser.add_argument('--latency', type=float, default=0.05, help='假路由器每个请求的延迟（秒）')
+        parser.add_argument('--pool-maxsize', type=int, default=100, help='每台路由器的最大连接数')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    def handle(self, *args, **options):
+        try:
+            specs = [(pool, int(n)) for pool, n in (spec.split(':') for spec in options['pools'].split(',') if spec)]
+        except ValueError:
+            raise CommandError('--pools 的格式为 池:并发数，例如 prefork:4,threads:100')
+
+        results = pool_bench.run(specs, options['tasks'], options['latency'], options['pool_maxsize'])
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        baseline = next((r['tasks_per_second'] for r in results if 'tasks_per_second' in r), None)
+        for result in results:
+            label = f"{result['pool']}:{result['concurrency']}"
+            if 'tasks_per_second' not in result:
+                self.stdout.write(f"{label:<14} {result.get('skipped') or result.get('failed')}")
+                continue
+            self.stdout.write(
+                f"{label:<14} {result['tasks_per_second']:>8.1f} 任务/秒  {result['seconds']:>7.2f}s  "
+                f"错误 {result['errors']}  x{result['tasks_per_second'] / baseline:.1f}"
+            )
@@ -0,0 +1,66 @@
+"""
+视图、后台列表和同步任务的 SQL / 路由器调用预算报告。
+
+用法：
+    python manage.py query_budget                         # 10 / 40 行，检查全部端点
+    python manage.py query_budget --sizes 10,100,1000     # 临时剖析更大的数据集
+    python manage.py query_budget --only sync_openvpn_accounts --json
+    python manage.py query_budget --tolerate-known              # 已知回归只警告
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sync_manager.testing import budgets
+
+
+class Command(BaseCommand):
+    help = '在种子数据上执行视图和任务，统计 SQL 条数/耗时与路由器调用，并按预算检查'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(str(s) for s in budgets.SIZES),
+                            help='逗号分隔的数据规模')
+        parser.add_argument('--only', default='', help='逗号分隔的端点名，默认全部')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出完整报告')
+        parser.add_argument('--tolerate-known', action='store_true',
+                            help='KNOWN_REGRESSIONS 中的端点超出预算时只警告，不算作失败')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+        names = [n for n in options['only'].split(',') if n] or None
+        unknown = set(names or []) - set(budgets.BUDGETS)
+        if unknown:
+            raise CommandError(f'未知端点: {", ".join(sorted(unknown))}')
+
+        report = budgets.run_budgets(sizes, names)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        else:
+            self.stdout.write(f'{"端点":<34}{"规模":>8}{"SQL":>8}{"SQL耗时(s)":>12}{"路由器":>8}{"总耗时(s)":>12}')
+            for name, by_size in report.items():
+                for size, stats in by_size.items():
+                    self.stdout.write(
+                        f'{name:<34}{size:>8}{stats["queries"]:>8}{stats["query_seconds"]:>12.4f}'
+                        f'{stats["router_calls"]:>8}{stats["seconds"]:>12.4f}'
+                    )
+
+        tolerate_known = options['tolerate_known']
+        known = budgets.known_regressions(report)
+        for name, regressions in known.items():
+            if not regressions:
+                self.stderr.write(self.style.WARNING(f'{name} 已在预算内，可从 KNOWN_REGRESSIONS 中移除'))
+            elif tolerate_known:
+                self.stderr.write(self.style.WARNING(f'已知回归 {name}: {budgets.KNOWN_REGRESSIONS[name]}'))
+                for problem in regressions:
+                    self.stderr.write(self.style.WARNING(f'  {problem}'))
+
+        problems = budgets.check(report, tolerate_known=tolerate_known)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} 项超出预算')
+        if tolerate_known and any(known.values()):
+            self.stdout.write(self.style.SUCCESS('除已知回归外，所有端点都在预算内'))
+        else:
+            self.stdout.write(self.style.SUCCESS('所有端点都在预算内'))
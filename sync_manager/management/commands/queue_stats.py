@@ -0,0 +1,28 @@
+"""
+打印 Celery 队列积压和扩缩容建议。
+
+用法：
+    python manage.py queue_stats
+    python manage.py queue_stats --json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from sync_manager.queues import get_autoscale_hints
+
+
+class Command(BaseCommand):
+    help = '显示各 Celery 队列的积压消息数和建议的 worker 进程数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出，便于外部扩缩容脚本读取')
+
+    def handle(self, *args, **options):
+        hints = get_autoscale_hints()
+        if options['json']:
+            self.stdout.write(json.dumps(hints))
+            return
+        for name, hint in hints.items():
+            self.stdout.write(f"{name:<12} depth={hint['depth']:<6} suggested_workers={hint['workers']}")
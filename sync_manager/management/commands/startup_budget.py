@@ -0,0 +1,46 @@
+"""
+manage.py、gunicorn worker 和 Celery worker 的启动导入耗时预算。
+
+用法：
+    python manage.py startup_budget                  # 检查全部入口
+    python manage.py startup_budget --only wsgi --json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sync_manager.testing import startup
+
+
+class Command(BaseCommand):
+    help = '用 python -X importtime 启动各入口，统计导入耗时并按 startup_budget.json 检查'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', default='', help='逗号分隔的入口名，默认全部')
+        parser.add_argument('--repeat', type=int, default=3, help='每个入口启动的次数（取最快一次）')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出完整报告')
+
+    def handle(self, *args, **options):
+        names = [n for n in options['only'].split(',') if n] or None
+        unknown = set(names or []) - set(startup.ENTRYPOINTS)
+        if unknown:
+            raise CommandError(f'未知入口: {", ".join(sorted(unknown))}')
+
+        budget = startup.load_budget()
+        report = startup.run_startup(names, repeat=options['repeat'], budget=budget)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False))
+        else:
+            for name, summary in report.items():
+                limit = budget.get('max_ms', {}).get(name, '-')
+                self.stdout.write(f'{name:<10}{summary["total_ms"]:>10.1f}ms  预算 {limit}ms  {summary["modules"]} 个模块')
+                for package, ms in summary['packages'].items():
+                    self.stdout.write(f'    {package:<30}{ms:>8.1f}ms')
+
+        problems = startup.check(report, budget)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} 项超出预算')
+        self.stdout.write(self.style.SUCCESS('所有入口都在预算内'))
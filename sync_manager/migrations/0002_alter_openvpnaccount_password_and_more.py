@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:11
+
+from django.db import migrations, models
+import encrypted_model_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='openvpnaccount',
+            name='password',
+            field=encrypted_model_fields.fields.EncryptedCharField(help_text='OpenVPN登录密码（加密存储）', verbose_name='VPN密码'),
+        ),
+        migrations.AlterField(
+            model_name='openvpnaccount',
+            name='status',
+            field=models.CharField(choices=[('creating', '创建中'), ('active', '正常'), ('expired', '已过期'), ('disabled', '已禁用'), ('failed', '创建失败'), ('deleting', '删除中')], db_index=True, default='creating', max_length=20, verbose_name='账号状态'),
+        ),
+    ]
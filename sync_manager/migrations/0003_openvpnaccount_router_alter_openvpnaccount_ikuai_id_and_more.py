@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0002_alter_openvpnaccount_password_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openvpnaccount',
+            name='router',
+            field=models.CharField(db_index=True, default='default', help_text='账号所在的iKuai路由器，对应 IKUAI_ROUTERS 中的名称', max_length=50, verbose_name='所属路由器'),
+        ),
+        migrations.AlterField(
+            model_name='openvpnaccount',
+            name='ikuai_id',
+            field=models.IntegerField(blank=True, help_text='iKuai系统返回的账号ID（在所属路由器内唯一）', null=True, verbose_name='iKuai账号ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='openvpnaccount',
+            constraint=models.UniqueConstraint(fields=('router', 'ikuai_id'), name='uniq_router_ikuai_id'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0003_openvpnaccount_router_alter_openvpnaccount_ikuai_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=100, verbose_name='VPN账号')),
+                ('router', models.CharField(max_length=50, verbose_name='所属路由器')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('observed_at', models.DateTimeField(verbose_name='同步时间')),
+                ('connected_at', models.DateTimeField(null=True, verbose_name='连接时间')),
+                ('disconnected_at', models.DateTimeField(help_text='仍在线时为空', null=True, verbose_name='下线时间')),
+                ('ip_addr', models.GenericIPAddressField(null=True, verbose_name='IP地址')),
+                ('new_session', models.BooleanField(default=False, help_text='与上次同步相比是一次新的连接', verbose_name='新会话')),
+                ('duration_delta', models.IntegerField(default=0, verbose_name='新增在线时长（秒）')),
+            ],
+            options={
+                'verbose_name': '连接记录',
+                'verbose_name_plural': '连接记录',
+                'db_table': 'openvpn_connection_event',
+            },
+        ),
+        migrations.CreateModel(
+            name='ConnectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', '小时'), ('day', '天')], max_length=4, verbose_name='粒度')),
+                ('bucket', models.DateTimeField(verbose_name='时间段开始')),
+                ('router', models.CharField(max_length=50, verbose_name='所属路由器')),
+                ('sessions', models.IntegerField(default=0, verbose_name='新会话数')),
+                ('active_accounts', models.IntegerField(default=0, verbose_name='活跃账号数')),
+                ('online_seconds', models.BigIntegerField(default=0, verbose_name='在线时长（秒）')),
+                ('events', models.IntegerField(default=0, verbose_name='原始记录数')),
+            ],
+            options={
+                'verbose_name': '连接汇总',
+                'verbose_name_plural': '连接汇总',
+                'db_table': 'openvpn_connection_rollup',
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='connectionrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'bucket', 'router'), name='uniq_rollup_bucket'),
+        ),
+        migrations.AddField(
+            model_name='connectionevent',
+            name='account',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='sync_manager.openvpnaccount', verbose_name='OpenVPN账号'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionevent',
+            index=models.Index(fields=['day', 'router'], name='openvpn_con_day_f58905_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionevent',
+            index=models.Index(fields=['account', 'observed_at'], name='openvpn_con_account_b9a9fd_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_userprofile_plain_password'),
+        ('sync_manager', '0004_connection_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accounts', models.IntegerField(default=0, verbose_name='账号数')),
+                ('active_accounts', models.IntegerField(default=0, verbose_name='正常账号数')),
+                ('online_seconds', models.BigIntegerField(default=0, verbose_name='在线时长（秒）')),
+                ('packages', models.BigIntegerField(default=0, verbose_name='流量包（字节）')),
+                ('expiring_soon', models.IntegerField(default=0, help_text='DEPARTMENT_USAGE 中 expiring_days 天内过期的正常账号', verbose_name='即将过期')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='更新时间')),
+                ('department', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vpn_usage', to='account.department', verbose_name='部门')),
+            ],
+            options={
+                'verbose_name': '部门使用情况',
+                'verbose_name_plural': '部门使用情况',
+                'db_table': 'openvpn_department_usage',
+                'ordering': ['-active_accounts'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0005_department_usage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='openvpnaccount',
+            index=models.Index(fields=['created_at'], name='openvpn_acc_created_20e985_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0006_openvpnaccount_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openvpnaccount',
+            name='password_changed_at',
+            field=models.DateTimeField(blank=True, help_text='本地密码随 LDAP 变更、尚未写回路由器的时间（见 sync_manager/passwords.py）', null=True, verbose_name='密码待同步'),
+        ),
+        migrations.AddIndex(
+            model_name='openvpnaccount',
+            index=models.Index(fields=['password_changed_at'], name='openvpn_acc_passwor_26e8a8_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+FIELDS = ('accounts', 'active_accounts', 'online_seconds', 'packages', 'expiring_soon')
+
+
+def fill_buckets(apps, schema_editor):
+    """bucket = 部门ID；并发创建产生的多行「未分配部门」各存了一部分增量，合并为一行"""
+    DepartmentUsage = apps.get_model('sync_manager', 'DepartmentUsage')
+    DepartmentUsage.objects.filter(department__isnull=False).update(bucket=models.F('department_id'))
+    unassigned = list(DepartmentUsage.objects.filter(department__isnull=True).order_by('pk'))
+    if not unassigned:
+        return
+    first, *duplicates = unassigned
+    for row in duplicates:
+        for name in FIELDS:
+            setattr(first, name, getattr(first, name) + getattr(row, name))
+        first.updated_at = max(first.updated_at, row.updated_at)
+    first.bucket = -1
+    first.save()
+    DepartmentUsage.objects.filter(pk__in=[row.pk for row in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync_manager', '0007_openvpnaccount_password_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departmentusage',
+            name='bucket',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='汇总键'),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='departmentusage',
+            name='bucket',
+            field=models.BigIntegerField(editable=False, help_text='部门ID，未分配部门为 -1', unique=True, verbose_name='汇总键'),
+        ),
+    ]
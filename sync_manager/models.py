@@ -8,6 +8,9 @@ from django.utils import timezone
 from django.core.validators import MinValueValidator
 from encrypted_model_fields.fields import EncryptedCharField
 
+from sync_manager.client.records import PPPUserRecord, to_datetime
+from sync_manager.usage import state as usage_state
+
 
 class OpenVPNAccount(models.Model):
     """
@@ -33,12 +36,19 @@ class OpenVPNAccount(models.Model):
     )
     
     # iKuai 账号基本信息
+    router = models.CharField(
+        '所属路由器',
+        max_length=50,
+        default='default',
+        db_index=True,
+        help_text='账号所在的iKuai路由器，对应 IKUAI_ROUTERS 中的名称'
+    )
+    
     ikuai_id = models.IntegerField(
         'iKuai账号ID',
         null=True,
         blank=True,
-        unique=True,
-        help_text='iKuai系统返回的账号ID'
+        help_text='iKuai系统返回的账号ID（在所属路由器内唯一）'
     )
     
     username = models.CharField(
@@ -232,6 +242,13 @@ class OpenVPNAccount(models.Model):
         help_text='创建失败时的错误信息'
     )
     
+    password_changed_at = models.DateTimeField(
+        '密码待同步',
+        null=True,
+        blank=True,
+        help_text='本地密码随 LDAP 变更、尚未写回路由器的时间（见 sync_manager/passwords.py）'
+    )
+    
     # 记录创建和更新时间
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
@@ -245,11 +262,28 @@ class OpenVPNAccount(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['expires']),
             models.Index(fields=['username']),
+            # 后台列表默认排序，keyset 分页按 (created_at, id) 定位
+            models.Index(fields=['created_at']),
+            models.Index(fields=['password_changed_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['router', 'ikuai_id'], name='uniq_router_ikuai_id'),
         ]
     
     def __str__(self):
         return f'{self.username} ({self.user.username})'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的状态，保存时据此增量更新部门汇总（见 sync_manager/usage.py）
+        instance._usage_state = usage_state(instance)
+        return instance
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._usage_state = usage_state(self)
+    
     def is_expired(self):
         """检查账号是否过期"""
         if not self.expires:
@@ -271,62 +305,191 @@ class OpenVPNAccount(models.Model):
         delta = self.expires - timezone.now()
         return delta.days if delta.days > 0 else 0
     
-    def update_from_ikuai_data(self, data):
-        """从 iKuai API 返回的数据更新账号信息"""
-        from datetime import datetime
-        
-        # 基本信息
-        self.ikuai_id = data.get('id')
-        self.username = data.get('username', self.username)
-        self.password = data.get('passwd', self.password)
-        self.enabled = data.get('enabled') == 'yes'
-        
-        # IP和网络配置
-        self.ip_addr = data.get('ip_addr') or None
-        self.ip_type = data.get('ip_type', 0)
-        self.mac = data.get('mac', '')
-        
-        # 联系信息
-        self.phone = data.get('phone', '')
-        self.address = data.get('address', '')
-        self.comment = data.get('comment', '')
-        
-        # 连接配置
-        self.ppptype = data.get('ppptype', 'any')
-        self.pppname = data.get('pppname', '')
-        self.bind_ifname = data.get('bind_ifname', 'any')
-        self.bind_vlanid = data.get('bind_vlanid', '0')
-        self.auto_vlanid = data.get('auto_vlanid', 1)
-        
-        # 限制配置
-        self.share = data.get('share', 1)
-        self.upload = data.get('upload', 0)
-        self.download = data.get('download', 0)
-        self.duration = data.get('duration', 0)
-        self.packages = data.get('packages', 0)
-        
-        # 其他
-        self.cardid = data.get('cardid', '')
-        self.auto_mac = data.get('auto_mac', 1)
-        
-        # 时间字段（Unix时间戳转换为timezone-aware datetime）
-        if data.get('start_time'):
-            self.start_time = datetime.fromtimestamp(data['start_time'], tz=timezone.get_current_timezone())
-        
-        if data.get('expires'):
-            self.expires = datetime.fromtimestamp(data['expires'], tz=timezone.get_current_timezone())
-        
-        if data.get('last_conntime'):
-            self.last_conntime = datetime.fromtimestamp(data['last_conntime'], tz=timezone.get_current_timezone())
-        
-        if data.get('last_offtime'):
-            self.last_offtime = datetime.fromtimestamp(data['last_offtime'], tz=timezone.get_current_timezone())
-        
+    def update_from_ikuai_data(self, record, tz=None):
+        """
+        从 iKuai API 返回的数据（PPPUserRecord）更新账号信息
+
+        只给值发生变化的字段赋值，返回这些字段名的集合，调用方据此
+        save(update_fields=...) 或 bulk_update；没有变化时不需要任何写入。
+        密码相同时不会重新赋值，保存时也就不会重新加密。
+        tz 为空时取当前时区；批量同步时由调用方传入，避免逐行获取。
+        """
+        if isinstance(record, dict):
+            record = PPPUserRecord.from_row(record)
+        tz = tz or timezone.get_current_timezone()
+
+        values = {
+            # 基本信息
+            'ikuai_id': record.id,
+            'username': record.username or self.username,
+            # 本地密码还没写回路由器时保留本地的新密码
+            'password': self.password if self.password_changed_at else (record.passwd or self.password),
+            'enabled': record.enabled == 'yes',
+            # IP和网络配置
+            'ip_addr': record.ip_addr or None,
+            'ip_type': record.ip_type,
+            'mac': record.mac,
+            # 联系信息
+            'phone': record.phone,
+            'address': record.address,
+            'comment': record.comment,
+            # 连接配置
+            'ppptype': record.ppptype,
+            'pppname': record.pppname,
+            'bind_ifname': record.bind_ifname,
+            'bind_vlanid': record.bind_vlanid,
+            'auto_vlanid': record.auto_vlanid,
+            # 限制配置
+            'share': record.share,
+            'upload': record.upload,
+            'download': record.download,
+            'duration': record.duration,
+            'packages': record.packages,
+            # 其他
+            'cardid': record.cardid,
+            'auto_mac': record.auto_mac,
+            # 时间字段（Unix时间戳转换为timezone-aware datetime，未设置时保留原值）
+            'start_time': to_datetime(record.start_time, tz) or self.start_time,
+            'expires': to_datetime(record.expires, tz) or self.expires,
+            'last_conntime': to_datetime(record.last_conntime, tz) or self.last_conntime,
+            'last_offtime': to_datetime(record.last_offtime, tz) or self.last_offtime,
+        }
+
+        changed = set()
+        for name, value in values.items():
+            current = getattr(self, name)
+            if value is not None and current is not None and type(value) is not type(current):
+                # 路由器有时以字符串返回数字字段
+                value = self._meta.get_field(name).to_python(value)
+            if value != current:
+                setattr(self, name, value)
+                changed.add(name)
+
         # 更新状态
+        status = self.status
         if self.is_expired():
-            self.status = 'expired'
+            status = 'expired'
         elif self.enabled and self.ikuai_id:
-            self.status = 'active'
+            status = 'active'
         elif not self.enabled:
-            self.status = 'disabled'
+            status = 'disabled'
+        if status != self.status:
+            self.status = status
+            changed.add('status')
+        return changed
+
+
+
+class ConnectionEvent(models.Model):
+    """
+    连接历史（原始数据）
+
+    每次同步发现账号的连接时间、下线时间、在线时长或 IP 发生变化时追加一行，
+    只插入不修改。day 为分区键：清理和汇总都按 day 过滤，走 (day, router) 索引。
+    account 不建外键约束，账号删除后历史仍保留。
+    """
+
+    account = models.ForeignKey(
+        OpenVPNAccount,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='+',
+        verbose_name='OpenVPN账号'
+    )
+    username = models.CharField('VPN账号', max_length=100)
+    router = models.CharField('所属路由器', max_length=50)
+    day = models.DateField('日期')
+    observed_at = models.DateTimeField('同步时间')
+    connected_at = models.DateTimeField('连接时间', null=True)
+    disconnected_at = models.DateTimeField('下线时间', null=True, help_text='仍在线时为空')
+    ip_addr = models.GenericIPAddressField('IP地址', null=True)
+    new_session = models.BooleanField('新会话', default=False, help_text='与上次同步相比是一次新的连接')
+    duration_delta = models.IntegerField('新增在线时长（秒）', default=0)
+
+    class Meta:
+        db_table = 'openvpn_connection_event'
+        verbose_name = '连接记录'
+        verbose_name_plural = '连接记录'
+        indexes = [
+            models.Index(fields=['day', 'router']),
+            models.Index(fields=['account', 'observed_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.username} @ {self.observed_at}'
+
+
+class ConnectionRollup(models.Model):
+    """连接历史的小时 / 天汇总（按路由器），由 rollup_connection_history 定时维护"""
+
+    GRANULARITY_CHOICES = [
+        ('hour', '小时'),
+        ('day', '天'),
+    ]
+
+    granularity = models.CharField('粒度', max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField('时间段开始')
+    router = models.CharField('所属路由器', max_length=50)
+    sessions = models.IntegerField('新会话数', default=0)
+    active_accounts = models.IntegerField('活跃账号数', default=0)
+    online_seconds = models.BigIntegerField('在线时长（秒）', default=0)
+    events = models.IntegerField('原始记录数', default=0)
 
+    class Meta:
+        db_table = 'openvpn_connection_rollup'
+        verbose_name = '连接汇总'
+        verbose_name_plural = '连接汇总'
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'bucket', 'router'], name='uniq_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_granularity_display()} {self.bucket} {self.router}'
+
+
+class DepartmentUsage(models.Model):
+    """
+    按部门汇总的 VPN 使用情况
+
+    由同步和账号生命周期中的变更增量维护，rebuild_department_usage 定时全量重算
+    （临近过期的统计依赖当前时间，也由重算校正）。department 为空的一行为未分配部门的账号。
+    每个部门（含未分配）一行由 bucket 的唯一约束保证：department 可以为 NULL，而 NULL 不受唯一约束限制。
+    """
+
+    # 未分配部门的 bucket（部门ID来自外部系统，均为正数）
+    UNASSIGNED = -1
+
+    bucket = models.BigIntegerField(
+        '汇总键',
+        unique=True,
+        editable=False,
+        help_text='部门ID，未分配部门为 -1'
+    )
+    department = models.OneToOneField(
+        'account.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='vpn_usage',
+        verbose_name='部门'
+    )
+    accounts = models.IntegerField('账号数', default=0)
+    active_accounts = models.IntegerField('正常账号数', default=0)
+    online_seconds = models.BigIntegerField('在线时长（秒）', default=0)
+    packages = models.BigIntegerField('流量包（字节）', default=0)
+    expiring_soon = models.IntegerField('即将过期', default=0, help_text='DEPARTMENT_USAGE 中 expiring_days 天内过期的正常账号')
+    updated_at = models.DateTimeField('更新时间', default=timezone.now)
+
+    class Meta:
+        db_table = 'openvpn_department_usage'
+        verbose_name = '部门使用情况'
+        verbose_name_plural = '部门使用情况'
+        ordering = ['-active_accounts']
+
+    @classmethod
+    def bucket_for(cls, department_id):
+        return cls.UNASSIGNED if department_id is None else department_id
+
+    def __str__(self):
+        return f'{self.department or "未分配部门"}'
@@ -0,0 +1,146 @@
+"""
+Debounced propagation of LDAP password changes to the routers.
+
+LDAP 登录成功后 CustomLDAPBackend 把密码写入 UserProfile.plain_password，VPN 密码应随之变化：
+
+- UserProfile 保存时与加载时的 plain_password 比较（connect_signals），变化后把用户的
+  OpenVPNAccount.password 改为新密码，并记下 password_changed_at（待写回）
+- 事务提交后投递 sync_account_passwords，延迟 debounce_seconds 执行；窗口内的其他变更
+  只做标记，不重复投递（Django 缓存中的占位键）
+- flush() 按主键分批读取待写回的账号，每台路由器一个客户端（共享会话）、只拉取一次快照，
+  以快照记录为基础构造完整的编辑请求逐条 update_account，成功后清除 password_changed_at
+
+定时同步遇到待写回的账号时保留本地密码，不会用路由器上的旧密码覆盖（见 update_from_ikuai_data）。
+写回失败的账号保持待写回状态，由下一次变更或定时任务重试。
+"""
+
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_KEY = 'passwords:v1:scheduled'
+
+
+def _config():
+    return {
+        'debounce_seconds': 30,
+        'batch_size': 500,
+        **getattr(settings, 'PASSWORD_SYNC', {}),
+    }
+
+
+def changed(user_id, password):
+    """用户的密码已变化：更新本地 VPN 密码并标记待写回，返回更新的账号数"""
+    from sync_manager.models import OpenVPNAccount
+
+    # queryset.update 不触发信号；身份缓存由同一次 UserProfile 保存的信号失效
+    now = timezone.now()
+    count = OpenVPNAccount.objects.filter(user_id=user_id).exclude(status='deleting').update(
+        password=password, password_changed_at=now, updated_at=now,
+    )
+    if count:
+        transaction.on_commit(schedule)
+    return count
+
+
+def schedule():
+    """debounce_seconds 后执行一次 sync_account_passwords；窗口内重复调用只投递一次"""
+    from sync_manager.tasks import sync_account_passwords
+
+    debounce = _config()['debounce_seconds']
+    if cache.add(SCHEDULED_KEY, 1, debounce):
+        sync_account_passwords.apply_async(countdown=debounce)
+
+
+def flush(deadline_seconds=None):
+    """
+    把待写回的密码推送到路由器，返回 {'pushed', 'unchanged', 'missing', 'errors'}
+
+    只处理开始前已标记的账号；执行期间的新变更保持标记，由再次投递的任务处理。
+    """
+    from sync_manager import routers
+    from sync_manager.client.schemas import EditPPPUserRequestData
+    from sync_manager.models import OpenVPNAccount
+
+    # 先释放占位：执行期间的新变更会投递新的任务
+    cache.delete(SCHEDULED_KEY)
+    started = timezone.now()
+    batch_size = _config()['batch_size']
+    pending = OpenVPNAccount.objects.filter(
+        password_changed_at__isnull=False, password_changed_at__lte=started,
+    ).order_by('pk').only('router', 'username', 'password')
+
+    clients = {}
+    snapshots = {}
+    errors = {}
+    counts = defaultdict(int)
+    last = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        last = batch[-1].pk
+        done = []
+        for account in batch:
+            router = account.router
+            if router in errors:
+                continue
+            try:
+                if router not in snapshots:
+                    clients[router] = routers.get_client(router, deadline_seconds)
+                    snapshots[router] = {record.username: record for record in clients[router].list_accounts()}
+                record = snapshots[router].get(account.username)
+                if record is None:
+                    # 路由器上没有这个账号，重建时会使用本地的新密码
+                    logger.warning(f'Account {account.username} not found in iKuai router {router}')
+                    counts['missing'] += 1
+                elif record.passwd == account.password:
+                    counts['unchanged'] += 1
+                else:
+                    clients[router].update_account(
+                        record.id, EditPPPUserRequestData.from_record(record, passwd=account.password),
+                    )
+                    counts['pushed'] += 1
+                done.append(account.pk)
+            except Exception as e:
+                # 同一台路由器的其余账号留到下次
+                logger.error(f'Error pushing passwords to router {router}: {str(e)}')
+                errors[router] = str(e)
+        OpenVPNAccount.objects.filter(pk__in=done, password_changed_at__lte=started).update(password_changed_at=None)
+        if len(batch) < batch_size:
+            break
+
+    logger.info(f'Pushed {counts["pushed"]} password changes to routers')
+    return {
+        'pushed': counts['pushed'],
+        'unchanged': counts['unchanged'],
+        'missing': counts['missing'],
+        'errors': errors,
+    }
+
+
+def connect_signals():
+    """UserProfile 保存时检测 plain_password 的变化（在 AppConfig.ready 中调用）"""
+    from django.db.models.signals import post_save
+
+    from account.models import UserProfile
+
+    def profile_saved(sender, instance, created, update_fields=None, **kwargs):
+        password = instance.plain_password
+        loaded = getattr(instance, '_loaded_plain_password', None)
+        instance._loaded_plain_password = password
+        if created or loaded is None or password == loaded:
+            return
+        if update_fields is not None and 'plain_password' not in update_fields:
+            return
+        if not password or password == UserProfile.PLACEHOLDER_PASSWORD:
+            return
+        changed(instance.user_id, password)
+
+    post_save.connect(profile_saved, sender=UserProfile, weak=False, dispatch_uid='password_sync_profile_saved')
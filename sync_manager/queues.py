@@ -0,0 +1,67 @@
+"""
+Celery queue inspection and autoscaling hints.
+
+读取 Redis broker 中各队列的积压消息数，并根据 CELERY_QUEUE_AUTOSCALE
+给出每个队列建议的 worker 进程数。
+"""
+
+import math
+
+from django.conf import settings
+
+
+def _queue_keys(queue):
+    """
+    Redis 优先级队列在 broker 中对应的全部 key
+
+    kombu 将每个优先级档位存为单独的 list：priority 0 为队列名本身，
+    其余为 `{queue}{sep}{priority}`。
+    """
+    options = getattr(settings, 'CELERY_BROKER_TRANSPORT_OPTIONS', {})
+    sep = options.get('sep', '\x06\x16')
+    steps = options.get('priority_steps', [0])
+    return [queue if step == 0 else f'{queue}{sep}{step}' for step in steps]
+
+
+def get_queue_names():
+    """返回已声明的队列名称"""
+    return [queue.name for queue in getattr(settings, 'CELERY_TASK_QUEUES', ())]
+
+
+def get_queue_depths():
+    """返回各队列积压的消息数 {队列名: 数量}"""
+    import redis
+
+    client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_connect_timeout=2, socket_timeout=2)
+    depths = {}
+    with client.pipeline(transaction=False) as pipe:
+        names = get_queue_names()
+        for name in names:
+            for key in _queue_keys(name):
+                pipe.llen(key)
+        results = iter(pipe.execute())
+        for name in names:
+            depths[name] = sum(next(results) for _ in _queue_keys(name))
+    return depths
+
+
+def autoscale_hint(queue, depth):
+    """
+    根据积压消息数给出建议的 worker 进程数
+
+    建议值 = ceil(积压 / target_backlog)，并限制在 [min, max] 区间内。
+    """
+    policy = getattr(settings, 'CELERY_QUEUE_AUTOSCALE', {}).get(queue, {})
+    minimum = policy.get('min', 1)
+    maximum = policy.get('max', minimum)
+    target = max(policy.get('target_backlog', 1), 1)
+    return max(minimum, min(maximum, math.ceil(depth / target)))
+
+
+def get_autoscale_hints(depths=None):
+    """返回各队列的积压与建议进程数 {队列名: {'depth': n, 'workers': m}}"""
+    depths = get_queue_depths() if depths is None else depths
+    return {
+        name: {'depth': depth, 'workers': autoscale_hint(name, depth)}
+        for name, depth in depths.items()
+    }
@@ -0,0 +1,173 @@
+"""
+iKuai router registry, client pool and account placement.
+
+多台 iKuai 路由器共同承载 OpenVPN 账号：
+- IKUAI_ROUTERS 声明所有路由器（名称 -> 连接配置）
+- 每台路由器在进程内共享一个有上限的连接池（HTTPAdapter），每个线程 / greenlet 各用一个会话
+  （登录 cookie 互不干扰），threads、gevent、eventlet 和 prefork 池下都可以安全并发
+- 新账号按 IKUAI_PLACEMENT 策略分配到某台路由器
+"""
+
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db.models import Count
+
+from sync_manager.client.ikuai import Deadline, IKuaiAPIClient, IKuaiError, new_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTER = 'default'
+
+# 默认每台路由器的最大连接数，可通过 IKUAI_CONFIG['pool_maxsize'] 覆盖
+DEFAULT_POOL_MAXSIZE = 10
+
+# 每台路由器一个共享的连接池（urllib3 连接池是线程安全的），按 pid 在 fork 后重建
+_adapters = {}
+_adapters_pid = None
+_adapters_lock = threading.Lock()
+# 会话按线程（gevent / eventlet 打补丁后为 greenlet）保存
+_local = threading.local()
+
+
+def get_routers():
+    """
+    返回路由器注册表 {名称: 配置}
+
+    未配置 IKUAI_ROUTERS 时，使用 IKUAI_CONFIG 作为唯一的 default 路由器。
+    """
+    routers = getattr(settings, 'IKUAI_ROUTERS', None)
+    if routers:
+        return routers
+    ikuai_config = getattr(settings, 'IKUAI_CONFIG', {})
+    return {DEFAULT_ROUTER: ikuai_config}
+
+
+def get_router_config(name):
+    """获取单台路由器的配置，不存在时抛出 IKuaiError"""
+    try:
+        return get_routers()[name]
+    except KeyError:
+        raise IKuaiError(f'Unknown iKuai router: {name}')
+
+
+def _get_adapter(name):
+    """
+    路由器的共享 HTTPAdapter
+
+    pool_block=True：并发请求超过 pool_maxsize 时排队等待空闲连接，而不是为每个
+    线程 / greenlet 新建连接，几百个并发任务也只占用有限的路由器连接。
+    """
+    global _adapters_pid
+    with _adapters_lock:
+        if _adapters_pid != os.getpid():
+            # fork 出的子进程不能沿用父进程的 socket
+            _adapters.clear()
+            _adapters_pid = os.getpid()
+        adapter = _adapters.get(name)
+        if adapter is None:
+            from requests.adapters import HTTPAdapter
+
+            ikuai_config = {**getattr(settings, 'IKUAI_CONFIG', {}), **get_router_config(name)}
+            maxsize = ikuai_config.get('pool_maxsize', DEFAULT_POOL_MAXSIZE)
+            # 重试由 IKuaiAPIClient 按操作是否幂等处理
+            adapter = _adapters[name] = HTTPAdapter(pool_connections=1, pool_maxsize=maxsize, pool_block=True)
+        return adapter
+
+
+def _get_session(name):
+    """当前线程 / greenlet 访问该路由器的会话，底层连接池在进程内共享"""
+    sessions = getattr(_local, 'sessions', None)
+    if sessions is None or _local.pid != os.getpid():
+        sessions = _local.sessions = {}
+        _local.pid = os.getpid()
+    session = sessions.get(name)
+    if session is None:
+        adapter = _get_adapter(name)
+        session = sessions[name] = new_session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+
+def get_client(name, deadline_seconds=None):
+    """
+    获取指定路由器的 API 客户端
+
+    客户端本身很轻量，每个任务各建一个以携带自己的截止时间；
+    HTTP 会话按线程 / greenlet 复用，连接池按路由器在进程内共享。
+    超时、重试等通用参数取自 IKUAI_CONFIG，可在单台路由器配置中覆盖。
+
+    Args:
+        name: 路由器名称
+        deadline_seconds: 整体截止时间（秒），为空则不限制
+    """
+    ikuai_config = {**getattr(settings, 'IKUAI_CONFIG', {}), **get_router_config(name)}
+    return IKuaiAPIClient(
+        ikuai_config.get('base_url', 'http://192.168.1.1'),
+        ikuai_config.get('username', 'admin'),
+        ikuai_config.get('password', 'admin'),
+        timeouts=ikuai_config.get('timeouts'),
+        max_retries=ikuai_config.get('max_retries', 2),
+        retry_backoff=ikuai_config.get('retry_backoff', 0.5),
+        retry_backoff_max=ikuai_config.get('retry_backoff_max', 5),
+        deadline=Deadline(deadline_seconds),
+        session=_get_session(name),
+        name=name,
+    )
+
+
+def get_router_loads():
+    """返回每台路由器当前承载的账号数 {名称: 数量}"""
+    from sync_manager.models import OpenVPNAccount
+
+    loads = {name: 0 for name in get_routers()}
+    rows = (
+        OpenVPNAccount.objects.exclude(status='failed')
+        .values('router')
+        .annotate(count=Count('id'))
+    )
+    for row in rows:
+        loads[row['router']] = row['count']
+    return loads
+
+
+def _least_loaded(candidates):
+    """按 已用/容量 选出负载最低的路由器"""
+    routers = get_routers()
+    loads = get_router_loads()
+    return min(
+        candidates,
+        key=lambda name: loads.get(name, 0) / max(routers[name].get('capacity', 1000), 1),
+    )
+
+
+def choose_router(user):
+    """
+    为新账号选择路由器
+
+    策略由 IKUAI_PLACEMENT['strategy'] 决定：
+    - least_loaded: 选择 已用/容量 最低的路由器
+    - department: 按用户部门查 department_routers 映射，未映射的部门回退到 least_loaded
+
+    enabled=False 的路由器不再接收新账号（用于下线前排空），但仍参与同步。
+    """
+    routers = get_routers()
+    candidates = [name for name, conf in routers.items() if conf.get('enabled', True)]
+    if not candidates:
+        raise IKuaiError('No iKuai router is accepting new accounts')
+
+    placement = getattr(settings, 'IKUAI_PLACEMENT', {})
+    if placement.get('strategy') == 'department':
+        profile = getattr(user, 'profile', None)
+        department_id = profile.department_id if profile else None
+        mapping = {str(k): v for k, v in placement.get('department_routers', {}).items()}
+        router = mapping.get(str(department_id))
+        if router in candidates:
+            return router
+        if router:
+            logger.warning(f'部门 {department_id} 映射的路由器 {router} 不可用，回退到 least_loaded')
+
+    return _least_loaded(candidates)
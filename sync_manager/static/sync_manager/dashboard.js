@@ -0,0 +1,187 @@
+// 页面相关的数据（接口地址、是否轮询）放在 <body> 的 data-* 属性上，本文件可以长期缓存
+const PAGE = document.body.dataset;
+let passwordVisible = false;
+let pollingInterval = null;
+
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+function togglePassword() {
+    const display = document.getElementById('password-display');
+    passwordVisible = !passwordVisible;
+    display.textContent = passwordVisible ? display.dataset.password : '••••••••';
+}
+
+function showCreateModal() {
+    document.getElementById('createModal').classList.add('active');
+}
+
+function showRenewModal() {
+    document.getElementById('renewModal').classList.add('active');
+}
+
+function closeModal(modalId) {
+    document.getElementById(modalId).classList.remove('active');
+}
+
+function downloadConfig() {
+    window.location.href = PAGE.downloadUrl;
+}
+
+function confirmDelete() {
+    if (confirm('确定要删除账号吗？此操作不可恢复！')) {
+        deleteAccount();
+    }
+}
+
+function retryCreate() {
+    if (confirm('确定要重新创建账号吗？')) {
+        deleteAccount().then(() => {
+            setTimeout(() => showCreateModal(), 500);
+        });
+    }
+}
+
+async function createAccount(formData) {
+    try {
+        // 将 FormData 转换为 URLSearchParams 以确保正确发送
+        const params = new URLSearchParams();
+        for (const [key, value] of formData.entries()) {
+            params.append(key, value);
+        }
+
+        const response = await fetch(PAGE.createUrl, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: params.toString()
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            alert('账号创建请求已提交！页面将自动刷新...');
+            closeModal('createModal');
+            startPolling();
+            setTimeout(() => location.reload(), 2000);
+        } else {
+            alert('创建失败: ' + data.message);
+        }
+    } catch (error) {
+        alert('请求失败: ' + error.message);
+    }
+}
+
+async function renewAccount(formData) {
+    try {
+        // 将 FormData 转换为 URLSearchParams 以确保正确发送
+        const params = new URLSearchParams();
+        for (const [key, value] of formData.entries()) {
+            params.append(key, value);
+        }
+
+        const response = await fetch(PAGE.renewUrl, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: params.toString()
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            alert('续期成功！');
+            closeModal('renewModal');
+            location.reload();
+        } else {
+            alert('续期失败: ' + data.message);
+        }
+    } catch (error) {
+        alert('请求失败: ' + error.message);
+    }
+}
+
+async function deleteAccount() {
+    try {
+        const response = await fetch(PAGE.deleteUrl, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            }
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            alert('账号已删除！');
+            location.reload();
+        } else {
+            alert('删除失败: ' + data.message);
+        }
+    } catch (error) {
+        alert('请求失败: ' + error.message);
+    }
+}
+
+function startPolling() {
+    if (pollingInterval) return;
+
+    pollingInterval = setInterval(async () => {
+        try {
+            const response = await fetch(PAGE.statusUrl);
+            const data = await response.json();
+
+            if (data.success && data.status !== 'creating' && data.status !== 'deleting') {
+                clearInterval(pollingInterval);
+                location.reload();
+            }
+        } catch (error) {
+            console.error('Polling error:', error);
+        }
+    }, 3000);
+}
+
+// Form submissions
+document.getElementById('createForm').addEventListener('submit', (e) => {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    console.log('submit',e);
+
+    createAccount(formData);
+});
+
+document.getElementById('renewForm').addEventListener('submit', (e) => {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    renewAccount(formData);
+});
+
+// Close modals on outside click
+document.querySelectorAll('.modal').forEach(modal => {
+    modal.addEventListener('click', (e) => {
+        if (e.target === modal) {
+            closeModal(modal.id);
+        }
+    });
+});
+
+// Auto-poll if status is creating / deleting
+if (PAGE.polling) {
+    startPolling();
+}
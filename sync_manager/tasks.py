@@ -2,20 +2,34 @@
 Celery tasks for sync_manager app - OpenVPN Account Management.
 """
 
+import contextvars
 import logging
-import requests
+from collections import defaultdict
 from celery import shared_task
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import datetime, timedelta
-from sync_manager.client.ikuai import IKuaiAPIClient
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from sync_manager import routers
+from config import identity_cache, metrics, pools, tracing
 
 logger = logging.getLogger(__name__)
 
+# 硬超时在整体截止时间基础上预留的收尾时间（秒）
+TIME_LIMIT_MARGIN = 60
+# 同步结果批量写入时每条 UPDATE 的行数
+SYNC_BATCH_SIZE = 500
 
 
-@shared_task(bind=True, max_retries=1)
-def create_openvpn_account(self, user_id, username, password, expires_days=30, **kwargs):
+def _deadline_seconds(operation):
+    """读取某类任务的整体截止时间（秒）"""
+    ikuai_config = getattr(settings, 'IKUAI_CONFIG', {})
+    return ikuai_config.get('deadlines', {}).get(operation, 120)
+
+
+@shared_task(bind=True, max_retries=1, time_limit=_deadline_seconds('create') + TIME_LIMIT_MARGIN)
+def create_openvpn_account(self, user_id, username, password, expires_days=30, router=None, **kwargs):
     """
     创建 OpenVPN 账号的 Celery 任务
     
@@ -24,42 +38,39 @@ def create_openvpn_account(self, user_id, username, password, expires_days=30, *
         username: VPN账号用户名
         password: VPN账号密码
         expires_days: 账号有效期（天）
+        router: 目标路由器名称，为空则按放置策略选择
         **kwargs: 其他可选参数
     """
     from sync_manager.models import OpenVPNAccount
-    from django.conf import settings
     
     try:
         # 获取用户
         user = User.objects.get(id=user_id)
         
         # 获取或创建账号记录
-        account, created = OpenVPNAccount.objects.get_or_create(
-            user=user,
-            defaults={
-                'username': username,
-                'password': password,
-                'status': 'creating',
-                'task_id': self.request.id,
-            }
-        )
-        
-        
-        if not created:
-            account.status = 'creating'
-            account.task_id = self.request.id
-            account.error_message = ''
-            account.save()
+        with tracing.db_span('db.prepare_account'):
+            account, created = OpenVPNAccount.objects.get_or_create(
+                user=user,
+                defaults={
+                    'username': username,
+                    'password': password,
+                    'status': 'creating',
+                    'task_id': self.request.id,
+                    'router': router or routers.choose_router(user),
+                }
+            )
+            
+            if not created:
+                account.status = 'creating'
+                account.task_id = self.request.id
+                account.error_message = ''
+                account.save()
         if created and account.status == 'creating':
             return {'status': 'already creating'}
-        # 获取 iKuai 配置
-        ikuai_config = getattr(settings, 'IKUAI_CONFIG', {})
-        base_url = ikuai_config.get('base_url', 'http://192.168.1.1')
-        admin_user = ikuai_config.get('username', 'admin')
-        admin_pass = ikuai_config.get('password', 'admin')
-        
-        # 创建 API 客户端
-        client = IKuaiAPIClient(base_url, admin_user, admin_pass)
+        # 等待路由器期间不占用数据库连接（I/O 型执行池，见 config/pools.py）
+        pools.release_db_connection()
+        # 创建 API 客户端（整体截止时间覆盖登录、创建和回查）
+        client = routers.get_client(account.router, _deadline_seconds('create'))
         
         # 调用 iKuai API 创建账号
         result = client.create_account(
@@ -75,9 +86,10 @@ def create_openvpn_account(self, user_id, username, password, expires_days=30, *
         
         if ikuai_account:
             # 更新本地账号信息
-            account.update_from_ikuai_data(ikuai_account)
-            account.status = 'active'
-            account.save()
+            with tracing.db_span('db.save_account'):
+                changed = account.update_from_ikuai_data(ikuai_account)
+                account.status = 'active'
+                account.save(update_fields=[*changed, 'status', 'updated_at'])
             
             logger.info(f'Successfully created OpenVPN account for user {user.username}')
             return {
@@ -105,21 +117,73 @@ def create_openvpn_account(self, user_id, username, password, expires_days=30, *
         # raise self.retry(exc=exc, countdown=60)
 
 
-@shared_task
+def _fetch_router_snapshot(router, deadline_seconds):
+    """
+    拉取单台路由器的全部 pppuser，返回 {username: PPPUserRecord}
+
+    在线程池中并行执行，只做 HTTP 调用，不访问数据库。
+    """
+    client = routers.get_client(router, deadline_seconds)
+    return {account.username: account for account in client.list_accounts()}
+
+
+def _save_changed(accounts_by_fields, now):
+    """
+    按变化的字段分组 bulk_update，返回写入的账号数
+
+    bulk_update 不触发 post_save，需要显式使身份缓存失效，
+    并重建用户名或 IP 变化的账号的搜索索引。
+    """
+    from account import search
+    from sync_manager.models import OpenVPNAccount
+
+    count = 0
+    user_ids = []
+    search_user_ids = []
+    for fields, accounts in accounts_by_fields.items():
+        for account in accounts:
+            account.updated_at = now
+            user_ids.append(account.user_id)
+        if fields & {'username', 'ip_addr'}:
+            search_user_ids.extend(account.user_id for account in accounts)
+        OpenVPNAccount.objects.bulk_update(accounts, [*sorted(fields), 'updated_at'], batch_size=SYNC_BATCH_SIZE)
+        count += len(accounts)
+    identity_cache.invalidate_users(user_ids)
+    search.mark(search_user_ids)
+    return count
+
+
+@shared_task(time_limit=_deadline_seconds('sync') + TIME_LIMIT_MARGIN, acks_late=True, reject_on_worker_lost=True)
 def sync_openvpn_accounts():
     """
     同步所有 OpenVPN 账号状态的定时任务
+
+    所有路由器的账号快照并行拉取（每台一次全量分页），
+    再在当前线程中按 router + username 与本地账号对账。
     """
+    from sync_manager import history, usage
     from sync_manager.models import OpenVPNAccount
-    from django.conf import settings
     MIDDLE_STATE = ['creating', 'deleting']
     try:
-        ikuai_config = getattr(settings, 'IKUAI_CONFIG', {})
-        base_url = ikuai_config.get('base_url', 'http://192.168.1.1')
-        admin_user = ikuai_config.get('username', 'admin')
-        admin_pass = ikuai_config.get('password', 'admin')
+        router_names = list(routers.get_routers())
+        deadline_seconds = _deadline_seconds('sync')
         
-        client = IKuaiAPIClient(base_url, admin_user, admin_pass)
+        # 并行拉取每台路由器的快照
+        snapshots = {}
+        errors = {}
+        with metrics.SYNC_PHASE_SECONDS.labels('router', 'fetch').time(), tracing.span('sync.fetch_snapshots'):
+            with ThreadPoolExecutor(max_workers=len(router_names)) as executor:
+                # 线程池中沿用当前的 trace 上下文
+                futures = {
+                    name: executor.submit(contextvars.copy_context().run, _fetch_router_snapshot, name, deadline_seconds)
+                    for name in router_names
+                }
+                for name, future in futures.items():
+                    try:
+                        snapshots[name] = future.result()
+                    except Exception as e:
+                        logger.error(f'Error fetching accounts from router {name}: {str(e)}')
+                        errors[name] = str(e)
         
         # 获取所有活跃账号
         accounts = OpenVPNAccount.objects.filter(
@@ -127,38 +191,75 @@ def sync_openvpn_accounts():
         )
         
         synced_count = 0
-        for account in accounts:
-            try:
-                ikuai_account = client.get_account(account.username)
+        missing_count = 0
+        # 变化的字段集合 -> 账号列表
+        changed_accounts = defaultdict(list)
+        # 连接历史（见 sync_manager/history.py）
+        events = []
+        now = timezone.now()
+        # 部门汇总的增量（见 sync_manager/usage.py）
+        usage_changes = usage.Changes(now)
+        synced_per_router = {name: 0 for name in router_names}
+        reconcile_timer = metrics.SYNC_PHASE_SECONDS.labels('router', 'reconcile').time()
+        tz = timezone.get_current_timezone()
+        with reconcile_timer, tracing.db_span('db.reconcile_accounts'):
+            for account in accounts:
+                snapshot = snapshots.get(account.router)
+                if snapshot is None:
+                    # 路由器拉取失败（或已从注册表移除）
+                    logger.error(f'Error syncing account {account.username}: router {account.router} unavailable')
+                    # 如果创建时间超时1小时，则标记为失败
+                    if account.status in MIDDLE_STATE and timezone.now() - account.created_at > timedelta(hours=1):
+                        account.status = 'failed'
+                        account.error_message = '操作超时,请手动重试。'
+                        account.save(update_fields=['status', 'error_message', 'updated_at'])
+                    continue
                 
+                ikuai_account = snapshot.get(account.username)
                 if ikuai_account:
-                    account.update_from_ikuai_data(ikuai_account)
-                    account.save()
+                    previous = history.snapshot(account)
+                    changed = account.update_from_ikuai_data(ikuai_account, tz)
+                    if changed:
+                        changed_accounts[frozenset(changed)].append(account)
+                        if changed & usage.TRACKED_FIELDS:
+                            usage_changes.saved(account)
+                        event = history.observe(account, previous, changed, now)
+                        if event is not None:
+                            events.append(event)
                     synced_count += 1
+                    synced_per_router[account.router] += 1
                 else:
-                    logger.warning(f'Account {account.username} not found in iKuai')
-            except Exception as e:
-                logger.error(f'Error syncing account {account.username}: {str(e)}')
-                # 如果创建时间超时1小时，则标记为失败
-                if account.status in MIDDLE_STATE and timezone.now() - account.created_at > timedelta(hours=1):
-                    account.status = 'failed'
-                    account.error_message = '操作超时,请手动重试。'
-                    account.save()
-                continue
+                    missing_count += 1
+                    logger.warning(f'Account {account.username} not found in iKuai router {account.router}')
+
+            # 没有变化的账号不写入
+            updated_count = _save_changed(changed_accounts, now)
+            history.record(events)
+            usage_changes.apply()
         
-        logger.info(f'Successfully synced {synced_count} OpenVPN accounts')
-        return {'status': 'success', 'synced_count': synced_count}
+        metrics.SYNC_ROWS.labels('router', 'accounts', 'updated').inc(updated_count)
+        metrics.SYNC_ROWS.labels('router', 'accounts', 'unchanged').inc(synced_count - updated_count)
+        metrics.SYNC_ROWS.labels('router', 'accounts', 'missing').inc(missing_count)
+        logger.info(f'Successfully synced {synced_count} OpenVPN accounts: {synced_per_router}')
+        return {
+            'status': 'success' if not errors else 'partial',
+            'synced_count': synced_count,
+            'updated_count': updated_count,
+            'routers': synced_per_router,
+            'errors': errors,
+        }
     
     except Exception as e:
         logger.error(f'Error in sync_openvpn_accounts: {str(e)}')
         raise
 
 
-@shared_task
+@shared_task(acks_late=True, reject_on_worker_lost=True)
 def check_expired_accounts():
     """
     检查并更新过期账号状态的定时任务
     """
+    from sync_manager import usage
     from sync_manager.models import OpenVPNAccount
     
     try:
@@ -170,7 +271,8 @@ def check_expired_accounts():
             expires__lt=now
         )
         
-        count = expired_accounts.update(status='expired')
+        count, user_ids = usage.update(expired_accounts, status='expired')
+        identity_cache.invalidate_users(user_ids)
         
         logger.info(f'Marked {count} accounts as expired')
         return {'status': 'success', 'expired_count': count}
@@ -180,7 +282,147 @@ def check_expired_accounts():
         raise
 
 
-@shared_task(bind=True, max_retries=3)
+@shared_task(time_limit=_deadline_seconds('sync') + TIME_LIMIT_MARGIN, acks_late=True, reject_on_worker_lost=True)
+def push_account_changes(account_ids):
+    """
+    把本地的启用状态和过期时间写回路由器（后台 / API 批量操作后调用）
+
+    每台涉及的路由器拉取一次快照，只编辑与本地不一致的 pppuser；
+    以数据库中的当前值为准，重复执行是幂等的。
+    """
+    from sync_manager.client.schemas import EditPPPUserRequestData
+    from sync_manager.models import OpenVPNAccount
+
+    try:
+        by_router = defaultdict(list)
+        for account in OpenVPNAccount.objects.filter(pk__in=account_ids).only('router', 'username', 'enabled', 'expires'):
+            by_router[account.router].append(account)
+
+        deadline_seconds = _deadline_seconds('sync')
+        pushed = 0
+        errors = {}
+        for router, accounts in by_router.items():
+            try:
+                client = routers.get_client(router, deadline_seconds)
+                snapshot = {record.username: record for record in client.list_accounts()}
+                for account in accounts:
+                    record = snapshot.get(account.username)
+                    if record is None:
+                        logger.warning(f'Account {account.username} not found in iKuai router {router}')
+                        continue
+                    changes = {}
+                    enabled = 'yes' if account.enabled else 'no'
+                    if record.enabled != enabled:
+                        changes['enabled'] = enabled
+                    expires = int(account.expires.timestamp()) if account.expires else 0
+                    if record.expires != expires:
+                        changes['expires'] = expires
+                    if changes:
+                        client.update_account(record.id, EditPPPUserRequestData.from_record(record, **changes))
+                        pushed += 1
+            except Exception as e:
+                logger.error(f'Error pushing account changes to router {router}: {str(e)}')
+                errors[router] = str(e)
+
+        logger.info(f'Pushed {pushed} account changes to routers')
+        return {'status': 'success' if not errors else 'partial', 'pushed_count': pushed, 'errors': errors}
+
+    except Exception as e:
+        logger.error(f'Error in push_account_changes: {str(e)}')
+        raise
+
+
+@shared_task(time_limit=_deadline_seconds('sync') + TIME_LIMIT_MARGIN, acks_late=True, reject_on_worker_lost=True)
+def sync_account_passwords():
+    """
+    把随 LDAP 变化的 VPN 密码批量写回路由器（见 sync_manager/passwords.py）
+
+    密码变更后延迟投递，合并一段时间内的所有变更；定时任务兜底重试写回失败的账号。
+    """
+    from sync_manager import passwords
+
+    try:
+        result = passwords.flush(_deadline_seconds('sync'))
+        return {'status': 'success' if not result['errors'] else 'partial', **result}
+
+    except Exception as e:
+        logger.error(f'Error in sync_account_passwords: {str(e)}')
+        raise
+
+
+@shared_task(time_limit=_deadline_seconds('sync') + TIME_LIMIT_MARGIN, acks_late=True, reject_on_worker_lost=True)
+def adopt_router_accounts(router_names=None, dry_run=False):
+    """
+    把路由器上已有、本地没有对应账号的 pppuser 收编为 OpenVPNAccount
+
+    每台路由器拉取一次快照，匹配规则见 sync_manager/adoption.py；
+    返回结果中的 unmatched 列出需要人工处理的 pppuser。
+    """
+    from sync_manager import adoption
+
+    try:
+        router_names = router_names or list(routers.get_routers())
+        deadline_seconds = _deadline_seconds('sync')
+        snapshots = {}
+        errors = {}
+        for name in router_names:
+            try:
+                snapshots[name] = _fetch_router_snapshot(name, deadline_seconds)
+            except Exception as e:
+                logger.error(f'Error fetching accounts from router {name}: {str(e)}')
+                errors[name] = str(e)
+
+        result = adoption.adopt(snapshots, dry_run=dry_run)
+        return {'status': 'success' if not errors else 'partial', **result, 'errors': errors}
+
+    except Exception as e:
+        logger.error(f'Error in adopt_router_accounts: {str(e)}')
+        raise
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def rollup_connection_history():
+    """
+    汇总连接历史并清理过期数据的定时任务
+
+    重新计算最近 3 小时的小时汇总和最近 1 天的天汇总（可重复执行），
+    再按 CONNECTION_HISTORY 中的保留天数清理。
+    """
+    from sync_manager import history
+
+    try:
+        now = timezone.now()
+        hourly = history.rollup('hour', now - timedelta(hours=3))
+        daily = history.rollup('day', now - timedelta(days=1))
+        purged = history.purge(now)
+
+        logger.info(f'Rolled up connection history: {hourly} hourly, {daily} daily rows, purged {purged}')
+        return {'status': 'success', 'hourly': hourly, 'daily': daily, 'purged': purged}
+
+    except Exception as e:
+        logger.error(f'Error rolling up connection history: {str(e)}')
+        raise
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def rebuild_department_usage():
+    """
+    全量重算部门使用情况的定时任务
+
+    校正增量更新无法覆盖的变化（即将过期随时间变化、用户更换部门）。
+    """
+    from sync_manager import usage
+
+    try:
+        count = usage.rebuild()
+        return {'status': 'success', 'departments': count}
+
+    except Exception as e:
+        logger.error(f'Error rebuilding department usage: {str(e)}')
+        raise
+
+
+@shared_task(bind=True, max_retries=3, time_limit=_deadline_seconds('delete') + TIME_LIMIT_MARGIN)
 def delete_openvpn_account(self, account_id):
     """
     删除 OpenVPN 账号的 Celery 任务
@@ -189,7 +431,6 @@ def delete_openvpn_account(self, account_id):
         account_id: OpenVPNAccount ID
     """
     from sync_manager.models import OpenVPNAccount
-    from django.conf import settings
     
     try:
         # 获取账号记录
@@ -204,15 +445,10 @@ def delete_openvpn_account(self, account_id):
         account.task_id = self.request.id
         account.error_message = ''
         account.save()
-        
-        # 获取 iKuai 配置
-        ikuai_config = getattr(settings, 'IKUAI_CONFIG', {})
-        base_url = ikuai_config.get('base_url', 'http://192.168.1.1')
-        admin_user = ikuai_config.get('username', 'admin')
-        admin_pass = ikuai_config.get('password', 'admin')
+        pools.release_db_connection()
         
         # 创建 API 客户端
-        client = IKuaiAPIClient(base_url, admin_user, admin_pass)
+        client = routers.get_client(account.router, _deadline_seconds('delete'))
         
         # 如果有 iKuai ID，尝试从 iKuai 删除账号
         if account.ikuai_id:
@@ -0,0 +1,3 @@
+"""
+Local stand-ins and benchmarks for exercising the iKuai client without a router.
+"""
@@ -0,0 +1,149 @@
+"""
+End-to-end benchmarks for the router client and OpenVPN tasks.
+
+每个规模启动一个预置 N 个 pppuser 的 FakeIKuaiServer，计时：
+- list_accounts: 拉取完整快照
+- sync_openvpn_accounts: N 个本地账号的全量对账
+- create: create_openvpn_account 任务（创建 + 回查）
+- delete: delete_openvpn_account 任务
+
+所有数据库写入都在事务中执行并在结束时回滚，不会污染数据库。
+结果与 baselines.json 对比，超出容差即视为性能回退。
+"""
+
+import importlib
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import override_settings
+
+from sync_manager.client.ikuai import IKuaiAPIClient
+from sync_manager.testing.fake_ikuai import FakeIKuaiServer
+
+SIZES = (100, 1000, 10000)
+BASELINE_PATH = Path(__file__).with_name('baselines.json')
+LAZY_MODULES = ('requests', 'cachetools', 'sync_manager.client.schemas')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _router_settings(server):
+    return override_settings(IKUAI_ROUTERS={
+        'default': {'base_url': server.base_url, 'username': server.username, 'password': server.password},
+    })
+
+
+def _seed_accounts(server):
+    """为路由器中的每个 pppuser 建立对应的本地用户和账号"""
+    from sync_manager.models import OpenVPNAccount
+
+    rows = list(server.rows.values())
+    users = User.objects.bulk_create([User(username=row['username']) for row in rows])
+    OpenVPNAccount.objects.bulk_create([
+        OpenVPNAccount(
+            user=user,
+            username=row['username'],
+            password=row['passwd'],
+            ikuai_id=row['id'],
+            router='default',
+            status='active',
+        )
+        for user, row in zip(users, rows)
+    ])
+
+
+def _time(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench_size(size, repeat=3, ops=10, latency=0.0):
+    """在单个规模下运行全部基准，返回 {操作: 秒}（create/delete 为单次平均耗时）"""
+    from sync_manager.models import OpenVPNAccount
+    from sync_manager.tasks import create_openvpn_account, delete_openvpn_account, sync_openvpn_accounts
+
+    # 首次使用时才导入的依赖在计时前导入，基准只统计稳态耗时（冷启动见 startup_budget）
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+
+    results = {}
+    with FakeIKuaiServer(users=size, latency=latency) as server, _router_settings(server):
+        results['list_accounts'] = _time(
+            lambda: IKuaiAPIClient(server.base_url, server.username, server.password).list_accounts(),
+            repeat,
+        )
+
+        try:
+            with transaction.atomic():
+                _seed_accounts(server)
+                results['sync_openvpn_accounts'] = _time(sync_openvpn_accounts, repeat)
+
+                new_users = User.objects.bulk_create([User(username=f'bench{i:05d}') for i in range(ops)])
+                start = time.perf_counter()
+                for user in new_users:
+                    OpenVPNAccount.objects.create(
+                        user=user, username=user.username, password='benchpass', status='creating', router='default',
+                    )
+                    create_openvpn_account.apply(kwargs={
+                        'user_id': user.id, 'username': user.username, 'password': 'benchpass', 'router': 'default',
+                    })
+                results['create'] = (time.perf_counter() - start) / ops
+
+                account_ids = list(
+                    OpenVPNAccount.objects.filter(user__in=new_users).values_list('id', flat=True)
+                )
+                start = time.perf_counter()
+                for account_id in account_ids:
+                    delete_openvpn_account.apply(args=[account_id])
+                results['delete'] = (time.perf_counter() - start) / max(len(account_ids), 1)
+                raise _Rollback
+        except _Rollback:
+            pass
+    return results
+
+
+def run_benchmarks(sizes=SIZES, repeat=3, ops=10, latency=0.0):
+    """返回 {操作: {规模: 秒}}"""
+    report = {}
+    for size in sizes:
+        for name, seconds in bench_size(size, repeat=repeat, ops=ops, latency=latency).items():
+            report.setdefault(name, {})[str(size)] = round(seconds, 6)
+    return report
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(report, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(report, baseline, tolerance=0.5):
+    """
+    对比基准结果，返回回退列表 [(操作, 规模, 基线, 当前)]
+
+    当前耗时超过 基线 * (1 + tolerance) 视为回退。
+    """
+    regressions = []
+    for name, by_size in report.items():
+        for size, seconds in by_size.items():
+            expected = baseline.get(name, {}).get(size)
+            if expected is not None and seconds > expected * (1 + tolerance):
+                regressions.append((name, size, expected, seconds))
+    return regressions
@@ -0,0 +1,237 @@
+"""
+Query-count and router-call budgets for views, admin pages and tasks.
+
+每个端点在不同规模的种子数据上各执行一次，记录：
+- queries / query_seconds: SQL 条数与总耗时
+- router_calls: 发往 FakeIKuaiServer 的请求数
+- seconds: 端点总耗时
+
+BUDGETS 为每个端点声明 `固定开销 + 每行开销 × 规模` 的上限。per_row 为 0 的端点
+（页面、后台列表）查询数不允许随行数增长，用于发现 N+1；任务允许按行增长，
+但不能超过声明的斜率。尚未修复的 N+1 记在 KNOWN_REGRESSIONS 中，不放宽预算：
+check() 默认仍判为失败，调用方显式容忍时才单独列出。所有写入都在事务中执行并回滚。
+"""
+
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import Department, UserProfile
+from config.tracing import QueryStats
+from sync_manager import usage
+from sync_manager.testing.benchmarks import _router_settings, _seed_accounts
+from sync_manager.testing.fake_ikuai import FakeIKuaiServer
+
+# 两个规模都要小于后台分页大小，列表页上的 N+1 才会体现为斜率
+SIZES = (10, 40)
+
+ADMIN_USERNAME = 'budget-admin'
+
+# {端点: {'queries': (固定, 每行), 'router_calls': (固定, 每行)}}
+BUDGETS = {
+    # 首次请求从数据库加载身份包（一条查询），之后命中身份缓存
+    'openvpn_dashboard': {'queries': (1, 0), 'router_calls': (0, 0)},
+    'account_status': {'queries': (1, 0), 'router_calls': (0, 0)},
+    # 账号 / 部门列表含部门子树筛选的选项（前两级部门，一条查询）；用户列表原有的部门筛选同样是一条
+    # 账号 / 用户列表另有一条表行数估计（决定是否切换 keyset 分页，之后命中缓存）
+    'admin_openvpnaccount_changelist': {'queries': (7, 0), 'router_calls': (0, 0)},
+    'admin_user_changelist': {'queries': (6, 0), 'router_calls': (0, 0)},
+    'admin_department_changelist': {'queries': (5, 0), 'router_calls': (0, 0)},
+    # 身份包 + 汇总表（含部门名）
+    'department_usage': {'queries': (2, 0), 'router_calls': (0, 0)},
+    'admin_departmentusage_changelist': {'queries': (4, 0), 'router_calls': (0, 0)},
+    # JSON API：身份包 + 账号列表（带部门字段，一条 JOIN 查询）
+    'api_accounts': {'queries': (2, 0), 'router_calls': (0, 0)},
+    # 批量续期全部用户：身份包、按用户名取账号、更新前后各读一次状态（加锁）、UPDATE、部门汇总，
+    # usage.update 的事务（保存点）；路由器回写在事务提交后由一个任务完成
+    'api_accounts_renew': {'queries': (9, 0), 'router_calls': (0, 0)},
+    # 查询账号 + 按变化字段分组的 bulk UPDATE（每 500 行一条）+ 连接历史 INSERT（每 1000 行一条）
+    # + 部门汇总（查部门、锁定汇总行、bulk UPDATE，外加保存点）；路由器调用为登录 + 每 100 条一页
+    'sync_openvpn_accounts': {'queries': (8, 0.003), 'router_calls': (2, 0.01)},
+    # 在一个事务（保存点）中加锁取出用户 id 和原状态（用于身份缓存失效和部门汇总），再批量更新，最后更新部门汇总
+    'check_expired_accounts': {'queries': (9, 0), 'router_calls': (0, 0)},
+    # 目标：按用户名批量读取用户 / profile，批量创建和更新（每 500 行几条查询）
+    'sync_ldap_users': {'queries': (10, 0.1), 'router_calls': (0, 0)},
+}
+
+# 已知超出预算的端点 -> 原因；check() 默认仍判为失败，只有显式容忍（tolerate_known）时
+# 才单独列出，修复后从这里移除
+KNOWN_REGRESSIONS = {
+    'sync_ldap_users': '逐个用户 get_or_create + save + profile 同步，每个用户约 17 条查询（N+1）',
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _seed(server, size):
+    """size 个本地用户/账号（与路由器中的 pppuser 一一对应）和 size // 4 个部门"""
+    from sync_manager.models import OpenVPNAccount
+
+    _seed_accounts(server)
+    departments = Department.objects.bulk_create([
+        Department(id=1000 + i, name=f'部门{i}') for i in range(max(size // 4, 1))
+    ])
+    profiles = [
+        UserProfile(user=user, employee_number=f'E{user.id:06d}', department=departments[i % len(departments)])
+        for i, user in enumerate(User.objects.all())
+    ]
+    UserProfile.objects.bulk_create(profiles)
+    # 一部分账号已过期，供 check_expired_accounts 处理
+    OpenVPNAccount.objects.filter(ikuai_id__lte=size // 5).update(expires=timezone.now() - timedelta(days=1))
+    usage.rebuild()
+
+    admin = User.objects.create_superuser(ADMIN_USERNAME, password='x')
+    client = Client()
+    client.force_login(admin)
+    return client, User.objects.filter(username__startswith='user').first()
+
+
+def _user_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _endpoints(server, size, admin_client, user):
+    """返回 {端点: 无参可调用对象}，调用前的准备工作不计入测量"""
+    from account import tasks as account_tasks
+    from account.testing import benchmarks as ldap_benchmarks
+    from account.testing.fake_ldap import FakeLDAPConnection, ensure_ldap_module, generate_directory
+    from sync_manager.tasks import check_expired_accounts, sync_openvpn_accounts
+
+    user_client = _user_client(user)
+    usernames = list(User.objects.filter(openvpn_account__isnull=False).values_list('username', flat=True))
+
+    ensure_ldap_module()
+    directory = generate_directory(users=size, departments=max(size // 4, 1))
+
+    def sync_ldap_users():
+        with ldap_benchmarks.ldap_settings():
+            conn = FakeLDAPConnection.from_directory(directory)
+            stats = ldap_benchmarks._new_stats()
+            account_tasks._sync_departments(conn, stats)
+            account_tasks._sync_users(conn, stats)
+
+    return {
+        'openvpn_dashboard': lambda: user_client.get(reverse('sync_manager:dashboard')),
+        'account_status': lambda: user_client.get(reverse('sync_manager:account_status')),
+        'admin_openvpnaccount_changelist': lambda: admin_client.get(
+            reverse('admin:sync_manager_openvpnaccount_changelist')),
+        'admin_user_changelist': lambda: admin_client.get(reverse('admin:auth_user_changelist')),
+        'admin_department_changelist': lambda: admin_client.get(
+            reverse('admin:account_department_changelist')),
+        'department_usage': lambda: admin_client.get(reverse('sync_manager:department_usage')),
+        'admin_departmentusage_changelist': lambda: admin_client.get(
+            reverse('admin:sync_manager_departmentusage_changelist')),
+        'api_accounts': lambda: admin_client.get(
+            reverse('api_v1:accounts'), {'fields': 'id,username,status,department', 'limit': 1000}),
+        'api_accounts_renew': lambda: admin_client.post(
+            reverse('api_v1:accounts_renew'), json.dumps({'users': usernames, 'days': 30}),
+            content_type='application/json'),
+        'sync_openvpn_accounts': sync_openvpn_accounts,
+        'check_expired_accounts': check_expired_accounts,
+        'sync_ldap_users': sync_ldap_users,
+    }
+
+
+def measure(func, server):
+    """执行 func，返回 SQL / 路由器调用统计"""
+    stats = QueryStats()
+    router_calls = server.count()
+    start = time.perf_counter()
+    with connection.execute_wrapper(stats):
+        result = func()
+    elapsed = time.perf_counter() - start
+    status = getattr(result, 'status_code', None)
+    if status is not None and status >= 400:
+        raise AssertionError(f'{func} 返回 HTTP {status}')
+    return {
+        'queries': stats.count,
+        'query_seconds': round(stats.seconds, 6),
+        'router_calls': server.count() - router_calls,
+        'seconds': round(elapsed, 6),
+    }
+
+
+def run_size(size, names=None):
+    """在单个规模下执行端点，返回 {端点: 统计}；每个端点使用独立的种子数据"""
+    results = {}
+    with FakeIKuaiServer(users=size) as server, _router_settings(server):
+        for name in names or BUDGETS:
+            try:
+                with transaction.atomic():
+                    admin_client, user = _seed(server, size)
+                    func = _endpoints(server, size, admin_client, user)[name]
+                    results[name] = measure(func, server)
+                    raise _Rollback
+            except _Rollback:
+                pass
+    return results
+
+
+def run_budgets(sizes=SIZES, names=None):
+    """返回 {端点: {规模: 统计}}"""
+    report = {}
+    for size in sizes:
+        for name, stats in run_size(size, names).items():
+            report.setdefault(name, {})[str(size)] = stats
+    return report
+
+
+def _problems(name, by_size, budget):
+    """
+    单个端点超出预算的描述
+
+    - 任一规模下 计数 > 固定 + 每行 × 规模
+    - 相邻规模之间的斜率 > 每行（即使绝对值仍在预算内，也说明出现了 N+1）
+    """
+    problems = []
+    sizes = sorted(by_size, key=int)
+    for metric, (fixed, per_row) in budget.items():
+        for size in sizes:
+            value = by_size[size][metric]
+            limit = fixed + per_row * int(size)
+            if value > limit:
+                problems.append(f'{name}@{size}: {metric}={value}，超出预算 {limit}')
+        for small, large in zip(sizes, sizes[1:]):
+            slope = (by_size[large][metric] - by_size[small][metric]) / (int(large) - int(small))
+            if slope > per_row:
+                problems.append(f'{name}: {metric} 随行数增长（每行 {slope:.2f}，预算 {per_row}）')
+    return problems
+
+
+def check(report, budgets=BUDGETS, tolerate_known=False):
+    """
+    检查报告是否超出预算，返回问题描述列表
+
+    KNOWN_REGRESSIONS 中的端点同样算作失败；调用方显式传入 tolerate_known=True 时才跳过，
+    由 known_regressions() 单独报告。
+    """
+    problems = []
+    for name, by_size in report.items():
+        budget = budgets.get(name)
+        if budget is None:
+            problems.append(f'{name}: 没有声明预算')
+        elif not (tolerate_known and name in KNOWN_REGRESSIONS):
+            problems.extend(_problems(name, by_size, budget))
+    return problems
+
+
+def known_regressions(report, budgets=BUDGETS, known=KNOWN_REGRESSIONS):
+    """
+    已知回归的端点仍超出的预算，返回 {端点: 问题描述列表}
+
+    已经回到预算内的端点返回空列表，提示从 KNOWN_REGRESSIONS 中移除。
+    """
+    return {
+        name: _problems(name, report[name], budgets[name])
+        for name in known if name in report
+    }
@@ -0,0 +1,334 @@
+"""
+Fake iKuai router HTTP server.
+
+实现 iKuai 管理接口中本项目用到的部分：
+- POST /Action/login
+- POST /Action/call，func_name=pppuser，action 为 add / show / edit / del
+
+支持：
+- 预置 N 个 pppuser
+- 可配置的响应延迟、随机错误率（返回 HTTP 500）和会话过期时间
+- 录制（转发到真实路由器并把请求/响应写入 JSONL）与回放
+
+用法：
+    with FakeIKuaiServer(users=1000, latency=0.01) as server:
+        client = IKuaiAPIClient(server.base_url, 'admin', 'admin')
+"""
+
+import hashlib
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+
+logger = logging.getLogger(__name__)
+
+RESULT_LOGIN_OK = 10000
+RESULT_OK = 30000
+RESULT_ERROR = 30001
+RESULT_NO_LOGIN = 10014
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # 执行池基准会同时发起几百个连接，默认的 listen backlog（5）会导致连接被丢弃重试
+    request_queue_size = 1024
+
+
+def make_pppuser(row_id, username, **overrides):
+    """生成一条与真实路由器字段一致的 pppuser 记录"""
+    now = int(time.time())
+    row = {
+        'id': row_id,
+        'username': username,
+        'passwd': f'pw{row_id:06d}',
+        'enabled': 'yes',
+        'ppptype': 'any',
+        'pppname': '',
+        'bind_ifname': 'any',
+        'bind_vlanid': '0',
+        'auto_vlanid': 1,
+        'pppoev6_wan': '',
+        'share': 1,
+        'auto_mac': 1,
+        'upload': 0,
+        'download': 0,
+        'packages': 0,
+        'ip_type': 0,
+        'ip_addr': f'10.{(row_id >> 16) & 255}.{(row_id >> 8) & 255}.{row_id & 255}',
+        'mac': '',
+        'address': '',
+        'name': username,
+        'phone': '',
+        'cardid': '',
+        'comment': f'Created for user: {username}',
+        'proxy_username': '',
+        'start_time': now - 86400,
+        'create_time': now - 86400,
+        'expires': now + 30 * 86400,
+        'last_conntime': now - 3600,
+        'last_offtime': now - 1800,
+        'duration': 1800,
+    }
+    row.update(overrides)
+    return row
+
+
+class FakeIKuaiServer:
+    """
+    在后台线程中运行的 iKuai 替身服务器
+
+    Args:
+        users: 预置的 pppuser 数量，用户名为 user00000 起
+        username / password: 管理员账号
+        latency: 每个请求的固定延迟（秒）
+        error_rate: 随机返回 HTTP 500 的概率（0~1）
+        session_ttl: 会话有效期（秒），为空则不过期
+        record_to: 录制模式，把与 upstream 之间的请求/响应写入该 JSONL 文件
+        upstream: 录制模式下转发的真实路由器地址
+        replay_from: 回放模式，从 JSONL 文件中按顺序返回录制的响应
+        seed: 随机数种子
+    """
+
+    def __init__(self, users=0, username='admin', password='admin', latency=0.0,
+                 error_rate=0.0, session_ttl=None, record_to=None, upstream=None,
+                 replay_from=None, seed=0, host='127.0.0.1', port=0):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.record_to = record_to
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.rows = {}
+        self.next_id = 1
+        self.requests = []
+        self.replay = self._load_replay(replay_from) if replay_from else None
+        for i in range(users):
+            self.add_row(f'user{i:05d}')
+
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    # ---- lifecycle ----
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- data ----
+
+    def add_row(self, username, **fields):
+        with self.lock:
+            row_id = self.next_id
+            self.next_id += 1
+            self.rows[row_id] = make_pppuser(row_id, username, **fields)
+            return row_id
+
+    def find(self, username):
+        with self.lock:
+            for row in self.rows.values():
+                if row['username'] == username:
+                    return dict(row)
+        return None
+
+    def expire_sessions(self):
+        """让所有已登录会话立即失效"""
+        with self.lock:
+            self.sessions.clear()
+
+    def count(self, action=None):
+        """统计收到的请求数，action 为空时统计全部"""
+        return sum(1 for a in self.requests if action is None or a == action)
+
+    # ---- protocol ----
+
+    def _login(self, payload):
+        expected = hashlib.md5(self.password.encode('utf-8')).hexdigest()
+        if payload.get('username') != self.username or payload.get('passwd') != expected:
+            return {'Result': 10001, 'ErrMsg': 'username or password error'}, None
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[token] = time.monotonic()
+        return {'Result': RESULT_LOGIN_OK, 'ErrMsg': 'Success'}, token
+
+    def _session_valid(self, token):
+        with self.lock:
+            created = self.sessions.get(token)
+            if created is None:
+                return False
+            if self.session_ttl is not None and time.monotonic() - created > self.session_ttl:
+                del self.sessions[token]
+                return False
+            return True
+
+    def _call(self, payload):
+        action = payload.get('action')
+        param = payload.get('param') or {}
+        if payload.get('func_name') != 'pppuser':
+            return {'Result': RESULT_ERROR, 'ErrMsg': 'unsupported func_name'}
+
+        with self.lock:
+            if action == 'add':
+                if any(r['username'] == param.get('username') for r in self.rows.values()):
+                    return {'Result': RESULT_ERROR, 'ErrMsg': 'username already exists'}
+                row_id = self.next_id
+                self.next_id += 1
+                fields = {k: v for k, v in param.items() if k not in ('id', 'username')}
+                self.rows[row_id] = make_pppuser(row_id, param.get('username'), **fields)
+                return {'Result': RESULT_OK, 'ErrMsg': 'Success', 'RowId': row_id}
+
+            if action == 'show':
+                offset, count = (int(x) for x in str(param.get('limit', '0,100')).split(','))
+                page = sorted(self.rows)[offset:offset + count]
+                return {
+                    'Result': RESULT_OK,
+                    'ErrMsg': 'Success',
+                    'Data': {'total': len(self.rows), 'data': [dict(self.rows[k]) for k in page]},
+                }
+
+            if action == 'edit':
+                row_id = int(param.get('id', 0))
+                if row_id not in self.rows:
+                    return {'Result': RESULT_ERROR, 'ErrMsg': 'id not found'}
+                self.rows[row_id].update({k: v for k, v in param.items() if k != 'id'})
+                return {'Result': RESULT_OK, 'ErrMsg': 'Success'}
+
+            if action == 'del':
+                ids = [int(x) for x in str(param.get('id', '')).split(',') if x]
+                missing = [i for i in ids if i not in self.rows]
+                if missing:
+                    return {'Result': RESULT_ERROR, 'ErrMsg': f'id not found: {missing}'}
+                for i in ids:
+                    del self.rows[i]
+                return {'Result': RESULT_OK, 'ErrMsg': 'Success'}
+
+        return {'Result': RESULT_ERROR, 'ErrMsg': f'unsupported action: {action}'}
+
+    # ---- record / replay ----
+
+    @staticmethod
+    def _replay_key(path, payload):
+        if path.endswith('/login'):
+            return path, None
+        return path, json.dumps(
+            {'action': payload.get('action'), 'func_name': payload.get('func_name'), 'param': payload.get('param')},
+            sort_keys=True,
+        )
+
+    def _load_replay(self, path):
+        replay = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = self._replay_key(entry['path'], entry['request'])
+                replay.setdefault(key, []).append(entry)
+        return replay
+
+    def _replayed(self, path, payload):
+        entries = self.replay.get(self._replay_key(path, payload))
+        if not entries:
+            return 404, {'Result': RESULT_ERROR, 'ErrMsg': 'no recorded response'}
+        # 同一请求录制了多次时按顺序返回，最后一条重复使用
+        entry = entries.pop(0) if len(entries) > 1 else entries[0]
+        return entry['status'], entry['response']
+
+    def _forward(self, path, payload, cookies):
+        import requests
+
+        response = requests.post(
+            f'{self.upstream}{path}', json=payload, cookies=cookies, verify=False, timeout=30,
+        )
+        body = response.json()
+        recorded = dict(payload)
+        if path.endswith('/login'):
+            # 不把管理员凭据写进录制文件
+            recorded = {'username': payload.get('username')}
+        with self.lock, open(self.record_to, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'path': path,
+                'request': recorded,
+                'status': response.status_code,
+                'response': body,
+            }, ensure_ascii=False) + '\n')
+        return response.status_code, body, response.cookies.get_dict()
+
+    # ---- HTTP ----
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 与真实路由器一样保持长连接
+            protocol_version = 'HTTP/1.1'
+            # 关闭 Nagle，避免大响应的最后一个分段等待延迟 ACK（约 40ms）
+            disable_nagle_algorithm = True
+            wbufsize = -1
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+            def _send(self, status, body, cookies=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (cookies or {}).items():
+                    self.send_header('Set-Cookie', f'{name}={value}; Path=/')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                cookies = {k: m.value for k, m in SimpleCookie(self.headers.get('Cookie', '')).items()}
+                server.requests.append(payload.get('action', 'login') if self.path.endswith('/call') else 'login')
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.error_rate and server.random.random() < server.error_rate:
+                    return self._send(500, {'Result': RESULT_ERROR, 'ErrMsg': 'injected error'})
+
+                if server.replay is not None:
+                    status, body = server._replayed(self.path, payload)
+                    cookies_out = {'sess_key': 'replay'} if self.path.endswith('/login') else None
+                    return self._send(status, body, cookies_out)
+                if server.upstream:
+                    status, body, cookies_out = server._forward(self.path, payload, cookies)
+                    return self._send(status, body, cookies_out)
+
+                if self.path == '/Action/login':
+                    body, token = server._login(payload)
+                    return self._send(200, body, {'sess_key': token} if token else None)
+                if self.path == '/Action/call':
+                    if not server._session_valid(cookies.get('sess_key')):
+                        return self._send(200, {'Result': RESULT_NO_LOGIN, 'ErrMsg': 'no login authentication'})
+                    return self._send(200, server._call(payload))
+                return self._send(404, {'Result': RESULT_ERROR, 'ErrMsg': 'not found'})
+
+        return Handler
@@ -0,0 +1,137 @@
+"""
+Throughput of router-bound tasks under different Celery worker pools.
+
+每种执行池在独立的子进程中运行（gevent / eventlet 必须在导入其他模块之前打补丁，
+与 celery worker -P gevent 相同）：子进程用 Celery 自己的 TaskPool 实现
+（celery.concurrency.get_implementation）以给定并发执行 tasks 个任务，
+每个任务与 create / delete 的路由器部分相同：新建客户端、登录、拉取账号。
+假路由器运行在父进程中，每个请求有固定延迟，模拟真实路由器的网络往返。
+
+用法见 python manage.py bench_worker_pool。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# 池名称:并发数；gevent / eventlet 未安装时跳过
+DEFAULT_SPECS = (('prefork', 4), ('prefork', 16), ('threads', 100), ('gevent', 200))
+ROUTER_ENV = 'POOL_BENCH_ROUTER'
+USERS = 50
+
+
+def router_job(index):
+    """一个路由器密集型任务：登录 + 拉取账号，返回是否成功"""
+    from sync_manager import routers
+
+    try:
+        client = routers.get_client('default', 30)
+        return client.get_account(f'user{index % USERS:05d}') is not None
+    except Exception:
+        return False
+
+
+def run_in_process(pool, concurrency, tasks):
+    """在当前进程中用 Celery 的执行池跑 tasks 个 router_job，返回结果字典"""
+    from celery.concurrency import get_implementation
+
+    from config.celery import app
+
+    # 先在当前进程中跑一次，把 requests、pydantic 等延迟导入的模块加载好（prefork 子进程 fork 后直接沿用）
+    router_job(0)
+    options = {'initargs': (app, 'bench@localhost')} if pool == 'prefork' else {}
+    task_pool = get_implementation(pool)(limit=concurrency, **options)
+    task_pool.start()
+
+    done = threading.Event()
+    lock = threading.Lock()
+    results = []
+
+    def finished(ok):
+        with lock:
+            results.append(ok)
+            if len(results) == tasks:
+                done.set()
+
+    try:
+        start = time.perf_counter()
+        for index in range(tasks):
+            task_pool.apply_async(router_job, (index,), callback=finished)
+        completed = done.wait(600)
+        seconds = time.perf_counter() - start
+    finally:
+        task_pool.stop()
+    return {
+        'pool': pool,
+        'concurrency': concurrency,
+        'tasks': tasks,
+        'completed': completed,
+        'errors': results.count(False),
+        'seconds': round(seconds, 3),
+        'tasks_per_second': round(len(results) / seconds, 1),
+    }
+
+
+def _installed(pool):
+    import importlib.util
+
+    return pool not in ('gevent', 'eventlet') or importlib.util.find_spec(pool) is not None
+
+
+def run(specs=DEFAULT_SPECS, tasks=400, latency=0.05, pool_maxsize=100):
+    """
+    依次在子进程中运行每种 (池, 并发数)，返回结果列表
+
+    pool_maxsize 为子进程中每台路由器的最大连接数（IKUAI_CONFIG['pool_maxsize']）。
+    """
+    from django.conf import settings
+
+    from sync_manager.testing.fake_ikuai import FakeIKuaiServer
+
+    results = []
+    with FakeIKuaiServer(users=USERS, latency=latency) as server:
+        router = {
+            'base_url': server.base_url,
+            'username': server.username,
+            'password': server.password,
+            'pool_maxsize': pool_maxsize,
+        }
+        env = {**os.environ, ROUTER_ENV: json.dumps(router)}
+        for pool, concurrency in specs:
+            if not _installed(pool):
+                results.append({'pool': pool, 'concurrency': concurrency, 'skipped': f'{pool} 未安装'})
+                continue
+            process = subprocess.run(
+                [sys.executable, '-m', 'sync_manager.testing.pool_bench', pool, str(concurrency), str(tasks)],
+                env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=900,
+            )
+            if process.returncode:
+                results.append({'pool': pool, 'concurrency': concurrency, 'failed': process.stderr.strip()[-500:]})
+                continue
+            results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def _child(argv):
+    pool, concurrency, tasks = argv[0], int(argv[1]), int(argv[2])
+    if pool in ('gevent', 'eventlet'):
+        # 与 celery worker -P gevent 相同，在导入 Django 之前打补丁
+        from celery import maybe_patch_concurrency
+
+        maybe_patch_concurrency(['celery', '-P', pool])
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+
+    settings.IKUAI_ROUTERS = {'default': json.loads(os.environ[ROUTER_ENV])}
+    print(json.dumps(run_in_process(pool, concurrency, tasks)))
+
+
+if __name__ == '__main__':
+    _child(sys.argv[1:])
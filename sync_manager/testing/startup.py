@@ -0,0 +1,127 @@
+"""
+Startup import-time budget for manage.py, gunicorn and Celery workers.
+
+每个入口在独立的子进程中以 `python -X importtime` 启动，解析 stderr 得到：
+- total_ms: 所有模块自身导入耗时之和
+- modules: 导入的模块数
+- packages: 按顶层包汇总的导入耗时（取最慢的若干个）
+- forbidden: 启动时不应导入的重依赖及其导入链
+
+startup_budget.json 声明各入口的耗时上限和禁止在启动时导入的包；
+重依赖（requests、pydantic、ldap 等）应在首次使用时才导入。
+"""
+
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+BUDGET_PATH = Path(__file__).with_name('startup_budget.json')
+
+# 入口 -> 子进程中执行的代码
+ENTRYPOINTS = {
+    # manage.py 的各个命令
+    'manage': 'import django; django.setup()',
+    # gunicorn worker：加载 WSGI 应用（含中间件）和 URLconf（视图）
+    'wsgi': (
+        'from config.wsgi import application; '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+    # Celery worker：加载应用并导入全部任务模块
+    'celery': (
+        'import django; django.setup(); '
+        'from config.celery import app; app.loader.import_default_modules(); app.finalize(auto=True)'
+    ),
+}
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块, 自身微秒, 累计微秒, 嵌套深度)]，按输出顺序"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        if not self_us.strip().isdigit():
+            # 表头
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_chain(rows, index):
+    """返回导入 rows[index] 的链（外层在前）；importtime 先输出子模块，父模块是其后第一个更浅的行"""
+    chain = [rows[index][0]]
+    depth = rows[index][3]
+    for name, _, _, row_depth in rows[index + 1:]:
+        if row_depth < depth:
+            chain.append(name)
+            depth = row_depth
+    return list(reversed(chain))
+
+
+def summarize(rows, forbidden=(), top=10):
+    packages = Counter()
+    for name, self_us, _, _ in rows:
+        packages[name.split('.')[0]] += self_us
+    found = {}
+    for index, (name, _, _, _) in enumerate(rows):
+        package = name.split('.')[0]
+        if package in forbidden and package not in found:
+            found[package] = ' -> '.join(import_chain(rows, index))
+    return {
+        'total_ms': round(sum(row[1] for row in rows) / 1000, 1),
+        'modules': len(rows),
+        'packages': {name: round(us / 1000, 1) for name, us in packages.most_common(top)},
+        'forbidden': found,
+    }
+
+
+def measure(entrypoint, forbidden=(), repeat=3):
+    """在子进程中启动入口 repeat 次，返回耗时最短的一次的统计"""
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', ENTRYPOINTS[entrypoint]],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f'{entrypoint} 启动失败:\n{result.stderr[-2000:]}')
+        summary = summarize(parse_importtime(result.stderr), forbidden)
+        if best is None or summary['total_ms'] < best['total_ms']:
+            best = summary
+    return best
+
+
+def load_budget(path=BUDGET_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_startup(names=None, repeat=3, budget=None):
+    """返回 {入口: 统计}"""
+    budget = budget or load_budget()
+    return {
+        name: measure(name, budget.get('forbidden', ()), repeat=repeat)
+        for name in names or ENTRYPOINTS
+    }
+
+
+def check(report, budget=None):
+    """检查报告是否超出预算，返回问题描述列表"""
+    budget = budget or load_budget()
+    problems = []
+    for name, summary in report.items():
+        for package, chain in summary['forbidden'].items():
+            problems.append(f'{name}: 启动时导入了 {package}（{chain}）')
+        limit = budget.get('max_ms', {}).get(name)
+        if limit is not None and summary['total_ms'] > limit:
+            problems.append(f'{name}: 导入耗时 {summary["total_ms"]}ms，超出预算 {limit}ms')
+    return problems
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+"""
+Tests for sync_manager app.
 
-# Create your tests here.
+路由器相关的测试都运行在本地的 FakeIKuaiServer 上。
+"""
+
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from prometheus_client import REGISTRY
+
+from config import health, identity_cache, metrics, profiling, tracing
+
+from sync_manager.client.ikuai import Deadline, IKuaiAPIClient, IKuaiError, IKuaiTimeoutError
+from sync_manager.client.schemas import EditPPPUserRequestData
+from sync_manager import history, usage
+from sync_manager.models import ConnectionEvent, ConnectionRollup, DepartmentUsage, OpenVPNAccount
+from sync_manager.testing import benchmarks, budgets, startup
+from sync_manager.testing.fake_ikuai import FakeIKuaiServer
+
+
+def router_settings(server):
+    return override_settings(IKUAI_ROUTERS={
+        'default': {'base_url': server.base_url, 'username': server.username, 'password': server.password},
+    })
+
+
+class IKuaiClientTests(SimpleTestCase):
+    """IKuaiAPIClient 与假路由器的协议交互"""
+
+    def client_for(self, server, **kwargs):
+        kwargs.setdefault('retry_backoff', 0.01)
+        return IKuaiAPIClient(server.base_url, server.username, server.password, **kwargs)
+
+    def test_list_accounts_reads_every_page_once(self):
+        with FakeIKuaiServer(users=250) as server:
+            accounts = self.client_for(server).list_accounts()
+        self.assertEqual(len(accounts), 250)
+        self.assertEqual(len({a.id for a in accounts}), 250)
+        self.assertEqual(server.count('show'), 3)
+
+    def test_create_edit_delete(self):
+        with FakeIKuaiServer() as server:
+            client = self.client_for(server)
+            row_id = client.create_account('alice', 'secret', expires_days=10)
+            self.assertEqual(server.find('alice')['id'], row_id)
+
+            client.update_account(row_id, EditPPPUserRequestData(id=row_id, username='alice', passwd='changed'))
+            self.assertEqual(server.find('alice')['passwd'], 'changed')
+
+            self.assertTrue(client.delete_account(row_id))
+            self.assertIsNone(server.find('alice'))
+
+    def test_records_round_trip_to_edit_payload(self):
+        from sync_manager.client.records import PPPUserRecord
+        from sync_manager.testing.fake_ikuai import make_pppuser
+
+        row = make_pppuser(7, 'carol')
+        record = PPPUserRecord.from_row(row)
+        self.assertEqual((record.id, record.username, record.is_enabled), (7, 'carol', True))
+        payload = EditPPPUserRequestData.from_record(record, passwd='changed').model_dump()
+        self.assertEqual(payload, EditPPPUserRequestData.model_validate({**row, 'passwd': 'changed'}).model_dump())
+
+    def test_record_defaults_match_edit_payload(self):
+        from sync_manager.client.records import FIELDS, PPPUserRecord
+
+        fields = EditPPPUserRequestData.model_fields
+        self.assertEqual(set(FIELDS), set(fields))
+        for name, field in fields.items():
+            if field.is_required() or field.default_factory is not None:
+                continue
+            self.assertEqual(FIELDS[name], field.default, name)
+
+        # 路由器返回的行缺少字段时，回写使用与模型相同的默认值
+        payload = EditPPPUserRequestData.from_record(PPPUserRecord.from_row({'id': 1, 'username': 'dan'}))
+        self.assertEqual((payload.share, payload.comment), (999, 'openvpn创建'))
+
+    def test_wrong_credentials(self):
+        with FakeIKuaiServer(password='right') as server:
+            client = IKuaiAPIClient(server.base_url, 'admin', 'wrong')
+            self.assertFalse(client.login())
+            with self.assertRaises(IKuaiError):
+                client.create_account('alice', 'secret')
+
+    def test_expired_session_is_rejected(self):
+        with FakeIKuaiServer(users=5) as server:
+            client = self.client_for(server)
+            client.login()
+            server.expire_sessions()
+            with self.assertRaises(IKuaiError):
+                client._list_accounts(0, 100)
+            # 每个操作都会重新登录
+            self.assertIsNotNone(client.get_account('user00001'))
+
+    def test_idempotent_calls_are_retried(self):
+        with FakeIKuaiServer(users=5, error_rate=1.0) as server:
+            client = self.client_for(server, max_retries=2)
+            self.assertFalse(client.login())
+        self.assertEqual(server.count('login'), 3)
+
+    def test_add_is_not_retried(self):
+        with FakeIKuaiServer() as server:
+            client = self.client_for(server, max_retries=2)
+            client.login()
+            server.error_rate = 1.0
+            with self.assertRaises(Exception):
+                client._call('add', 'pppuser', {'username': 'alice', 'passwd': 'x'})
+        self.assertEqual(server.count('add'), 1)
+
+    def test_deadline_bounds_every_request(self):
+        with FakeIKuaiServer(users=5, latency=0.3) as server:
+            client = self.client_for(server, max_retries=0, deadline=Deadline(0.1))
+            with self.assertRaises(IKuaiTimeoutError):
+                client.login()
+            with self.assertRaises(IKuaiTimeoutError):
+                client.list_accounts()
+
+    def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'traffic.jsonl')
+            with FakeIKuaiServer(users=3) as upstream:
+                with FakeIKuaiServer(upstream=upstream.base_url, record_to=path) as recorder:
+                    recorded = self.client_for(recorder).list_accounts()
+            with open(path, encoding='utf-8') as f:
+                self.assertNotIn('passwd', json.loads(f.readline())['request'])
+
+            with FakeIKuaiServer(replay_from=path) as replay:
+                replayed = self.client_for(replay).list_accounts()
+        self.assertEqual(replayed, recorded)
+
+
+class SyncTaskTests(TestCase):
+    """sync_openvpn_accounts 与假路由器的端到端对账"""
+
+    def test_sync_updates_local_accounts_from_snapshot(self):
+        from sync_manager.tasks import sync_openvpn_accounts
+
+        with FakeIKuaiServer(users=120) as server, router_settings(server):
+            benchmarks._seed_accounts(server)
+            server.rows[5]['ip_addr'] = '10.9.9.9'
+            result = sync_openvpn_accounts()
+
+        self.assertEqual(result['synced_count'], 120)
+        self.assertEqual(server.count('show'), 2)
+        self.assertEqual(OpenVPNAccount.objects.get(ikuai_id=5).ip_addr, '10.9.9.9')
+
+    def test_sync_writes_only_changed_fields(self):
+        from sync_manager.tasks import sync_openvpn_accounts
+
+        with FakeIKuaiServer(users=20) as server, router_settings(server):
+            benchmarks._seed_accounts(server)
+            self.assertEqual(sync_openvpn_accounts()['updated_count'], 20)
+
+            # 与路由器一致时只有一条 SELECT，不写入、不重新加密密码
+            with mock.patch('encrypted_model_fields.fields.encrypt_str') as encrypt, self.assertNumQueries(1):
+                self.assertEqual(sync_openvpn_accounts()['updated_count'], 0)
+            encrypt.assert_not_called()
+
+            # 一条 UPDATE + 一条连接历史 INSERT
+            server.rows[3]['last_conntime'] += 60
+            with self.assertNumQueries(3):
+                result = sync_openvpn_accounts()
+        self.assertEqual(result['updated_count'], 1)
+        account = OpenVPNAccount.objects.get(ikuai_id=3)
+        self.assertEqual(int(account.last_conntime.timestamp()), server.rows[3]['last_conntime'])
+        self.assertEqual(account.password, server.rows[3]['passwd'])
+
+    def test_create_and_delete_tasks(self):
+        from sync_manager.tasks import create_openvpn_account, delete_openvpn_account
+
+        user = User.objects.create(username='bob')
+        with FakeIKuaiServer() as server, router_settings(server):
+            account = OpenVPNAccount.objects.create(user=user, username='bob', password='pw', router='default')
+            create_openvpn_account.apply(kwargs={'user_id': user.id, 'username': 'bob', 'password': 'pw'})
+            account.refresh_from_db()
+            self.assertEqual(account.status, 'active')
+            self.assertEqual(account.ikuai_id, server.find('bob')['id'])
+
+            delete_openvpn_account.apply(args=[account.id])
+            self.assertIsNone(server.find('bob'))
+            self.assertFalse(OpenVPNAccount.objects.filter(id=account.id).exists())
+
+
+class ConnectionHistoryTests(TestCase):
+    """同步时记录连接历史，按小时 / 天汇总并按保留天数清理"""
+
+    def sync(self, server):
+        from sync_manager.tasks import sync_openvpn_accounts
+        with router_settings(server):
+            return sync_openvpn_accounts()
+
+    def test_sync_records_connection_changes(self):
+        with FakeIKuaiServer(users=10) as server:
+            benchmarks._seed_accounts(server)
+            self.sync(server)
+            ConnectionEvent.objects.all().delete()
+
+            # 在线时长增长：同一会话；连接时间变化：新会话
+            server.rows[2]['duration'] += 600
+            server.rows[4]['last_conntime'] += 3600
+            server.rows[4]['duration'] = 120
+            server.rows[6]['comment'] = 'not tracked'
+            self.sync(server)
+
+        events = {event.username: event for event in ConnectionEvent.objects.all()}
+        self.assertEqual(len(events), 2)
+        same = events[server.rows[2]['username']]
+        self.assertFalse(same.new_session)
+        self.assertEqual(same.duration_delta, 600)
+        new = events[server.rows[4]['username']]
+        self.assertTrue(new.new_session)
+        self.assertEqual(new.duration_delta, 120)
+        self.assertEqual(new.router, 'default')
+
+    def test_rollup_is_idempotent_and_purge_respects_retention(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from sync_manager.tasks import rollup_connection_history
+
+        now = timezone.now()
+        old = now - timedelta(days=30)
+        ConnectionEvent.objects.bulk_create([
+            ConnectionEvent(account_id=1, username='a', router='r1', day=timezone.localdate(now),
+                            observed_at=now, new_session=True, duration_delta=100),
+            ConnectionEvent(account_id=1, username='a', router='r1', day=timezone.localdate(now),
+                            observed_at=now, duration_delta=50),
+            ConnectionEvent(account_id=2, username='b', router='r2', day=timezone.localdate(now),
+                            observed_at=now, new_session=True, duration_delta=10),
+            ConnectionEvent(account_id=3, username='c', router='r1', day=timezone.localdate(old),
+                            observed_at=old, duration_delta=10),
+        ])
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            first = rollup_connection_history()
+        # 按 day 过滤以使用 (day, router) 索引
+        scans = [q['sql'] for q in queries if 'FROM "openvpn_connection_event"' in q['sql'] and 'GROUP BY' in q['sql']]
+        self.assertTrue(scans)
+        self.assertTrue(all('"openvpn_connection_event"."day" >=' in sql for sql in scans))
+        self.assertEqual(rollup_connection_history()['hourly'], first['hourly'])
+        self.assertEqual(first['purged']['events'], 1)
+        self.assertEqual(ConnectionRollup.objects.filter(granularity='hour').count(), 2)
+
+        hourly = ConnectionRollup.objects.get(granularity='hour', router='r1')
+        self.assertEqual((hourly.sessions, hourly.active_accounts, hourly.online_seconds, hourly.events), (1, 1, 150, 2))
+
+        usage = history.usage('day', since=now - timedelta(days=1))
+        self.assertEqual(len(usage), 1)
+        self.assertEqual(
+            (usage[0]['sessions'], usage[0]['active_accounts'], usage[0]['online_seconds']), (2, 2, 160))
+        self.assertEqual(history.usage('day', router='r2')[0]['online_seconds'], 10)
+
+
+class DepartmentUsageTests(TestCase):
+    """部门汇总的增量更新与全量重算结果一致"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from account.models import Department
+
+        self.sales = Department.objects.create(id=10, name='销售部')
+        self.ops = Department.objects.create(id=20, name='运维部')
+        soon = timezone.now() + timedelta(days=3)
+        later = timezone.now() + timedelta(days=60)
+        for index, (department, expires) in enumerate([
+            (self.sales, soon), (self.sales, later), (self.ops, later), (None, None),
+        ]):
+            user = User.objects.create(username=f'u{index}')
+            user.profile.department = department
+            user.profile.save()
+            OpenVPNAccount.objects.create(
+                user=user, username=f'u{index}', password='pw', status='active',
+                expires=expires, duration=100 * (index + 1), packages=1000,
+            )
+
+    def snapshot(self):
+        return {
+            row.department_id: tuple(getattr(row, name) for name in usage.FIELDS)
+            for row in DepartmentUsage.objects.all()
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        account = OpenVPNAccount.objects.get(username='u1')
+        account.duration = 900
+        account.save()
+        usage.update(OpenVPNAccount.objects.filter(username='u2'), enabled=False, status='disabled')
+        OpenVPNAccount.objects.get(username='u3').delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[self.sales.id], (2, 2, 1000, 2000, 1))
+        self.assertEqual(incremental[self.ops.id], (1, 0, 300, 1000, 0))
+        self.assertEqual(incremental[None], (0, 0, 0, 0, 0))
+
+        usage.rebuild(vectorized=False)
+        rebuilt = self.snapshot()
+        self.assertEqual({key: value for key, value in incremental.items() if value[0]}, rebuilt)
+
+    def test_concurrently_created_rows_are_merged(self):
+        DepartmentUsage.objects.all().delete()
+        bulk_create = DepartmentUsage.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # 另一个事务在本事务加锁读取之后、插入之前创建了同一部门的行
+            for obj in objs:
+                DepartmentUsage.objects.create(bucket=obj.bucket, department_id=obj.department_id, accounts=5)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(DepartmentUsage.objects, 'bulk_create', racing_bulk_create):
+            OpenVPNAccount.objects.get(username='u3').delete()
+            OpenVPNAccount.objects.get(username='u0').delete()
+        self.assertEqual(self.snapshot()[None][0], 4)
+        self.assertEqual(self.snapshot()[self.sales.id][0], 4)
+        self.assertEqual(DepartmentUsage.objects.filter(department=None).count(), 1)
+
+    @skipUnless(usage.numpy_installed(), 'numpy 未安装')
+    def test_vectorized_rebuild_matches_python(self):
+        usage.rebuild(vectorized=False)
+        expected = self.snapshot()
+        usage.rebuild(vectorized=True)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_report_endpoint_requires_staff(self):
+        from django.urls import reverse
+
+        url = reverse('sync_manager:department_usage')
+        self.client.force_login(User.objects.get(username='u0'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+        data = self.client.get(url).json()
+        self.assertEqual(data['totals']['accounts'], 4)
+        self.assertEqual(data['departments'][0]['department'], '销售部')
+
+
+@override_settings(ADMIN_PAGINATION={'keyset_threshold': 1, 'count_cache_seconds': 60})
+class KeysetPaginationTests(TestCase):
+    """大表后台列表：keyset 分页覆盖全部行且没有 OFFSET，总数走缓存"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.utils import timezone
+
+        cache.clear()
+        for index in range(25):
+            user = User.objects.create(username=f'u{index:02d}')
+            OpenVPNAccount.objects.create(user=user, username=f'vpn{index:02d}', password='pw')
+        # 一半的账号创建时间相同，靠 id 决定顺序
+        OpenVPNAccount.objects.filter(username__lt='vpn12').update(created_at=timezone.now())
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+
+    def test_walks_every_row_in_order(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+        from sync_manager.admin import OpenVPNAccountAdmin
+
+        base = url = reverse('admin:sync_manager_openvpnaccount_changelist')
+        seen = []
+        with mock.patch.object(OpenVPNAccountAdmin, 'list_per_page', 10), \
+                CaptureQueriesContext(connection) as queries:
+            while url:
+                cl = self.client.get(url).context['cl']
+                self.assertTrue(cl.keyset)
+                self.assertEqual(cl.result_count, 25)
+                seen.extend(account.pk for account in cl.result_list)
+                url = cl.next_url and base + cl.next_url
+        expected = list(OpenVPNAccount.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_filtered_count_is_cached_and_unindexed_ordering_falls_back(self):
+        from django.urls import reverse
+        from config import pagination
+
+        accounts = OpenVPNAccount.objects.filter(username__startswith='vpn0')
+        with self.assertNumQueries(1):
+            pagination.cached_count(accounts)
+        with self.assertNumQueries(0):
+            self.assertEqual(pagination.cached_count(accounts), 10)
+        # 按没有索引的列（IP）排序时退回 OFFSET 分页
+        url = reverse('admin:sync_manager_openvpnaccount_changelist')
+        self.assertFalse(self.client.get(url, {'o': '5'}).context['cl'].keyset)
+
+
+class APITests(TestCase):
+    """/api/v1/：稀疏字段、游标分页和批量接口"""
+
+    def setUp(self):
+        for index in range(6):
+            user = User.objects.create(username=f'u{index}')
+            OpenVPNAccount.objects.create(
+                user=user, username=f'vpn{index}', password='pw', status='active' if index else 'expired',
+            )
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+        # 首个请求加载身份包（含加密字段），之后命中身份缓存
+        self.client.get('/api/v1/departments/')
+
+    def test_password_is_decrypted_only_when_requested(self):
+        from django.urls import reverse
+
+        url = reverse('api_v1:accounts')
+        with mock.patch('encrypted_model_fields.fields.decrypt_str', side_effect=lambda value: value) as decrypt:
+            data = self.client.get(url, {'fields': 'username,status,user'}).json()
+            decrypt.assert_not_called()
+            self.client.get(url, {'fields': 'username,password'})
+            self.assertEqual(decrypt.call_count, 6)
+        self.assertEqual(data['results'][0], {'username': 'vpn0', 'status': 'expired', 'user': 'u0'})
+
+        staff = User.objects.create(username='helpdesk', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url, {'fields': 'password'}).status_code, 403)
+        self.assertEqual(self.client.get(url, {'fields': 'nope'}).status_code, 400)
+
+    def test_cursor_pagination_covers_every_row(self):
+        from django.urls import reverse
+
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(reverse('api_v1:users'), {'limit': 3, 'after': cursor, 'fields': 'username'}).json()
+            seen.extend(row['username'] for row in data['results'])
+            cursor = data['next']
+        self.assertEqual(seen, list(User.objects.order_by('pk').values_list('username', flat=True)))
+
+    def test_bulk_updates_run_constant_queries_and_one_task(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        def disable(usernames):
+            with CaptureQueriesContext(connection) as queries, \
+                    mock.patch('sync_manager.tasks.push_account_changes.delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                data = self.client.post(
+                    reverse('api_v1:accounts_disable'), json.dumps({'users': usernames}),
+                    content_type='application/json',
+                ).json()
+            delay.assert_called_once()
+            return data, len(queries), delay.call_args.args[0]
+
+        few, few_queries, _ = disable(['u1', 'missing'])
+        many, many_queries, account_ids = disable([f'u{index}' for index in range(6)])
+        self.assertEqual(few['missing'], ['missing'])
+        self.assertEqual(many['updated'], 6)
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(account_ids), 6)
+        self.assertFalse(OpenVPNAccount.objects.filter(enabled=True).exists())
+
+        # 续期只作用于正常 / 已过期的账号
+        data = self.client.post(
+            reverse('api_v1:accounts_renew'), json.dumps({'users': ['u0'], 'days': 10}),
+            content_type='application/json',
+        ).json()
+        self.assertEqual(data['skipped'], ['u0'])
+
+    def test_admin_actions_push_changes_to_router(self):
+        from django.urls import reverse
+
+        url = reverse('admin:sync_manager_openvpnaccount_changelist')
+        selected = list(OpenVPNAccount.objects.filter(username__in=['vpn1', 'vpn2']).values_list('pk', flat=True))
+        for action, enabled in [('disable_accounts', False), ('enable_accounts', True)]:
+            with mock.patch('sync_manager.tasks.push_account_changes.delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {'action': action, '_selected_action': selected})
+            self.assertEqual(response.status_code, 302)
+            delay.assert_called_once()
+            self.assertEqual(sorted(delay.call_args.args[0]), sorted(selected))
+            self.assertEqual(set(OpenVPNAccount.objects.filter(pk__in=selected).values_list('enabled', flat=True)), {enabled})
+
+    def test_push_account_changes_edits_only_differing_rows(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from sync_manager.tasks import push_account_changes
+
+        with FakeIKuaiServer(users=10) as server, router_settings(server):
+            benchmarks._seed_accounts(server)
+            expires = timezone.now() + timedelta(days=30)
+            OpenVPNAccount.objects.filter(ikuai_id=2).update(enabled=False)
+            OpenVPNAccount.objects.filter(ikuai_id=3).update(expires=expires)
+            for row in server.rows.values():
+                row['expires'] = 0
+            account_ids = list(OpenVPNAccount.objects.filter(ikuai_id__in=[1, 2, 3]).values_list('pk', flat=True))
+            result = push_account_changes(account_ids)
+
+        self.assertEqual(result['pushed_count'], 2)
+        self.assertEqual(server.count('edit'), 2)
+        self.assertEqual(server.rows[2]['enabled'], 'no')
+        self.assertEqual(server.rows[3]['expires'], int(expires.timestamp()))
+
+
+class ExportTests(TestCase):
+    """流式导出：按主键分批查询，CSV / NDJSON / gzip"""
+
+    def setUp(self):
+        from account.models import Department
+
+        department = Department.objects.create(id=10, name='销售部')
+        for index in range(5):
+            user = User.objects.create(username=f'u{index}')
+            if index % 2:
+                user.profile.department = department
+                user.profile.save()
+            OpenVPNAccount.objects.create(user=user, username=f'vpn{index}', password='pw', status='active')
+
+    def test_rows_are_fetched_in_primary_key_batches(self):
+        from sync_manager import export
+
+        with self.assertNumQueries(3):
+            rows = list(export.rows(OpenVPNAccount.objects.all(), ['username', 'user__profile__department__name'], 2))
+        self.assertEqual(rows[:2], [['vpn0', None], ['vpn1', '销售部']])
+        self.assertEqual(len(rows), 5)
+
+    def test_endpoint_streams_csv_and_gzipped_ndjson(self):
+        import csv
+        import gzip
+        from django.urls import reverse
+
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+        url = reverse('api_v1:export', args=['accounts', 'csv'])
+        response = self.client.get(url, {'fields': 'username,department'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(list(csv.reader(lines))[:3], [['username', 'department'], ['vpn0', ''], ['vpn1', '销售部']])
+
+        url = reverse('api_v1:export', args=['users', 'ndjson'])
+        response = self.client.get(url, {'fields': 'username,vpn_username', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(rows[0], {'username': 'u0', 'vpn_username': 'vpn0'})
+        self.assertEqual(self.client.get(reverse('api_v1:export', args=['users', 'xml'])).status_code, 404)
+
+
+class PasswordSyncTests(TestCase):
+    """LDAP 密码变化后延迟、批量写回路由器"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def change_password(self, username, password):
+        from account.models import UserProfile
+
+        profile = UserProfile.objects.get(user__username=username)
+        profile.plain_password = password
+        profile.save(update_fields=['plain_password', 'updated_at'])
+
+    def test_changes_are_debounced_into_one_task(self):
+        from account.models import UserProfile
+
+        for username in ['u1', 'u2']:
+            user = User.objects.create(username=username)
+            OpenVPNAccount.objects.create(user=user, username=f'vpn-{username}', password='old', status='active')
+
+        with mock.patch('sync_manager.tasks.sync_account_passwords.apply_async') as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.change_password('u1', 'new1')
+            self.change_password('u2', 'new2')
+            # 未变化和占位密码不写回
+            self.change_password('u2', 'new2')
+            self.change_password('u1', UserProfile.PLACEHOLDER_PASSWORD)
+        apply_async.assert_called_once_with(countdown=30)
+
+        account = OpenVPNAccount.objects.get(username='vpn-u2')
+        self.assertEqual(account.password, 'new2')
+        self.assertIsNotNone(account.password_changed_at)
+
+    @override_settings(PASSWORD_SYNC={'batch_size': 2})
+    def test_flush_pushes_pending_passwords_with_one_snapshot(self):
+        from account.models import UserProfile
+        from sync_manager.tasks import sync_account_passwords, sync_openvpn_accounts
+
+        with FakeIKuaiServer(users=6) as server, router_settings(server):
+            benchmarks._seed_accounts(server)
+            UserProfile.objects.bulk_create([UserProfile(user=user) for user in User.objects.all()])
+            with mock.patch('sync_manager.tasks.sync_account_passwords.apply_async'):
+                for account in OpenVPNAccount.objects.filter(ikuai_id__in=[1, 2, 3, 4, 5]).select_related('user'):
+                    self.change_password(account.user.username, f'new{account.ikuai_id}')
+            # 路由器上已经是新密码
+            server.rows[5]['passwd'] = 'new5'
+
+            # 写回之前的定时同步不会用路由器上的旧密码覆盖
+            sync_openvpn_accounts()
+            self.assertEqual(OpenVPNAccount.objects.get(ikuai_id=1).password, 'new1')
+
+            shows = server.count('show')
+            result = sync_account_passwords()
+
+        self.assertEqual((result['pushed'], result['unchanged']), (4, 1))
+        self.assertEqual(server.count('show') - shows, 1)
+        self.assertEqual(server.count('edit'), 4)
+        self.assertEqual(server.rows[1]['passwd'], 'new1')
+        self.assertEqual(server.rows[6]['passwd'], 'pw000006')
+        self.assertFalse(OpenVPNAccount.objects.filter(password_changed_at__isnull=False).exists())
+
+
+class AdoptionTests(TestCase):
+    """路由器上已有的 pppuser 按用户名 / 姓名 / 备注收编为本地账号"""
+
+    def setUp(self):
+        def user(username, first_name='', employee_number=None):
+            user = User.objects.create(username=username, first_name=first_name)
+            if employee_number:
+                user.profile.employee_number = employee_number
+                user.profile.save()
+            return user
+
+        user('alice')
+        user('zhang', first_name='张三')
+        user('carol', employee_number='E1001')
+        user('li1', first_name='李四')
+        user('li2', first_name='李四')
+        OpenVPNAccount.objects.create(user=user('dave'), username='dave-old', password='pw', status='active')
+
+        self.server = FakeIKuaiServer()
+        for username, name, comment in [
+            ('alice', 'alice', ''),
+            ('vpn-zs', '张三', ''),
+            ('vpn-c', '', '工号: E1001'),
+            ('vpn-li', '李四', ''),
+            ('dave', 'dave', ''),
+            ('ghost', 'ghost', 'nobody'),
+            ('dave-old', 'dave', ''),
+            ('alice2', 'alice', ''),
+        ]:
+            self.server.add_row(username, name=name, comment=comment)
+
+    def test_adopt_links_matches_and_lists_the_rest(self):
+        from sync_manager.tasks import adopt_router_accounts
+
+        with self.server as server, router_settings(server):
+            # 用户和已有账号各一次查询，不写入
+            with self.assertNumQueries(2):
+                preview = adopt_router_accounts(dry_run=True)
+            self.assertEqual(OpenVPNAccount.objects.count(), 1)
+            result = adopt_router_accounts()
+
+        self.assertEqual(server.count('show'), 2)
+        self.assertEqual(preview['adopted'], 3)
+        self.assertEqual(result['adopted'], 3)
+        self.assertEqual(result['matched_by'], {'username': 1, 'name': 1, 'comment': 1})
+        self.assertEqual(result['already_linked'], 1)
+        self.assertEqual(
+            {row['username']: row['reason'] for row in result['unmatched']},
+            {'vpn-li': 'ambiguous', 'dave': 'user_has_account', 'ghost': 'no_match', 'alice2': 'duplicate'},
+        )
+        linked = dict(OpenVPNAccount.objects.values_list('username', 'user__username'))
+        self.assertEqual(linked, {'dave-old': 'dave', 'alice': 'alice', 'vpn-zs': 'zhang', 'vpn-c': 'carol'})
+        account = OpenVPNAccount.objects.get(username='alice')
+        row = server.find('alice')
+        self.assertEqual((account.ikuai_id, account.status, account.password), (row['id'], 'active', row['passwd']))
+        self.assertEqual(DepartmentUsage.objects.get(department=None).accounts, 4)
+
+        # 再次执行时都已关联
+        with FakeIKuaiServer() as server, router_settings(server):
+            for username in ['alice', 'vpn-zs']:
+                server.add_row(username)
+            self.assertEqual(adopt_router_accounts()['already_linked'], 2)
+
+
+class BenchmarkHarnessTests(TestCase):
+    """基准测试框架自身可以运行，并能识别回退"""
+
+    def test_bench_size_reports_every_operation(self):
+        results = benchmarks.bench_size(20, repeat=1, ops=2)
+        self.assertEqual(set(results), {'list_accounts', 'sync_openvpn_accounts', 'create', 'delete'})
+        self.assertFalse(User.objects.filter(username__startswith='bench').exists())
+
+    def test_compare_flags_regressions(self):
+        baseline = {'list_accounts': {'100': 0.01}}
+        self.assertEqual(benchmarks.compare({'list_accounts': {'100': 0.012}}, baseline), [])
+        self.assertEqual(len(benchmarks.compare({'list_accounts': {'100': 0.02}}, baseline)), 1)
+
+    def test_pool_bench_runs_router_jobs_in_a_thread_pool(self):
+        from sync_manager.testing import pool_bench
+
+        with FakeIKuaiServer(users=pool_bench.USERS) as server, router_settings(server):
+            result = pool_bench.run_in_process('threads', 8, 24)
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['errors'], 0)
+        # 每个任务一次登录、一次拉取（另有一次预热）
+        self.assertEqual(server.count('login'), 25)
+
+
+class WorkerPoolTests(SimpleTestCase):
+    """路由器会话按线程隔离、连接池共享；worker 执行池的识别"""
+
+    def test_sessions_are_per_thread_and_share_the_connection_pool(self):
+        import threading
+        from sync_manager import routers
+
+        with FakeIKuaiServer() as server, router_settings(server):
+            session = routers._get_session('default')
+            self.assertIs(routers._get_session('default'), session)
+            other = []
+            thread = threading.Thread(target=lambda: other.append(routers._get_session('default')))
+            thread.start()
+            thread.join()
+        self.assertIsNot(other[0], session)
+        self.assertIs(other[0].get_adapter(server.base_url), session.get_adapter(server.base_url))
+
+    def test_record_pool_and_release_connections(self):
+        from types import SimpleNamespace
+        from celery.concurrency.thread import TaskPool
+        from config import pools
+
+        from config.celery import app
+
+        def worker(pool_cls, queues):
+            amqp = SimpleNamespace(queues=SimpleNamespace(consume_from=dict.fromkeys(queues)))
+            return SimpleNamespace(pool_cls=pool_cls, app=SimpleNamespace(amqp=amqp, tasks=app.tasks))
+
+        self.addCleanup(setattr, pools, '_pool', pools._pool)
+        # 线程池不执行 time_limit
+        with self.assertLogs('config.pools', 'WARNING') as logs:
+            pools.record_pool(worker(TaskPool, ['interactive']))
+        self.assertIn('sync_manager.tasks.create_openvpn_account', logs.output[0])
+        self.assertEqual(pools.current_pool(), 'threads')
+        self.assertTrue(pools.io_pool())
+        idle, atomic = mock.Mock(in_atomic_block=False), mock.Mock(in_atomic_block=True)
+        with mock.patch('django.db.connections.all', return_value=[idle, atomic]):
+            pools.release_db_connection()
+        idle.close.assert_called_once_with()
+        atomic.close.assert_not_called()
+
+        with self.assertLogs('config.pools', 'WARNING'):
+            pools.record_pool(worker('gevent', ['bulk']))
+        pools.record_pool(worker('prefork', ['bulk']))
+        self.assertFalse(pools.io_pool())
+
+
+class QueryBudgetTests(TestCase):
+    """视图、后台列表和任务的 SQL / 路由器调用预算"""
+
+    def test_endpoints_stay_within_budget(self):
+        report = budgets.run_budgets()
+        self.assertEqual(set(report), set(budgets.BUDGETS))
+        # 已知的 N+1 默认判为失败；这里显式容忍，并确认它仍被检测到
+        self.assertEqual(budgets.check(report, tolerate_known=True), [])
+        self.assertEqual(
+            {problem.split(':')[0].split('@')[0] for problem in budgets.check(report)},
+            set(budgets.KNOWN_REGRESSIONS),
+        )
+        self.assertEqual(
+            {name: bool(problems) for name, problems in budgets.known_regressions(report).items()},
+            {name: True for name in budgets.KNOWN_REGRESSIONS},
+        )
+        self.assertFalse(User.objects.exists())
+
+    def test_check_flags_queries_that_scale_with_rows(self):
+        report = {'account_status': {
+            '10': {'queries': 1, 'router_calls': 0},
+            '40': {'queries': 2, 'router_calls': 0},
+        }}
+        problems = budgets.check(report)
+        self.assertEqual(len(problems), 2)
+        self.assertIn('随行数增长', problems[1])
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """启动时不导入 requests、pydantic、ldap 等重依赖"""
+
+    def test_entrypoints_defer_heavy_imports(self):
+        report = startup.run_startup(['wsgi', 'celery'], repeat=1)
+        self.assertEqual({name: summary['forbidden'] for name, summary in report.items()},
+                         {'wsgi': {}, 'celery': {}})
+
+    def test_forbidden_import_reports_chain(self):
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       500 |        500 |     requests.models',
+            'import time:       100 |        600 |   requests',
+            'import time:        50 |        650 | sync_manager.routers',
+        ])
+        summary = startup.summarize(startup.parse_importtime(stderr), forbidden=['requests'])
+        self.assertEqual(summary['total_ms'], 0.7)
+        self.assertEqual(summary['forbidden'], {'requests': 'sync_manager.routers -> requests -> requests.models'})
+
+
+class MetricsTests(TestCase):
+    """路由器调用、同步任务与 /metrics 出口的指标"""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_deadline_hit_during_backoff_counts_as_timeout(self):
+        with FakeIKuaiServer(error_rate=1.0) as server:
+            client = IKuaiAPIClient(
+                server.base_url, server.username, server.password,
+                max_retries=3, deadline=Deadline(1), name='backoff-test',
+            )
+            before = self.sample('ikuai_timeouts_total', router='backoff-test', action='login')
+            with mock.patch('random.uniform', return_value=5), self.assertRaises(IKuaiTimeoutError):
+                client._post(client.LOGIN_URL, {}, 'login')
+        self.assertEqual(self.sample('ikuai_timeouts_total', router='backoff-test', action='login'), before + 1)
+        self.assertEqual(server.count('login'), 1)
+
+    def test_client_records_calls_pages_and_cache(self):
+        with FakeIKuaiServer(users=250) as server:
+            client = IKuaiAPIClient(server.base_url, server.username, server.password, name='metrics-test')
+            before_show = self.sample('ikuai_call_seconds_count', router='metrics-test', action='show', func_name='pppuser')
+            client.list_accounts()
+            client.list_accounts()
+
+        self.assertEqual(
+            self.sample('ikuai_call_seconds_count', router='metrics-test', action='show', func_name='pppuser') - before_show,
+            3,
+        )
+        self.assertEqual(self.sample('ikuai_logins_total', router='metrics-test', result='success'), 1)
+        self.assertEqual(self.sample('ikuai_list_accounts_pages_sum', router='metrics-test'), 3)
+        self.assertGreaterEqual(self.sample('cache_requests_total', cache='ikuai_list_accounts', result='hit'), 1)
+
+    def test_sync_records_phases_and_rows(self):
+        from sync_manager.tasks import sync_openvpn_accounts
+
+        before = self.sample('sync_rows_total', sync='router', entity='accounts', outcome='unchanged')
+        with FakeIKuaiServer(users=20) as server, router_settings(server):
+            benchmarks._seed_accounts(server)
+            sync_openvpn_accounts()
+            # 第二次同步时账号数据没有变化
+            sync_openvpn_accounts()
+        self.assertGreater(self.sample('sync_phase_seconds_count', sync='router', phase='reconcile'), 0)
+        self.assertGreaterEqual(
+            self.sample('sync_rows_total', sync='router', entity='accounts', outcome='unchanged') - before, 20,
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        with mock.patch('sync_manager.queues.get_queue_depths', return_value={'interactive': 3, 'bulk': 0}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'celery_queue_depth{queue="interactive"} 3.0', response.content)
+        self.assertIn(b'ikuai_call_seconds_bucket', response.content)
+
+    def test_metrics_endpoint_fails_closed_without_token(self):
+        with mock.patch('sync_manager.queues.get_queue_depths', return_value={}) as depths:
+            with override_settings(METRICS_TOKEN=''):
+                self.assertEqual(self.client.get('/metrics').status_code, 403)
+                depths.assert_not_called()
+            with override_settings(METRICS_TOKEN='', METRICS_ALLOW_ANONYMOUS=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@skipUnless(tracing.installed(), 'opentelemetry-sdk 未安装')
+class TracingTests(TestCase):
+    """视图 -> Celery 消息头 -> 任务 -> 路由器调用 的 span 链路"""
+
+    def setUp(self):
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        patcher = mock.patch.multiple(tracing, _tracer=provider.get_tracer('test'), _tracer_pid=os.getpid())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings_override = override_settings(TRACING={'enabled': True})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_task_span_continues_publisher_trace(self):
+        from sync_manager.tasks import create_openvpn_account
+
+        user = User.objects.create(username='carol')
+        OpenVPNAccount.objects.create(user=user, username='carol', password='pw', router='default')
+        with FakeIKuaiServer() as server, router_settings(server):
+            with tracing.span('view.create_account') as view_span:
+                headers = {}
+                tracing.inject_headers(headers)
+            create_openvpn_account.apply(
+                kwargs={'user_id': user.id, 'username': 'carol', 'password': 'pw'}, headers=headers,
+            )
+
+        spans = {span.name: span for span in self.exporter.get_finished_spans()}
+        task_span = spans['celery.task/sync_manager.tasks.create_openvpn_account']
+        self.assertEqual(task_span.parent.span_id, view_span.get_span_context().span_id)
+        self.assertIn('celery.queue_wait_seconds', task_span.attributes)
+        self.assertGreater(task_span.attributes['db.query_count'], 0)
+        self.assertEqual(spans['ikuai.add'].context.trace_id, task_span.context.trace_id)
+        self.assertEqual(spans['ikuai.add'].attributes['http.status_code'], 200)
+        self.assertIn('db.save_account', spans)
+
+
+class ProfilingTests(TestCase):
+    """后台开关控制的请求 / 任务采样"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(PROFILING={'dir': tmp.name, 'keep': 10})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(profiling.disable)
+
+    def test_sampled_request_is_saved_and_listed(self):
+        import time
+        from django.shortcuts import render
+
+        def slow_render(*args, **kwargs):
+            time.sleep(0.05)
+            return render(*args, **kwargs)
+
+        user = User.objects.create_user('dave', password='x')
+        self.client.force_login(user)
+        profiling.enable(1.0, ['sync_manager:dashboard'], duration_minutes=1, interval=0.001)
+        with mock.patch('sync_manager.views.render', slow_render):
+            self.client.get('/openvpn/')
+
+        [profile] = profiling.list_profiles()
+        self.assertEqual((profile['kind'], profile['target']), ('request', 'sync-manager-dashboard'))
+        folded = profiling.read_profile(profile['name'])
+        self.assertIn('slow_render', folded)
+        self.assertTrue(profiling.top_frames(folded))
+
+        # 只有超级管理员能查看
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/admin/profiling/').status_code, 403)
+        admin = User.objects.create_superuser('root', password='x')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/profiling/', {'name': profile['name']})
+        self.assertContains(response, 'slow_render')
+
+    def test_only_selected_tasks_are_sampled(self):
+        from sync_manager.tasks import sync_openvpn_accounts
+
+        with FakeIKuaiServer(users=5, latency=0.02) as server, router_settings(server):
+            profiling.enable(1.0, ['account.tasks.sync_ldap_users_task'], duration_minutes=1, interval=0.001)
+            sync_openvpn_accounts.apply()
+            self.assertEqual(profiling.list_profiles(), [])
+
+            profiling.enable(1.0, ['sync_manager.tasks.sync_openvpn_accounts'], duration_minutes=1, interval=0.001)
+            sync_openvpn_accounts.apply()
+        self.assertEqual([p['kind'] for p in profiling.list_profiles()], ['task'])
+
+    def test_enable_form_rejects_and_clamps_values(self):
+        import time
+
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        for bad in ({'sample_rate': 'abc'}, {'duration_minutes': 'nan'}, {'sample_rate': 'inf'}):
+            response = self.client.post('/admin/profiling/', {'action': 'enable', **bad})
+            self.assertEqual(response.status_code, 400)
+            self.assertIsNone(profiling.get_config(refresh=True))
+
+        self.client.post('/admin/profiling/', {'action': 'enable', 'sample_rate': '5', 'duration_minutes': '-3'})
+        config = profiling.get_config(refresh=True)
+        self.assertEqual(config['sample_rate'], 1.0)
+        self.assertAlmostEqual(config['expires_at'] - time.time(), 60, delta=5)
+
+
+class StaticAssetsTests(TestCase):
+    """首页静态资源外置、带哈希预压缩，HTML / JSON 响应 gzip"""
+
+    def test_dashboard_references_assets_and_is_gzipped(self):
+        import gzip
+
+        self.client.force_login(User.objects.create_user('erin', password='x'))
+        response = self.client.get('/openvpn/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        html = gzip.decompress(response.content).decode()
+        self.assertNotIn('<style>', html)
+        self.assertIn('/static/sync_manager/dashboard.css', html)
+        self.assertIn('/static/sync_manager/dashboard.js', html)
+        self.assertIn('data-status-url="/openvpn/status/"', html)
+
+        # 已经是 gzip 文件的导出不再压缩
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+        response = self.client.get('/api/v1/export/users.csv', {'gzip': '1'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_collected_assets_are_fingerprinted_and_precompressed(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        from django.core.management import call_command
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+        }
+        with override_settings(STATIC_ROOT=tmp.name, STORAGES=storages, DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+            url = staticfiles_storage.url('sync_manager/dashboard.js')
+            self.assertRegex(url, r'^/static/sync_manager/dashboard\.[0-9a-f]{12}\.js$')
+            name = url[len('/static/'):]
+            for suffix in ('.gz', '.br'):
+                self.assertTrue(os.path.exists(os.path.join(tmp.name, name + suffix)))
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+
+
+class HealthCheckTests(TestCase):
+    """/healthz、/readyz 与 LOGIN_EXEMPT_URLS"""
+
+    def setUp(self):
+        health._cached = (0.0, None)
+        self.addCleanup(setattr, health, '_cached', (0.0, None))
+        self.addCleanup(health._inflight.clear)
+
+    def test_healthz_skips_session_and_auth(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.json(), {'status': 'ok'})
+        self.assertNotIn('sessionid', response.cookies)
+
+    @override_settings(HEALTH_CHECKS={'timeout': 0.2, 'cache_seconds': 60, 'critical': ['database']},
+                       METRICS_TOKEN='secret')
+    def test_readyz_reports_each_dependency(self):
+        import time
+
+        probes = {
+            'database': lambda timeout: None,
+            'ldap': lambda timeout: 'disabled',
+            'ikuai': lambda timeout: time.sleep(1),
+        }
+        with mock.patch.object(health, 'PROBES', probes):
+            # 匿名请求只看到状态和耗时
+            response = self.client.get('/readyz')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({key for check in response.json()['checks'].values() for key in check}, {'ok', 'latency_ms'})
+
+            checks = self.client.get('/readyz', HTTP_AUTHORIZATION='Bearer secret').json()['checks']
+            self.assertTrue(checks['database']['ok'])
+            self.assertEqual(checks['ldap']['detail'], 'disabled')
+            self.assertIn('timed out', checks['ikuai']['error'])
+            self.assertFalse(checks['ikuai']['critical'])
+            # 缓存期内不重复探测
+            self.assertTrue(self.client.get('/readyz').json()['cached'])
+
+    @override_settings(HEALTH_CHECKS={'critical': ['database']}, METRICS_TOKEN='secret')
+    def test_readyz_fails_when_critical_dependency_is_down(self):
+        def down(timeout):
+            raise ConnectionError('refused db.internal:3306')
+
+        with mock.patch.object(health, 'PROBES', {'database': down}):
+            response = self.client.get('/readyz')
+            self.assertEqual(response.status_code, 503)
+            self.assertNotIn(b'db.internal', response.content)
+            response = self.client.get('/readyz', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('refused', response.json()['checks']['database']['error'])
+
+    @override_settings(HEALTH_CHECKS={'timeout': 5, 'cache_seconds': 0, 'critical': ['database']})
+    def test_stale_result_is_served_while_one_refresh_runs(self):
+        import threading
+
+        started, release = threading.Event(), threading.Event()
+
+        def hung(timeout):
+            started.set()
+            release.wait(5)
+
+        health._cached = (0.0, {'database': {'ok': True, 'latency_ms': 1.0}})
+        with mock.patch.object(health, 'PROBES', {'database': hung}):
+            refresher = threading.Thread(target=health.get_readiness)
+            refresher.start()
+            self.assertTrue(started.wait(5))
+            # 刷新进行中：其他请求不等待，直接返回上一次的结果
+            ready, report = health.get_readiness()
+            self.assertTrue(ready)
+            self.assertTrue(report['cached'])
+            # 同一依赖的探测还没结束时不再提交新的
+            self.assertEqual(health.run_probes()['database']['error'], 'previous probe still running')
+            release.set()
+            refresher.join(5)
+
+    @override_settings(LOGIN_EXEMPT_URLS=[r'^/openvpn/status/'])
+    def test_login_exempt_urls_are_honoured(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+
+        from config.middleware import LoginRequiredMiddleware
+        from sync_manager.views import account_status, openvpn_dashboard
+
+        middleware = LoginRequiredMiddleware(lambda request: None)
+        request = RequestFactory().get('/openvpn/status/')
+        request.user = AnonymousUser()
+        self.assertIsNone(middleware.process_view(request, account_status, (), {}))
+        request = RequestFactory().get('/openvpn/')
+        request.user = AnonymousUser()
+        self.assertEqual(middleware.process_view(request, openvpn_dashboard, (), {}).status_code, 302)
+
+
+class IdentityCacheTests(TestCase):
+    """request.user、部门与 VPN 账号的两级缓存及其失效"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        identity_cache._drop_local(identity_cache.ALL)
+        self.user = User.objects.create_user('erin', password='x')
+        self.account = OpenVPNAccount.objects.create(
+            user=self.user, username='erin', password='vpn-secret', status='creating',
+        )
+        self.client.force_login(self.user)
+
+    def test_warm_requests_skip_the_database(self):
+        self.client.get('/openvpn/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/openvpn/status/')
+        self.assertEqual(response.json()['status'], 'creating')
+
+        # L2 中的值是加密的
+        from django.core.cache import cache
+
+        token = cache.get(identity_cache._key(self.user.id))
+        self.assertNotIn(b'vpn-secret', token)
+
+    def test_l1_serves_copies_while_subscribed(self):
+        with mock.patch.object(identity_cache, '_ensure_listener', return_value=True):
+            first = identity_cache.get_user_bundle(self.user.id)
+            first.openvpn_account.status = 'changed'
+            with mock.patch.object(identity_cache.cache, 'get') as l2_get, self.assertNumQueries(0):
+                second = identity_cache.get_user_bundle(self.user.id)
+        l2_get.assert_not_called()
+        self.assertEqual(second.openvpn_account.status, 'creating')
+
+    def test_save_invalidates_and_broadcasts(self):
+        self.client.get('/openvpn/status/')
+        publisher = mock.Mock()
+        with mock.patch.object(identity_cache, '_get_publisher', return_value=publisher), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.account.status = 'active'
+            self.account.save()
+        self.assertEqual(self.client.get('/openvpn/status/').json()['status'], 'active')
+        publisher.publish.assert_called_with('identity:invalidate', json.dumps([self.user.id]))
+
+    def test_queryset_update_paths_invalidate(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from sync_manager.tasks import check_expired_accounts
+
+        OpenVPNAccount.objects.filter(pk=self.account.pk).update(
+            status='active', expires=timezone.now() - timedelta(days=1),
+        )
+        identity_cache.invalidate_user(self.user.id)
+        self.assertEqual(self.client.get('/openvpn/status/').json()['status'], 'active')
+        check_expired_accounts()
+        self.assertEqual(self.client.get('/openvpn/status/').json()['status'], 'expired')
+
+    def test_department_changes_invalidate_members(self):
+        from account.models import Department
+
+        division = Department.objects.create(id=10, name='华东区')
+        team = Department.objects.create(id=11, name='销售部', parent=division)
+        self.user.profile.department = team
+        self.user.profile.save()
+        identity_cache.get_user_bundle(self.user.id)
+
+        # 上级部门改名不影响缓存中的本部门，但移动后子树路径都要刷新
+        division = Department.objects.get(pk=10)
+        division.parent = Department.objects.create(id=1, name='总部')
+        with self.captureOnCommitCallbacks(execute=True):
+            division.save()
+        self.assertEqual(identity_cache.get_user_bundle(self.user.id).profile.department.path, '/1/10/11/')
+
+        team = Department.objects.get(pk=11)
+        team.name = '大客户部'
+        with self.captureOnCommitCallbacks(execute=True):
+            team.save()
+        self.assertEqual(identity_cache.get_user_bundle(self.user.id).profile.department.name, '大客户部')
+
+        # 没有变化的保存（LDAP 同步）不失效
+        with mock.patch.object(identity_cache, 'invalidate_users') as invalidate:
+            Department.objects.get(pk=11).save()
+        invalidate.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.get(pk=10).delete()
+        self.assertEqual(identity_cache.get_user_bundle(self.user.id).profile.department.parent_id, None)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get('/openvpn/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/openvpn/status/').status_code, 302)
@@ -12,4 +12,6 @@ urlpatterns = [
     path('download/', views.download_config, name='download_config'),
     path('renew/', views.renew_account, name='renew_account'),
     path('delete/', views.delete_account, name='delete_account'),
+    # 报表
+    path('api/department-usage/', views.department_usage, name='department_usage'),
 ]
@@ -0,0 +1,281 @@
+"""
+Per-department VPN usage rollups (DepartmentUsage).
+
+管理层需要按部门查看正常账号数、在线时长、流量包和即将过期的账号，每次现算要联查
+OpenVPNAccount、auth_user、user_profile、department 并聚合。这里把结果保存在汇总表中：
+
+- 增量：账号从数据库加载时记录状态（OpenVPNAccount.from_db），保存 / 删除时（信号）、
+  同步的 bulk_update 和 queryset.update（update()）之后，把前后差值按部门累加写入
+- 全量：rebuild() 一次查询取出所有账号，安装了 NumPy 时向量化聚合，否则逐行累加；
+  rebuild_department_usage 定时执行，校正随时间变化的「即将过期」和用户换部门带来的偏差
+"""
+
+import functools
+import importlib.util
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 影响汇总的账号字段
+STATE_FIELDS = ('status', 'enabled', 'expires', 'duration', 'packages')
+TRACKED_FIELDS = frozenset(STATE_FIELDS)
+
+# DepartmentUsage 中的汇总字段，顺序与 contribution() 一致
+FIELDS = ('accounts', 'active_accounts', 'online_seconds', 'packages', 'expiring_soon')
+
+# 加载时有字段被 defer，无法得知原值
+UNKNOWN = object()
+
+_ZERO = (0, 0, 0, 0, 0)
+
+
+def _config():
+    return {
+        'expiring_days': 7,
+        'vectorized': True,
+        **getattr(settings, 'DEPARTMENT_USAGE', {}),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_installed():
+    return importlib.util.find_spec('numpy') is not None
+
+
+def state(account):
+    """账号中影响汇总的字段值；不读取被 defer 的字段（避免额外查询），此时返回 UNKNOWN"""
+    values = account.__dict__
+    if any(name not in values for name in STATE_FIELDS):
+        return UNKNOWN
+    return tuple(values[name] for name in STATE_FIELDS)
+
+
+def contribution(account_state, now, window):
+    """一个账号对所在部门汇总的贡献；None 表示账号不存在"""
+    if account_state is None:
+        return _ZERO
+    status, enabled, expires, duration, packages = account_state
+    active = status == 'active' and enabled
+    expiring = active and expires is not None and now <= expires < now + window
+    return 1, int(active), duration or 0, packages or 0, int(expiring)
+
+
+class Changes:
+    """一批账号变更对部门汇总的影响，按 user_id 累加，apply() 一次写入"""
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+        self.window = timedelta(days=_config()['expiring_days'])
+        self.deltas = {}
+
+    def add(self, user_id, before, after):
+        """before / after 为 state() 的返回值，None 表示账号不存在"""
+        if before is UNKNOWN or after is UNKNOWN or before == after:
+            return
+        old = contribution(before, self.now, self.window)
+        new = contribution(after, self.now, self.window)
+        if old == new:
+            return
+        delta = self.deltas.setdefault(user_id, [0] * len(FIELDS))
+        for index, (a, b) in enumerate(zip(new, old)):
+            delta[index] += a - b
+
+    def saved(self, account, created=False, update_fields=None):
+        """账号已保存（或即将 bulk_update）：与加载时的状态比较"""
+        before = None if created else getattr(account, '_usage_state', UNKNOWN)
+        after = state(account)
+        if update_fields is not None and before not in (None, UNKNOWN) and after is not UNKNOWN:
+            # 只有 update_fields 中的字段写入了数据库
+            after = tuple(
+                new if name in update_fields else old
+                for name, old, new in zip(STATE_FIELDS, before, after)
+            )
+        self.add(account.user_id, before, after)
+        account._usage_state = after
+
+    def deleted(self, account):
+        self.add(account.user_id, getattr(account, '_usage_state', UNKNOWN), None)
+        account._usage_state = None
+
+    def apply(self):
+        """写入汇总表，返回涉及的部门数"""
+        if not self.deltas:
+            return 0
+        from account.models import UserProfile
+        from sync_manager.models import DepartmentUsage
+
+        departments = dict(
+            UserProfile.objects.filter(user_id__in=list(self.deltas)).values_list('user_id', 'department_id')
+        )
+        by_department = defaultdict(lambda: [0] * len(FIELDS))
+        for user_id, delta in self.deltas.items():
+            totals = by_department[departments.get(user_id)]
+            for index, value in enumerate(delta):
+                totals[index] += value
+
+        with transaction.atomic():
+            rows = _lock_rows(by_department)
+            for department_id, delta in by_department.items():
+                row = rows[department_id]
+                for name, value in zip(FIELDS, delta):
+                    setattr(row, name, getattr(row, name) + value)
+                row.updated_at = self.now
+            DepartmentUsage.objects.bulk_update(list(rows.values()), [*FIELDS, 'updated_at'])
+        self.deltas = {}
+        return len(by_department)
+
+
+def _lock_rows(department_ids):
+    """
+    在事务中锁定各部门的汇总行并返回 {department_id: row}，不存在的行先创建
+
+    并发事务可能同时创建同一行：插入时忽略唯一约束冲突，再重新加锁读取。
+    """
+    from sync_manager.models import DepartmentUsage
+
+    buckets = {DepartmentUsage.bucket_for(department_id): department_id for department_id in department_ids}
+    rows = {row.bucket: row for row in DepartmentUsage.objects.select_for_update().filter(bucket__in=list(buckets))}
+    missing = [bucket for bucket in buckets if bucket not in rows]
+    if missing:
+        DepartmentUsage.objects.bulk_create(
+            [DepartmentUsage(bucket=bucket, department_id=buckets[bucket]) for bucket in missing],
+            ignore_conflicts=True,
+        )
+        rows.update(
+            (row.bucket, row) for row in DepartmentUsage.objects.select_for_update().filter(bucket__in=missing)
+        )
+    return {buckets[bucket]: row for bucket, row in rows.items()}
+
+
+def update(queryset, **values):
+    """
+    queryset.update(**values)，并把变更计入部门汇总（queryset.update 不触发信号）
+
+    返回 (更新的行数, 涉及的 user_id 列表)。值为表达式（F、Case 等）时更新后再读一次新状态。
+    """
+    from sync_manager.models import OpenVPNAccount
+
+    # 读取原状态、更新和写入汇总在同一事务中，并锁定这些账号：期间的并发保存会等待，差值不会错位
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list('pk', 'user_id', *STATE_FIELDS))
+        count = OpenVPNAccount.objects.filter(pk__in=[row[0] for row in rows]).update(**values)
+        if any(hasattr(value, 'resolve_expression') for value in values.values()):
+            updated = OpenVPNAccount.objects.filter(pk__in=[row[0] for row in rows]).values_list('pk', *STATE_FIELDS)
+            after_by_pk = {pk: tuple(after) for pk, *after in updated}
+        else:
+            after_by_pk = {
+                pk: tuple(values.get(name, value) for name, value in zip(STATE_FIELDS, before))
+                for pk, user_id, *before in rows
+            }
+        changes = Changes()
+        for pk, user_id, *before in rows:
+            changes.add(user_id, tuple(before), after_by_pk.get(pk, tuple(before)))
+        changes.apply()
+    return count, [row[1] for row in rows]
+
+
+def _aggregate_python(rows, now, window):
+    totals = defaultdict(lambda: [0] * len(FIELDS))
+    for department_id, *account_state in rows:
+        row = totals[department_id]
+        for index, value in enumerate(contribution(account_state, now, window)):
+            row[index] += value
+    return totals
+
+
+def _aggregate_numpy(rows, now, window):
+    import numpy as np
+
+    missing = np.iinfo(np.int64).min
+    departments, status, enabled, expires, duration, packages = zip(*rows)
+    keys = np.array([missing if key is None else key for key in departments], dtype=np.int64)
+    groups, inverse = np.unique(keys, return_inverse=True)
+
+    active = (np.array(status) == 'active') & np.array(enabled, dtype=bool)
+    # 未设置过期时间为 NaN，与任何值比较都为 False
+    expires_at = np.array([np.nan if value is None else value.timestamp() for value in expires])
+    expiring = active & (expires_at >= now.timestamp()) & (expires_at < (now + window).timestamp())
+
+    columns = np.column_stack([
+        np.ones(len(rows), dtype=np.int64),
+        active,
+        np.array(duration, dtype=np.int64),
+        np.array(packages, dtype=np.int64),
+        expiring,
+    ]).astype(np.int64)
+    totals = np.zeros((len(groups), len(FIELDS)), dtype=np.int64)
+    np.add.at(totals, inverse, columns)
+    return {
+        (None if key == missing else int(key)): [int(value) for value in row]
+        for key, row in zip(groups.tolist(), totals)
+    }
+
+
+def rebuild(now=None, vectorized=None):
+    """全量重算汇总表，返回部门数"""
+    from sync_manager.models import DepartmentUsage, OpenVPNAccount
+
+    config = _config()
+    now = now or timezone.now()
+    window = timedelta(days=config['expiring_days'])
+    if vectorized is None:
+        vectorized = config['vectorized'] and numpy_installed()
+
+    with transaction.atomic():
+        # 先锁定已有的汇总行再读取账号，期间提交的增量 apply() 等待重算完成后再叠加
+        existing = list(DepartmentUsage.objects.select_for_update().values_list('pk', flat=True))
+        rows = list(OpenVPNAccount.objects.values_list('user__profile__department_id', *STATE_FIELDS))
+        aggregate = _aggregate_numpy if vectorized and rows else _aggregate_python
+        totals = aggregate(rows, now, window)
+
+        locked = _lock_rows(totals)
+        for department_id, values in totals.items():
+            row = locked[department_id]
+            for name, value in zip(FIELDS, values):
+                setattr(row, name, value)
+            row.updated_at = now
+        DepartmentUsage.objects.bulk_update(list(locked.values()), [*FIELDS, 'updated_at'])
+        DepartmentUsage.objects.filter(pk__in=existing).exclude(pk__in=[row.pk for row in locked.values()]).delete()
+    logger.info(f'Rebuilt department usage for {len(rows)} accounts in {len(totals)} departments')
+    return len(totals)
+
+
+def report():
+    """[{department_id, department, accounts, ...}]，按正常账号数降序"""
+    from sync_manager.models import DepartmentUsage
+
+    return [
+        {
+            'department_id': row.department_id,
+            'department': row.department.name if row.department else '未分配部门',
+            **{name: getattr(row, name) for name in FIELDS},
+            'updated_at': row.updated_at.isoformat(),
+        }
+        for row in DepartmentUsage.objects.select_related('department')
+    ]
+
+
+def connect_signals():
+    """单个账号保存 / 删除时增量更新（在 AppConfig.ready 中调用）"""
+    from django.db.models.signals import post_delete, post_save
+
+    from sync_manager.models import OpenVPNAccount
+
+    def account_saved(sender, instance, created, update_fields=None, **kwargs):
+        changes = Changes()
+        changes.saved(instance, created=created, update_fields=update_fields)
+        changes.apply()
+
+    def account_deleted(sender, instance, **kwargs):
+        changes = Changes()
+        changes.deleted(instance)
+        changes.apply()
+
+    post_save.connect(account_saved, sender=OpenVPNAccount, weak=False, dispatch_uid='department_usage_saved')
+    post_delete.connect(account_deleted, sender=OpenVPNAccount, weak=False, dispatch_uid='department_usage_deleted')
@@ -14,8 +14,11 @@ from django.conf import settings
 import json
 
 from account.models import UserProfile
+from config import tracing
 
+from . import usage
 from .models import OpenVPNAccount
+from .routers import choose_router
 from .tasks import create_openvpn_account, delete_openvpn_account
 
 
@@ -23,8 +26,9 @@ def openvpn_dashboard(request):
     """
     OpenVPN 账号管理首页
     """
+    # 身份缓存中已带有账号，稳态下不查数据库
     try:
-        account = OpenVPNAccount.objects.get(user=request.user)
+        account = request.user.openvpn_account
     except OpenVPNAccount.DoesNotExist:
         account = None
     
@@ -37,6 +41,7 @@ def openvpn_dashboard(request):
 
 
 @require_http_methods(["POST"])
+@tracing.traced('view.create_account')
 def create_account(request):
     """
     申请创建 OpenVPN 账号
@@ -77,12 +82,16 @@ def create_account(request):
         # 获取有效期（默认30天）
         expires_days = int(request.POST.get('expires_days', 30))
         
+        # 选择承载该账号的路由器
+        router = choose_router(request.user)
+        
         # 创建本地账号记录
         account = OpenVPNAccount.objects.create(
             user=request.user,
             username=username,
             password=password,
             status='creating',
+            router=router,
         )
         
         # 异步创建 iKuai 账号
@@ -91,6 +100,7 @@ def create_account(request):
             username=username,
             password=password,
             expires_days=expires_days,
+            router=router,
         )
         
         account.task_id = task.id
@@ -115,7 +125,7 @@ def account_status(request):
     获取账号状态（用于AJAX轮询）
     """
     try:
-        account = OpenVPNAccount.objects.get(user=request.user)
+        account = request.user.openvpn_account
         
         data = {
             'success': True,
@@ -145,7 +155,7 @@ def download_config(request):
     下载 OpenVPN 配置文件
     """
     try:
-        account = OpenVPNAccount.objects.get(user=request.user)
+        account = request.user.openvpn_account
         
         # 检查账号是否可用
         if not account.is_active():
@@ -233,6 +243,7 @@ def renew_account(request):
 
 @login_required
 @require_http_methods(["POST"])
+@tracing.traced('view.delete_account')
 def delete_account(request):
     """
     删除账号（异步执行）
@@ -280,3 +291,22 @@ def delete_account(request):
             'success': False,
             'message': f'删除失败: {str(e)}'
         }, status=500)
+
+
+@require_http_methods(["GET"])
+def department_usage(request):
+    """
+    部门使用情况报表（仅管理员），直接读取汇总表
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'success': False,
+            'message': '无权限'
+        }, status=403)
+    
+    departments = usage.report()
+    return JsonResponse({
+        'success': True,
+        'departments': departments,
+        'totals': {name: sum(row[name] for row in departments) for name in usage.FIELDS},
+    })